@@ -0,0 +1,120 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.utils.six.moves.urllib.parse import urlencode
+
+from rest_framework.response import Response
+
+
+def get_version(key):
+    """
+    Version stored under a cache key. Versions are random instead of counted,
+    a version evicted from the cache is replaced by a new one so entries
+    cached under the lost version are never taken for current again
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """
+    Replace the version stored under a cache key, with one write and no read
+    """
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def cache_version_key(name):
+    """
+    Cache key of the version of a named group of cached responses
+    """
+    return 'cache-version:%s' % name
+
+
+def cache_version(name):
+    """
+    Current version of a named group of cached responses
+    """
+    return get_version(cache_version_key(name))
+
+
+def bump_cache_version(name):
+    """
+    Invalidate a named group of cached responses
+    """
+    bump_version(cache_version_key(name))
+
+
+def list_cache_key(name, request):
+    """
+    Cache key of a list response by host, path and query parameters in a
+    normalized order, so the same page asked for differently shares an entry
+    """
+    params = sorted((key, sorted(values)) for key, values in request.GET.lists())
+    url = '%s%s?%s' % (request.get_host(), request.path, urlencode(params, doseq=True))
+    return 'list:%s:%s' % (name, hashlib.md5(url.encode('utf-8')).hexdigest())
+
+
+class CachedListMixin(object):
+    """
+    Mixin for viewsets with the same list for every caller to cache the list
+    responses, invalidated by bumping the cache version of list_cache_name.
+    Only one request rebuilds a missing or outdated page, meanwhile others are
+    served the outdated page or wait for the rebuilt one
+    """
+    list_cache_name = None
+    list_cache_timeout = 300
+    list_cache_lock_timeout = 10
+    list_cache_wait = 2.0
+
+    def list(self, request, *args, **kwargs):
+        key = list_cache_key(self.list_cache_name, request)
+        version = cache_version(self.list_cache_name)
+
+        cached = cache.get(key)
+        if cached is not None and cached['version'] == version:
+            return self.cached_response(cached, 'HIT')
+
+        lock = key + ':lock'
+        locked = cache.add(lock, 1, self.list_cache_lock_timeout)
+        if not locked:
+            if cached is not None:
+                return self.cached_response(cached, 'STALE')
+
+            # nothing to serve yet, wait for the request that holds the lock
+            deadline = time.time() + self.list_cache_wait
+            while time.time() < deadline:
+                time.sleep(0.05)
+                cached = cache.get(key)
+                if cached is not None and cached['version'] == version:
+                    return self.cached_response(cached, 'HIT')
+
+        try:
+            response = super(CachedListMixin, self).list(request, *args, **kwargs)
+            if response.status_code == 200:
+                # plain copies, serializer results hold on to their serializer
+                data = list(response.data) if isinstance(response.data, list) else OrderedDict(response.data)
+                cache.set(key, {
+                    'version': version,
+                    'data': data,
+                    'headers': [(name, value) for name, value in response.items() if name != 'Content-Type'],
+                }, self.list_cache_timeout)
+        finally:
+            if locked:
+                cache.delete(lock)
+
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def cached_response(self, cached, status):
+        """
+        Response of a cached list page
+        """
+        response = Response(cached['data'], headers=dict(cached['headers']))
+        response['X-Cache'] = status
+        return response
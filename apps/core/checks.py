@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core import checks
+
+# cache backends keeping their entries in the memory of each process
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', )
+
+
+@checks.register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cached counts, lists and calendars are invalidated by writes in any web or
+    worker process, which only works when they all use the same cache
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            'The default cache is local to each process, invalidations are not seen by other workers.',
+            hint='Configure a cache shared by all processes in CACHES, e.g. memcached.',
+            id='core.E001',
+        )]
+    return []
@@ -0,0 +1,20 @@
+from rest_framework import serializers
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key related field that looks objects up in a dict of objects by id
+    put in the serializer context under the field name, so validating a list
+    of items doesn't cost a query per item
+    """
+    def to_internal_value(self, data):
+        objects = self.context.get(self.field_name)
+        if objects is None:
+            return super(PrefetchedPrimaryKeyRelatedField, self).to_internal_value(data)
+
+        try:
+            return objects[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
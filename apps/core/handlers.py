@@ -0,0 +1,114 @@
+import os
+import threading
+from logging.handlers import TimedRotatingFileHandler
+
+from django.utils.six.moves import queue
+
+# sentinel put on the queue to tell the writer thread to stop
+STOP = object()
+
+
+class QueuedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Timed rotating file handler that hands records to a background writer
+    thread so the request thread never waits on the disk. Records are
+    written and flushed in batches, when the queue is full records are
+    either dropped and counted (policy 'drop') or the caller waits ('block')
+    """
+    def __init__(self, filename, queue_size=10000, policy='drop', batch_size=100, **kwargs):
+        TimedRotatingFileHandler.__init__(self, filename, **kwargs)
+        self.queue = queue.Queue(maxsize=int(queue_size))
+        self.policy = policy
+        self.batch_size = int(batch_size)
+        self.dropped = 0
+        self.written = 0
+        self._stats_lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        self._buffering = False
+
+    def _start_writer(self):
+        """
+        Start the writer thread, again after a fork as threads do not survive it
+        """
+        with self._stats_lock:
+            if self._writer is not None and self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._write, name='log-writer')
+            self._writer.daemon = True
+            self._writer.start()
+
+    def handle(self, record):
+        """
+        Filter and queue the record without taking the handler lock, the
+        writer thread holds it while writing a batch to the file
+        """
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        """
+        Queue the record for the writer thread
+        """
+        if self._writer is None or self._writer_pid != os.getpid():
+            self._start_writer()
+
+        try:
+            if self.policy == 'block':
+                self.queue.put(record)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+
+    def flush(self):
+        """
+        Flushing is done once per batch by the writer thread
+        """
+        if not self._buffering:
+            TimedRotatingFileHandler.flush(self)
+
+    def _write(self):
+        """
+        Writer thread loop, drain the queue in batches and flush once per batch
+        """
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = STOP in batch
+            self.acquire()
+            try:
+                self._buffering = True
+                for record in batch:
+                    if record is not STOP:
+                        TimedRotatingFileHandler.emit(self, record)
+            finally:
+                self._buffering = False
+                self.release()
+            self.flush()
+
+            with self._stats_lock:
+                self.written += len(batch) - stop
+
+            if stop:
+                return
+
+    def close(self):
+        """
+        Write out any queued records before closing the file
+        """
+        writer = self._writer
+        if writer is not None and writer.is_alive() and self._writer_pid == os.getpid():
+            self.queue.put(STOP)
+            writer.join(5)
+        self._writer = None
+        TimedRotatingFileHandler.close(self)
@@ -1,7 +1,37 @@
 import logging
+import random
 
+from django.conf import settings
+from django.db import connection
 from django.utils.timezone import now
 
+from rest_framework.response import Response
+
+from .monitoring import registry
+from .profiling import start_profile, save_profile
+
+# default response body capture and profiling policy, overridden by API_LOGGING in settings
+LOGGING_DEFAULTS = {
+    'RESPONSE_SAMPLE_RATE': 0.01,
+    'RESPONSE_MAX_LENGTH': 2048,
+    'SLOW_REQUEST_MS': 1000,
+    'PROFILE_SAMPLE_RATE': 0,
+    'PROFILE_HEADER': 'HTTP_X_PROFILE',
+    'PROFILE_DIR': 'logs/profiles',
+    'PROFILE_MAX_FILES': 50,
+    'PROFILE_TOP': 30,
+}
+
+# route label of requests that weren't routed by url name, e.g. called directly
+UNRESOLVED_ROUTE = 'unresolved'
+
+
+def logging_setting(name):
+    """
+    Get an API_LOGGING setting falling back to the defaults
+    """
+    return getattr(settings, 'API_LOGGING', {}).get(name, LOGGING_DEFAULTS[name])
+
 
 class LogEntry(object):
     """
@@ -16,12 +46,33 @@ class LoggingMixin(object):
     """
     logging_exclude = None
 
+    def dispatch(self, request, *args, **kwargs):
+        # count the request, restore query recording and stop profiling even when
+        # the view raises an unhandled exception
+        timestamp = now()
+        force_debug_cursor = connection.force_debug_cursor
+        response = None
+        try:
+            response = super(LoggingMixin, self).dispatch(request, *args, **kwargs)
+            return response
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+            profiler = getattr(getattr(getattr(self, 'request', None), 'log', None), 'profiler', None)
+            if profiler:
+                profiler.disable()
+
+            # labelled by url name, paths would make a series per object id
+            resolver_match = getattr(request, 'resolver_match', None)
+            route = resolver_match.view_name if resolver_match else UNRESOLVED_ROUTE
+            status = response.status_code if response is not None else 500
+            registry.observe(route, request.method, status, (now() - timestamp).total_seconds())
+
     def initial(self, request, *args, **kwargs):
         ip = request.META.get('HTTP_X_FORWARDED_FOR') or request.META.get('REMOTE_ADDR')
-        data = request.data if type(request.data).__name__ == 'dict' else request.data.dict()
+        data = request.data.dict() if hasattr(request.data, 'dict') else request.data
 
         # exclusion of fields in log data e.g passwords
-        if self.logging_exclude:
+        if self.logging_exclude and isinstance(data, dict):
             for key in self.logging_exclude:
                 data.pop(key, None)
 
@@ -33,17 +84,33 @@ class LoggingMixin(object):
         self.request.log.params = request.query_params.dict()
         self.request.log.data = data
         self.request.log.timestamp = now()
+        self.request.log.sampled = random.random() < logging_setting('RESPONSE_SAMPLE_RATE')
+
+        # record executed queries without DEBUG until dispatch returns, the log is reset on every request
+        self.request.log.queries_start = len(connection.queries_log)
+        connection.force_debug_cursor = True
 
         super(LoggingMixin, self).initial(request, *args, **kwargs)
 
+        # profile the rest of the request when asked by staff or sampled
+        if ((request.META.get(logging_setting('PROFILE_HEADER')) and request.user.is_staff) or
+           random.random() < logging_setting('PROFILE_SAMPLE_RATE')):
+            self.request.log.profiler = start_profile()
+
     def finalize_response(self, request, response, *args, **kwargs):
         """
         Return the response and send log information to log handler
         """
+        profiler = getattr(self.request.log, 'profiler', None)
+        if profiler:
+            profiler.disable()
+
         response = super(LoggingMixin, self).finalize_response(request, response, *args, **kwargs)
+        response_time = int((now() - self.request.log.timestamp).total_seconds() * 1000)
+        queries = self.query_details()
 
         details = {
-            'response_time': int((now() - self.request.log.timestamp).total_seconds() * 1000),
+            'response_time': response_time,
             'stamp': self.request.log.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'),
             'user': request.user,
             'ip': self.request.log.ip,
@@ -52,8 +119,50 @@ class LoggingMixin(object):
             'params': self.request.log.params,
             'status_code': response.status_code,
             'data': self.request.log.data,
-            'response': response.rendered_content,
+            'response': self.capture_response(response, response_time),
         }
+        details.update(queries)
         self.request.log.logger.info('', extra=details)
 
+        if profiler:
+            response['X-Profile'] = save_profile(
+                profiler,
+                self.request.log.method,
+                self.request.log.path,
+                logging_setting('PROFILE_DIR'),
+                logging_setting('PROFILE_MAX_FILES'),
+                logging_setting('PROFILE_TOP'),
+            )
+
         return response
+
+    def query_details(self):
+        """
+        Return the number of queries, total database time and slowest statement of the request
+        """
+        queries = list(connection.queries_log)[self.request.log.queries_start:]
+
+        slowest = max(queries, key=lambda query: float(query['time'])) if queries else {'sql': '', 'time': 0}
+
+        return {
+            'queries': len(queries),
+            'db_time': int(sum(float(query['time']) for query in queries) * 1000),
+            'slowest_query': slowest['sql'],
+            'slowest_query_time': int(float(slowest['time']) * 1000),
+        }
+
+    def capture_response(self, response, response_time):
+        """
+        Return the (truncated) response body for sampled, failed and slow requests only,
+        the decision is made before the body is touched so other requests pay nothing
+        """
+        capture = (self.request.log.sampled or
+                   response.status_code >= 400 or
+                   response_time >= logging_setting('SLOW_REQUEST_MS'))
+
+        if not capture or not isinstance(response, Response):
+            return ''
+
+        # render once here, the handler won't render the response again
+        response.render()
+        return response.content[:logging_setting('RESPONSE_MAX_LENGTH')]
@@ -0,0 +1,183 @@
+import gc
+import re
+from glob import glob
+from os.path import basename
+
+import numpy
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import resolve, Resolver404
+
+# request fields of the gymmate_log format: time stamp, method and path, first
+# digit of the status code and response time. The query count and database
+# time that follow the response time are not needed here
+LOG_LINE = re.compile(br'^\[([^\]]+)\] \S+ \S+ ([A-Z]+ \S+) [^\n]*? (\d)\d\d (\d+)ms', re.M)
+
+# log files are read and matched in chunks instead of line by line
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# numeric path segments e.g object ids
+NUMBERS = re.compile(r'(?<=/)\d+(?=/|$)')
+
+
+def read_chunks(filename, size=CHUNK_SIZE):
+    """
+    Read a file in chunks of whole lines
+    """
+    remainder = b''
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            end = chunk.rfind(b'\n') + 1
+            remainder = chunk[end:]
+            yield chunk[:end]
+    if remainder:
+        yield remainder
+
+
+class Command(BaseCommand):
+    help = 'Report per endpoint latency percentiles, request counts and error rates from the request logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', action='append', dest='files',
+                            help='Log file to read, defaults to the request log and its rotated files')
+        parser.add_argument('--since', help='Only include requests at or after this time e.g 2016-03-01 or '
+                                            '"2016-03-01 12:00"')
+        parser.add_argument('--until', help='Only include requests before this time')
+        parser.add_argument('--sort', default='p99', choices=['count', 'p50', 'p95', 'p99', 'errors'])
+
+    def handle(self, *args, **options):
+        since = options['since'].encode() if options['since'] else None
+        until = options['until'].encode() if options['until'] else None
+        files = options['files'] or self.log_files(options['since'], options['until'])
+
+        if not files:
+            raise CommandError('No log files found')
+
+        self.routes = {}
+        self.requests = {}
+        self.keys = {}
+        latencies = {}
+
+        # millions of short lived tuples are created while matching, the
+        # cyclic garbage collector only slows that down
+        gc.disable()
+        try:
+            for filename in files:
+                for chunk in read_chunks(filename):
+                    matches = LOG_LINE.findall(chunk)
+                    if matches:
+                        self.collect(latencies, since, until, *zip(*matches))
+        finally:
+            gc.enable()
+
+        names = dict((key_id, key) for key, key_id in self.keys.items())
+        rows = []
+        for key, (times, client_errors, server_errors) in latencies.items():
+            times = numpy.concatenate(times)
+            count = len(times)
+            p50, p95, p99 = numpy.percentile(times, [50, 95, 99])
+            method, route = names[key]
+            rows.append({
+                'method': method,
+                'route': route,
+                'count': count,
+                'p50': p50,
+                'p95': p95,
+                'p99': p99,
+                'client_errors': 100.0 * client_errors / count,
+                'errors': 100.0 * server_errors / count,
+            })
+
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        line = '{method:<8} {route:<40} {count:>9} {p50:>8} {p95:>8} {p99:>8} {client_errors:>7} {errors:>7}'
+        self.stdout.write(line.format(method='METHOD', route='ROUTE', count='COUNT', p50='P50', p95='P95',
+                                      p99='P99', client_errors='4XX%', errors='5XX%'))
+
+        line = ('{method:<8} {route:<40} {count:>9} {p50:>6.0f}ms {p95:>6.0f}ms {p99:>6.0f}ms '
+                '{client_errors:>7.2f} {errors:>7.2f}')
+        for row in rows:
+            self.stdout.write(line.format(**row))
+
+    def log_files(self, since=None, until=None):
+        """
+        Current request log file and the rotated files within the time window
+        """
+        try:
+            filename = settings.LOGGING['handlers']['request']['filename']
+        except KeyError:
+            return []
+
+        files = []
+        for name in sorted(glob(filename + '*')):
+            # rotated files are suffixed with the day they hold
+            day = basename(name)[len(basename(filename)) + 1:]
+            if day and ((since and day < since[:10]) or (until and day >= until)):
+                continue
+            files.append(name)
+
+        return files
+
+    def collect(self, latencies, since, until, stamps, requests, statuses, times):
+        """
+        Add the latencies and error counts of a chunk of matched lines per (method, route)
+        """
+        stamps = numpy.array(stamps)
+        selected = numpy.ones(len(stamps), dtype=bool)
+        if since:
+            selected &= stamps >= since
+        if until:
+            selected &= stamps < until
+
+        keys = self.key_ids(numpy.array(requests)[selected])
+        statuses = numpy.array(statuses, dtype='S1')[selected]
+        times = numpy.fromstring(b' '.join(times), dtype=numpy.int32, sep=' ')[selected]
+
+        client_errors = numpy.bincount(keys, weights=statuses == b'4')
+        server_errors = numpy.bincount(keys, weights=statuses == b'5')
+
+        # split the chunk's latencies by key
+        order = numpy.argsort(keys, kind='mergesort')
+        bounds = numpy.flatnonzero(numpy.diff(keys[order])) + 1
+
+        for part in numpy.split(order, bounds):
+            if len(part):
+                key = keys[part[0]]
+                entry = latencies.setdefault(key, [[], 0, 0])
+                entry[0].append(times[part])
+                entry[1] += client_errors[key]
+                entry[2] += server_errors[key]
+
+    def key_ids(self, requests):
+        """
+        Map each "method path" to the id of its (method, route pattern) pair,
+        routes are resolved once per distinct path in the chunk
+        """
+        unique, index = numpy.unique(requests, return_inverse=True)
+
+        ids = []
+        for request in unique:
+            if request not in self.requests:
+                method, path = request.decode('utf-8', 'replace').split(' ', 1)
+                key = (method, self.route(path))
+                self.requests[request] = self.keys.setdefault(key, len(self.keys))
+            ids.append(self.requests[request])
+
+        return numpy.array(ids, dtype=numpy.int64)[index]
+
+    def route(self, path):
+        """
+        Route pattern name for a path, ids are replaced so details share an entry
+        """
+        path = NUMBERS.sub('0', path)
+        if path not in self.routes:
+            try:
+                self.routes[path] = resolve(path).view_name
+            except Resolver404:
+                self.routes[path] = path
+        return self.routes[path]
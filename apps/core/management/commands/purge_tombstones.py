@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Forget deletions older than the sync retention'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Purged %d tombstones' % Tombstone.objects.purge())
@@ -1,4 +1,10 @@
+import datetime
+
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from .caching import bump_version
 
 
 class TimeStampedModel(models.Model):
@@ -11,3 +17,87 @@ class TimeStampedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+# how long deletions are remembered, clients that synced longer ago sync in full
+TOMBSTONE_RETENTION = datetime.timedelta(days=90)
+
+
+class TombstoneManager(models.Manager):
+    """
+    Custom Tombstone manager
+    """
+    def record(self, instance, user_id):
+        """
+        Remember the deletion of a user's row
+        """
+        if user_id is not None:
+            self.create(user_id=user_id, model=instance._meta.label_lower, object_id=instance.pk)
+
+    def record_many(self, model, object_ids, user_id):
+        """
+        Remember the deletion of rows of a user deleted without signals, with one insert
+        """
+        self.bulk_create([Tombstone(user_id=user_id, model=model._meta.label_lower, object_id=object_id)
+                          for object_id in object_ids])
+
+    def purge(self, now=None):
+        """
+        Forget deletions older than the retention
+        """
+        return self.filter(date_deleted__lt=(now or timezone.now()) - TOMBSTONE_RETENTION).delete()[0]
+
+
+class Tombstone(models.Model):
+    """
+    Deleted row of a user, so syncing clients learn about deletions
+    """
+    user_id = models.IntegerField()
+    model = models.CharField(max_length=100)
+    object_id = models.IntegerField()
+    date_deleted = models.DateTimeField(auto_now_add=True)
+
+    objects = TombstoneManager()
+
+    class Meta:
+        index_together = [('user_id', 'date_deleted')]
+
+    def __str__(self):
+        return ('%s %s' % (self.model, self.object_id))
+
+
+def count_version_key(model, user_id):
+    """
+    Cache key of the version of a user's cached list counts of a model
+    """
+    return 'count-version:%s:%s' % (model._meta.db_table, user_id)
+
+
+def bump_count_version(model, user_id):
+    """
+    Invalidate a user's cached list counts of a model, for writes that don't
+    send signals such as bulk_create and update
+    """
+    bump_version(count_version_key(model, user_id))
+
+
+def invalidate_counts(sender, **kwargs):
+    """
+    Post save/delete hook to invalidate the cached list counts of the row's user
+    """
+    bump_count_version(sender, kwargs['instance'].user_id)
+
+
+# models whose list counts are cached, see cache_counts
+COUNTED_MODELS = set()
+
+
+def cache_counts(*models):
+    """
+    Cache the list counts of models with a user per user, until one of the
+    user's rows is saved or deleted
+    """
+    for model in models:
+        COUNTED_MODELS.add(model)
+        post_save.connect(invalidate_counts, sender=model)
+        post_delete.connect(invalidate_counts, sender=model)
@@ -0,0 +1,241 @@
+import errno
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from glob import glob
+from os.path import join
+
+from django.conf import settings
+
+# upper bounds in seconds of the request duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# process id and start time in milliseconds of a worker file
+WORKER_FILE = re.compile(r'^(\d+)-(\d+)\.json$')
+
+
+def monitoring_setting(name, default=None):
+    """
+    Get an API_METRICS setting
+    """
+    return getattr(settings, 'API_METRICS', {}).get(name, default)
+
+
+def process_alive(pid):
+    """
+    Whether a process with the id runs on this machine
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+class Registry(object):
+    """
+    In-process request counters and duration histograms keyed by route,
+    written to a file per process every FLUSH_INTERVAL seconds by a daemon
+    thread so the scrape endpoint can add up the numbers of every worker
+    without requests waiting on the file. Files are named by process id
+    and start time so a reused process id never takes over the numbers
+    of a dead worker
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Start counting from zero in the current process
+        """
+        self.pid = os.getpid()
+        self.started = int(time.time() * 1000)
+        self.requests = {}
+        self.durations = {}
+        self.overhead = [0.0, 0]
+        # threads don't survive a fork, a forked worker starts its own
+        self.flusher = None
+
+    def check_fork(self):
+        """
+        Count from zero in a forked worker, called with the lock held
+        """
+        if self.pid != os.getpid():
+            self.reset()
+
+    def start_flusher(self):
+        """
+        Start the thread writing this process' file when there is a metrics
+        directory, called with the lock held
+        """
+        if self.flusher is None and monitoring_setting('DIRECTORY'):
+            self.flusher = threading.Thread(target=self.run_flusher, name='metrics-flusher')
+            self.flusher.daemon = True
+            self.flusher.start()
+
+    def run_flusher(self):
+        """
+        Write this process' file every FLUSH_INTERVAL seconds
+        """
+        while True:
+            time.sleep(monitoring_setting('FLUSH_INTERVAL', 5))
+            try:
+                self.flush()
+            except Exception:
+                # a full disk or a removed directory must not stop later flushes
+                pass
+
+    def observe(self, route, method, status, seconds):
+        """
+        Count a request and add its duration to the histogram
+        """
+        start = time.time()
+
+        with self.lock:
+            self.check_fork()
+            self.start_flusher()
+
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            key = (route, method)
+            if key not in self.durations:
+                self.durations[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+            histogram = self.durations[key]
+            histogram[0][bisect_left(BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+
+            # time spent by the registry itself
+            self.overhead[0] += time.time() - start
+            self.overhead[1] += 1
+
+    def snapshot(self):
+        """
+        Plain copy of this process' numbers
+        """
+        with self.lock:
+            snapshot = {
+                'requests': [list(key) + [count] for key, count in self.requests.items()],
+                'durations': [list(key) + [list(buckets), total] for key, (buckets, total) in self.durations.items()],
+                'overhead': list(self.overhead),
+            }
+
+        # records dropped by queued request log handlers
+        dropped = 0
+        for handler in logging.getLogger('apps.core.loggers').handlers:
+            dropped += getattr(handler, 'dropped', 0)
+        snapshot['log_dropped'] = dropped
+
+        return snapshot
+
+    def flush(self):
+        """
+        Write this process' numbers to its file in the metrics directory
+        """
+        directory = monitoring_setting('DIRECTORY')
+        if not directory:
+            return
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with self.lock:
+            self.check_fork()
+        filename = join(directory, '%d-%d.json' % (self.pid, self.started))
+        temporary = '%s.%d.tmp' % (filename, threading.current_thread().ident)
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.rename(temporary, filename)
+
+    def collect(self):
+        """
+        Numbers of all processes, from the metrics directory when there is one
+        """
+        directory = monitoring_setting('DIRECTORY')
+        if not directory:
+            return [self.snapshot()]
+
+        self.flush()
+        snapshots = []
+        for filename in glob(join(directory, '*.json')):
+            match = WORKER_FILE.match(os.path.basename(filename))
+            if not match:
+                continue
+
+            # remove the files of dead workers, including ones with our process id
+            pid, started = int(match.group(1)), int(match.group(2))
+            if (pid, started) != (self.pid, self.started) and (pid == self.pid or not process_alive(pid)):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+                continue
+
+            try:
+                with open(filename) as f:
+                    snapshots.append(json.load(f))
+            except (IOError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """
+        Text exposition format of the added up numbers of all processes
+        """
+        requests = {}
+        durations = {}
+        overhead = [0.0, 0]
+        dropped = 0
+
+        for snapshot in self.collect():
+            for route, method, status, count in snapshot['requests']:
+                key = (route, method, str(status))
+                requests[key] = requests.get(key, 0) + count
+            for route, method, buckets, total in snapshot['durations']:
+                histogram = durations.setdefault((route, method), [[0] * (len(BUCKETS) + 1), 0.0])
+                histogram[0] = [a + b for a, b in zip(histogram[0], buckets)]
+                histogram[1] += total
+            overhead[0] += snapshot['overhead'][0]
+            overhead[1] += snapshot['overhead'][1]
+            dropped += snapshot.get('log_dropped', 0)
+
+        lines = [
+            '# HELP gymmate_requests_total Total API requests.',
+            '# TYPE gymmate_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append('gymmate_requests_total{route="%s",method="%s",status="%s"} %d' % (
+                route, method, status, count))
+
+        lines.extend([
+            '# HELP gymmate_request_duration_seconds API request duration.',
+            '# TYPE gymmate_request_duration_seconds histogram',
+        ])
+        for (route, method), (buckets, total) in sorted(durations.items()):
+            labels = 'route="%s",method="%s"' % (route, method)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append('gymmate_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, cumulative))
+            lines.append('gymmate_request_duration_seconds_sum{%s} %f' % (labels, total))
+            lines.append('gymmate_request_duration_seconds_count{%s} %d' % (labels, cumulative))
+
+        lines.extend([
+            '# HELP gymmate_metrics_overhead_seconds Time spent recording request metrics.',
+            '# TYPE gymmate_metrics_overhead_seconds summary',
+            'gymmate_metrics_overhead_seconds_sum %f' % overhead[0],
+            'gymmate_metrics_overhead_seconds_count %d' % overhead[1],
+            '# HELP gymmate_log_records_dropped_total Request log records dropped by a full queue.',
+            '# TYPE gymmate_log_records_dropped_total counter',
+            'gymmate_log_records_dropped_total %d' % dropped,
+        ])
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -1,5 +1,154 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import md5
+
+from django.core.cache import cache
+from django.core.paginator import Paginator, Page, EmptyPage, PageNotAnInteger
+from django.db import connections
+from django.db.models import Q
+from django.utils.encoding import force_bytes, force_text
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .caching import get_version
+from .models import count_version_key, COUNTED_MODELS
+
+
+def link_header(next_url, previous_url):
+    """
+    Link header value for the next and previous page urls
+    """
+    links = []
+    if next_url is not None:
+        links.append('<{0}>; rel="next"'.format(next_url))
+    if previous_url is not None:
+        links.append('<{0}>; rel="prev"'.format(previous_url))
+    return ', '.join(links)
+
+
+def estimate_count(queryset):
+    """
+    Number of rows the database planner expects the queryset to return,
+    None when the database can't tell
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return int(plan[0]['Plan']['Plan Rows'])
+
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            row = dict(zip(columns, cursor.fetchone()))
+            return int((row['rows'] or 0) * float(row.get('filtered') or 100) / 100)
+
+    return None
+
+
+class EstimatedPage(Page):
+    """
+    Page of a paginator with an estimated count, whether there is a next
+    page is known from fetching one row more than the page size
+    """
+    def __init__(self, object_list, number, paginator):
+        super(EstimatedPage, self).__init__(object_list[:paginator.per_page], number, paginator)
+        self.more = len(object_list) > paginator.per_page
+
+    def has_next(self):
+        return self.more
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator with a cheaper total count: exact up to a threshold, estimated by
+    the database planner above it and, for models registered with cache_counts,
+    cached per query until the rows of the requesting user are written to
+    """
+    exact_threshold = 1000
+    estimate = True
+    cache_timeout = 60
+
+    count_type = 'exact'
+
+    def __init__(self, object_list, per_page, user_id=None, **kwargs):
+        super(CountingPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.user_id = user_id
+
+    def _get_count(self):
+        if self._count is None:
+            self._count, self.count_type = self.get_count()
+        return self._count
+    count = property(_get_count)
+
+    def get_count(self):
+        """
+        Total count and whether it is exact or estimated
+        """
+        key = self.cache_key()
+        if key:
+            count = cache.get(key)
+            if count is not None:
+                return count, 'exact'
+
+        # ordering doesn't change the count and counting is stopped after the threshold
+        queryset = self.object_list.order_by()
+        count = queryset[:self.exact_threshold + 1].count()
+        if count > self.exact_threshold:
+            estimate = estimate_count(queryset) if self.estimate else None
+            if estimate is not None:
+                return max(estimate, count), 'estimate'
+            count = queryset.count()
+
+        if key:
+            cache.set(key, count, self.cache_timeout)
+        return count, 'exact'
+
+    def cache_key(self):
+        """
+        Cache key of the count for the query (user and filters) and the version
+        of the user's rows, lists of counted models only hold the requesting user's
+        """
+        if not self.cache_timeout or self.user_id is None or not hasattr(self.object_list, 'query'):
+            return None
+
+        model = self.object_list.model
+        if model not in COUNTED_MODELS:
+            return None
+        version = get_version(count_version_key(model, self.user_id))
+        query = md5(force_bytes(repr(self.object_list.query.sql_with_params()))).hexdigest()
+        return 'count:%s:%s:%s:%s' % (model._meta.db_table, self.user_id, version, query)
+
+    def validate_number(self, number):
+        """
+        Pages past an estimated count may still exist
+        """
+        if not self.count or self.count_type == 'exact':
+            return super(CountingPaginator, self).validate_number(number)
+
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_type == 'exact':
+            return super(CountingPaginator, self).page(number)
+
+        bottom = (number - 1) * self.per_page
+        return EstimatedPage(list(self.object_list[bottom:bottom + self.per_page + 1]), number, self)
 
 
 class LinkHeaderPagination(PageNumberPagination):
@@ -9,22 +158,21 @@ class LinkHeaderPagination(PageNumberPagination):
     """
     page_size_query_param = 'per_page'
 
-    def get_paginated_response(self, data):
-        next_url = self.get_next_link()
-        previous_url = self.get_previous_link()
-
-        if next_url is not None and previous_url is not None:
-            link = '<{next_url}>; rel="next", <{previous_url}>; rel="prev"'
-        elif next_url is not None:
-            link = '<{next_url}>; rel="next"'
-        elif previous_url is not None:
-            link = '<{previous_url}>; rel="prev"'
-        else:
-            link = ''
+    def paginate_queryset(self, queryset, request, view=None):
+        # counts are cached per user
+        self.user_id = request.user.pk
+        return super(LinkHeaderPagination, self).paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountingPaginator(object_list, per_page, user_id=self.user_id)
 
-        link = link.format(next_url=next_url, previous_url=previous_url)
+    def get_paginated_response(self, data):
+        link = link_header(self.get_next_link(), self.get_previous_link())
         headers = {'Link': link} if link else {}
-        headers.update({'X-Total-Count': self.page.paginator.count})
+        headers.update({
+            'X-Total-Count': self.page.paginator.count,
+            'X-Total-Count-Type': self.page.paginator.count_type,
+        })
 
         return Response(data, headers=headers)
 
@@ -34,3 +182,127 @@ class LargerLinkHeaderPagination(LinkHeaderPagination):
     Same as above just for a larger page size of 100
     """
     page_size = 100
+
+
+class KeysetLinkHeaderPagination(BasePagination):
+    """
+    Cursor pagination on the view's keyset_ordering e.g (date, id) with Links
+    in the header. Pages are found by comparing against the last seen row
+    instead of an offset and nothing is counted, so any page depth costs the same
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'per_page'
+    max_page_size = 100
+    ordering = ('id', )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse, values = cursor if cursor else (False, None)
+
+        queryset = queryset.order_by(*[('-' if reverse else '') + field for field in self.ordering])
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.results = results
+        return results
+
+    def get_paginated_response(self, data):
+        link = link_header(self.get_next_link(), self.get_previous_link())
+        headers = {'Link': link} if link else {}
+
+        return Response(data, headers=headers)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.results:
+            return None
+        return self.encode_cursor(self.results[0], True)
+
+    def keyset_filter(self, values, reverse):
+        """
+        Rows after (or before when reversed) the cursor values in keyset order e.g
+        date > d OR (date = d AND id > i)
+        """
+        lookup = '__lt' if reverse else '__gt'
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            equal = dict(zip(self.ordering[:i], values[:i]))
+            equal[field + lookup] = values[i]
+            condition |= Q(**equal)
+        return condition
+
+    def encode_cursor(self, instance, reverse):
+        """
+        Url with the cursor pointing at the instance
+        """
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+
+        cursor = urlsafe_b64encode(force_bytes(json.dumps({'r': int(reverse), 'v': values})))
+        return replace_query_param(self.base_url, self.cursor_query_param, force_text(cursor))
+
+    def decode_cursor(self, request, model):
+        """
+        Direction and ordering field values of the requested cursor, None for the first page
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(force_text(urlsafe_b64decode(force_bytes(encoded))))
+            values = [model._meta.get_field(field).to_python(value)
+                      for field, value in zip(self.ordering, cursor['v'])]
+            if len(values) != len(self.ordering):
+                raise ValueError
+        except Exception:
+            raise NotFound('Invalid cursor')
+
+        return bool(cursor['r']), values
+
+
+class KeysetPaginationMixin(object):
+    """
+    Opt-in keyset pagination for a viewset, used when the client sends the cursor
+    parameter (empty for the first page) so clients can move over gradually
+    """
+    keyset_pagination_class = KeysetLinkHeaderPagination
+    keyset_ordering = ('id', )
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator') and
+           self.keyset_pagination_class.cursor_query_param in self.request.query_params):
+            self._paginator = self.keyset_pagination_class()
+        return super(KeysetPaginationMixin, self).paginator
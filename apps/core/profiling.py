@@ -0,0 +1,48 @@
+import cProfile
+import os
+import pstats
+import re
+from glob import glob
+from os.path import join, splitext
+
+from django.utils.six import StringIO
+from django.utils.timezone import now
+
+# characters not allowed in profile file names
+UNSAFE = re.compile(r'[^\w-]+')
+
+
+def save_profile(profiler, method, path, directory, max_files=50, top=30):
+    """
+    Write the profile stats and a summary of the top functions by cumulative time,
+    returning the profile file name. The oldest profiles are removed past max_files
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    name = '{0}-{1}-{2}'.format(now().strftime('%Y%m%d%H%M%S%f'), method, UNSAFE.sub('_', path).strip('_'))
+    filename = join(directory, name + '.prof')
+    profiler.dump_stats(filename)
+
+    summary = StringIO()
+    pstats.Stats(filename, stream=summary).sort_stats('cumulative').print_stats(top)
+    with open(join(directory, name + '.txt'), 'w') as f:
+        f.write(summary.getvalue())
+
+    # names start with the time stamp so they sort oldest first
+    profiles = sorted(glob(join(directory, '*.prof')))
+    for old in profiles[:max(len(profiles) - max_files, 0)]:
+        for filename in (old, splitext(old)[0] + '.txt'):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    return name + '.prof'
+
+
+def start_profile():
+    """
+    Start profiling the current thread
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
@@ -0,0 +1,14 @@
+from django.utils.encoding import force_bytes
+
+from rest_framework.renderers import BaseRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    """
+    Render response data as plain text e.g for monitoring scrapes
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return force_bytes(data, self.charset)
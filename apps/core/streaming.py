@@ -0,0 +1,59 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.encoding import force_str
+
+
+class Echo(object):
+    """
+    File-like object that returns what is written instead of keeping it, so a
+    csv writer's rows can be streamed
+    """
+    def write(self, value):
+        return value
+
+
+def chunked(queryset, chunk_size=1000):
+    """
+    Yield lists of rows of a values queryset in id order, each chunk is a separate
+    query starting after the last id of the previous chunk so nothing is held in memory
+    """
+    last_id = None
+    while True:
+        chunk = queryset.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        chunk = list(chunk[:chunk_size])
+
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]['id']
+
+
+def ndjson_response(rows, filename):
+    """
+    Stream rows as newline delimited json
+    """
+    lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="{0}.ndjson"'.format(filename)
+    return response
+
+
+def csv_response(rows, fields, filename):
+    """
+    Stream rows as csv with a header of the given fields
+    """
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(['' if row[field] is None else force_str(row[field]) for field in fields])
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="{0}.csv"'.format(filename)
+    return response
@@ -1,19 +1,95 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 from datetime import timedelta
+from os.path import join, exists
 
+from django.utils.six import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
 
 from oauth2_provider.models import AccessToken, get_application_model
 
 from ..accounts.models import AccountUser
 from ..metrics.models import Metric, MetricType, MetricTypeGroup
 
+from .caching import bump_version, get_version
+from .checks import check_shared_cache
+from .handlers import QueuedTimedRotatingFileHandler
+from .loggers import LoggingMixin
+from .models import count_version_key
+from .monitoring import Registry, registry
+
 # Return the Application model that is active in this project.
 # http://bit.do/bKFJB
 Application = get_application_model()
 
 
+class CaptureStatements(CaptureQueriesContext):
+    """
+    Capture the sql and parameters of executed queries, the captured queries
+    of some backends only hold a description that can't be run again
+    """
+    def __enter__(self):
+        self.statements = []
+        last_executed_query = self.connection.ops.last_executed_query
+
+        def capture(cursor, sql, params):
+            self.statements.append((sql, params))
+            return last_executed_query(cursor, sql, params)
+
+        self.connection.ops.last_executed_query = capture
+        return super(CaptureStatements, self).__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        del self.connection.ops.last_executed_query
+        super(CaptureStatements, self).__exit__(exc_type, exc_value, traceback)
+
+
+def query_plan_problems(sql, params, table):
+    """
+    Full scans of a table and sorts that aren't served by an index in the
+    query plan of a statement
+    """
+    problems = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            for row in cursor.fetchall():
+                if re.match(r'SCAN (TABLE )?%s\b' % table, row[-1]) or 'TEMP B-TREE FOR ORDER BY' in row[-1]:
+                    problems.append(row[-1])
+        elif connection.vendor == 'postgresql':
+            # tiny test tables are cheaper to scan, only a missing index should force it
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            for (line, ) in cursor.fetchall():
+                if 'Seq Scan on %s' % table in line or line.strip().lstrip('-> ').startswith('Sort '):
+                    problems.append(line.strip())
+        elif connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            for row in cursor.fetchall():
+                row = dict(zip(columns, row))
+                if row['table'] == table and (row['type'] == 'ALL' or 'filesort' in (row['Extra'] or '')):
+                    problems.append('%s %s' % (row['type'], row['Extra']))
+    return problems
+
+
 class BaseTestCase(APITestCase):
     """
     Base Test Case extends APITestCase for authentication in other tests
@@ -26,6 +102,8 @@ class BaseTestCase(APITestCase):
         """
         Set up user for authentication to run tests
         """
+        cache.clear()
+
         app_owner = AccountUser.objects.create_user(
             username=self.user_admin,
             email='admin@test.com',
@@ -69,6 +147,21 @@ class BaseTestCase(APITestCase):
 
         return self.user
 
+    def assertIndexed(self, url, table, data=None):
+        """
+        Assert the queries a GET request runs on a table neither scan the whole table nor sort without an index
+        """
+        with CaptureStatements(connection) as context:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+
+        source = 'FROM %s' % connection.ops.quote_name(table)
+        statements = [(sql, params) for sql, params in context.statements if source in sql]
+        self.assertTrue(statements)
+        for sql, params in statements:
+            problems = query_plan_problems(sql, params, table)
+            self.assertEqual(problems, [], '%s\n%s' % (sql, '\n'.join(problems)))
+
 
 class MetricsTestCase(BaseTestCase):
     """
@@ -82,3 +175,433 @@ class MetricsTestCase(BaseTestCase):
         self.group = MetricTypeGroup.objects.create(name='test_group')
         self.type = MetricType.objects.create(name='test_type', unit='test', group=self.group)
         self.metric = Metric.objects.create(user=self.user, metric_type=self.type, value='1')
+
+
+class QueuedHandlerTest(SimpleTestCase):
+    """
+    Request log records are written by a background thread
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = join(self.directory, 'test.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_handler(self, **kwargs):
+        handler = QueuedTimedRotatingFileHandler(self.filename, when='midnight', **kwargs)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        return handler
+
+    def record(self, message):
+        return logging.LogRecord('test', logging.INFO, __file__, 0, message, None, None)
+
+    def test_records_written(self):
+        """
+        Ensure queued records are written to file once the handler is closed
+        """
+        handler = self.create_handler()
+        for i in range(5):
+            handler.handle(self.record('line %d' % i))
+        handler.close()
+
+        with open(self.filename) as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual(lines, ['line %d' % i for i in range(5)])
+        self.assertEqual(handler.written, 5)
+        self.assertEqual(handler.dropped, 0)
+
+    def test_drop_policy(self):
+        """
+        Records are dropped and counted when the queue is full
+        """
+        handler = self.create_handler(queue_size=1, batch_size=1)
+
+        # hold the handler lock so the writer thread can't drain the queue
+        handler.acquire()
+        for i in range(5):
+            handler.handle(self.record('line %d' % i))
+        handler.release()
+        handler.close()
+
+        with open(self.filename) as f:
+            lines = f.read().splitlines()
+
+        self.assertTrue(handler.dropped >= 3)
+        self.assertEqual(len(lines), 5 - handler.dropped)
+
+    def test_handle_while_writing(self):
+        """
+        Records are queued without waiting for a batch being written by another thread
+        """
+        handler = self.create_handler()
+        writing, done = threading.Event(), threading.Event()
+
+        def write():
+            # hold the handler lock like the writer thread does while writing a batch
+            handler.acquire()
+            writing.set()
+            done.wait(5)
+            handler.release()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        writing.wait(5)
+        started = time.time()
+        handler.handle(self.record('line'))
+        elapsed = time.time() - started
+        done.set()
+        writer.join()
+        handler.close()
+
+        self.assertTrue(elapsed < 1)
+        with open(self.filename) as f:
+            self.assertEqual(f.read().splitlines(), ['line'])
+
+
+class ListHandler(logging.Handler):
+    """
+    Keep emitted log records in memory for inspection
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class BrokenView(LoggingMixin, APIView):
+    """
+    View failing with an unhandled exception
+    """
+    permission_classes = ()
+
+    def get(self, request):
+        raise RuntimeError('broken')
+
+
+class LoggingMixinTest(BaseTestCase):
+    """
+    Request log records produced by the logging mixin
+    """
+    def setUp(self):
+        super(LoggingMixinTest, self).setUp()
+        self.handler = ListHandler()
+        self.logger = logging.getLogger('apps.core.loggers')
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(logging.NOTSET)
+
+    @override_settings(API_LOGGING={'RESPONSE_SAMPLE_RATE': 0})
+    def test_unsampled_response_not_captured(self):
+        """
+        Successful requests outside the sample do not log the response body
+        """
+        self.authenticate(self.user_basic)
+        self.client.get(reverse('v1:dayofweek-list'))
+
+        self.assertEqual(self.handler.records[-1].response, '')
+
+    @override_settings(API_LOGGING={'RESPONSE_SAMPLE_RATE': 0, 'RESPONSE_MAX_LENGTH': 10})
+    def test_error_response_captured(self):
+        """
+        Error responses are always captured and truncated
+        """
+        self.authenticate(self.user_basic)
+        response = self.client.get(reverse('v1:dayofweek-detail', args=(1,)))
+        record = self.handler.records[-1]
+
+        self.assertEqual(record.status_code, 404)
+        self.assertEqual(record.response, response.content[:10])
+
+    def test_query_details(self):
+        """
+        Number of queries and database time are recorded without DEBUG
+        """
+        self.authenticate(self.user_basic)
+        self.client.get(reverse('v1:dayofweek-list'))
+        record = self.handler.records[-1]
+
+        self.assertTrue(record.queries > 0)
+        self.assertTrue(record.db_time >= 0)
+        self.assertIn('SELECT', record.slowest_query)
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_unhandled_exception(self):
+        """
+        Query recording is switched off again when the view raises
+        """
+        request = APIRequestFactory().get('/broken/')
+
+        with self.assertRaises(RuntimeError):
+            BrokenView.as_view()(request)
+
+        self.assertFalse(connection.force_debug_cursor)
+
+
+class LogStatsTest(SimpleTestCase):
+    """
+    Per endpoint statistics from request log files
+    """
+    lines = [
+        "[2016-03-01 10:00:00.000000] user 127.0.0.1 GET /v1/progress/ {} 200 10ms 3q 1ms {}",
+        "[2016-03-01 10:00:01.000000] user 127.0.0.1 GET /v1/progress/ {u'page': u'2'} 200 30ms 3q 1ms {}",
+        "[2016-03-01 10:00:02.000000] user 127.0.0.1 GET /v1/progress/12/ {} 404 5ms 2q 1ms {}",
+        "[2016-03-01 10:00:03.000000] user 127.0.0.1 GET /v1/progress/13/ {} 200 7ms 2q 1ms {}",
+        "[2016-03-02 10:00:00.000000] user 127.0.0.1 POST /v1/progress/ {} 500 100ms {u'date': u'x'}",
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = join(self.directory, 'gymmate.log')
+        with open(self.filename, 'w') as f:
+            f.write('\n'.join(self.lines) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def logstats(self, *args):
+        out = StringIO()
+        call_command('logstats', '--file', self.filename, *args, stdout=out)
+        return [line.split() for line in out.getvalue().splitlines()[1:]]
+
+    def test_routes(self):
+        """
+        Requests are grouped by method and route pattern
+        """
+        rows = dict(((row[0], row[1]), row) for row in self.logstats())
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[('GET', 'v1:progress-list')][2], '2')
+        self.assertEqual(rows[('GET', 'v1:progress-detail')][2], '2')
+        self.assertEqual(rows[('GET', 'v1:progress-detail')][6], '50.00')
+        self.assertEqual(rows[('POST', 'v1:progress-list')][7], '100.00')
+
+    def test_time_window(self):
+        """
+        Only requests within the time window are counted
+        """
+        rows = self.logstats('--since', '2016-03-01 10:00:01', '--until', '2016-03-02')
+
+        self.assertEqual(sum(int(row[2]) for row in rows), 3)
+
+
+class MonitoringTest(BaseTestCase):
+    """
+    Request counters and duration histograms
+    """
+    def setUp(self):
+        super(MonitoringTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_render(self):
+        """
+        Numbers of every worker file are added up in the exposition format
+        """
+        with override_settings(API_METRICS={'DIRECTORY': self.directory}):
+            worker = Registry()
+            worker.observe('v1:progress-list', 'GET', 200, 0.02)
+            worker.flush()
+
+            # pretend the file was written by another worker process that is still running
+            os.rename(join(self.directory, '%d-%d.json' % (worker.pid, worker.started)),
+                      join(self.directory, '%d-1.json' % os.getppid()))
+
+            registry = Registry()
+            registry.observe('v1:progress-list', 'GET', 200, 0.2)
+            text = registry.render()
+
+        self.assertIn('gymmate_requests_total{route="v1:progress-list",method="GET",status="200"} 2', text)
+        self.assertIn('gymmate_request_duration_seconds_bucket{route="v1:progress-list",method="GET",le="0.025"} 1',
+                      text)
+        self.assertIn('gymmate_request_duration_seconds_count{route="v1:progress-list",method="GET"} 2', text)
+
+    def test_dead_workers(self):
+        """
+        Files of exited workers and of an earlier process with the same id are removed
+        """
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+
+        with override_settings(API_METRICS={'DIRECTORY': self.directory}):
+            worker = Registry()
+            worker.observe('v1:progress-list', 'GET', 200, 0.02)
+            worker.flush()
+            os.rename(join(self.directory, '%d-%d.json' % (worker.pid, worker.started)),
+                      join(self.directory, '%d-1.json' % exited.pid))
+
+            reused = Registry()
+            reused.observe('v1:progress-list', 'GET', 200, 0.02)
+            reused.flush()
+            os.rename(join(self.directory, '%d-%d.json' % (reused.pid, reused.started)),
+                      join(self.directory, '%d-1.json' % os.getpid()))
+
+            registry = Registry()
+            registry.observe('v1:progress-list', 'GET', 500, 0.2)
+            text = registry.render()
+
+        self.assertNotIn('status="200"', text)
+        self.assertIn('gymmate_requests_total{route="v1:progress-list",method="GET",status="500"} 1', text)
+        self.assertEqual(os.listdir(self.directory), ['%d-%d.json' % (registry.pid, registry.started)])
+
+    def test_overhead(self):
+        """
+        Recording a request stays in the microsecond range
+        """
+        registry = Registry()
+        start = time.time()
+        for i in range(10000):
+            registry.observe('v1:progress-list', 'GET', 200, 0.02)
+
+        self.assertTrue((time.time() - start) / 10000 < 0.0001)
+
+    def test_metrics_view(self):
+        """
+        Scrape endpoint is only available to staff users
+        """
+        self.authenticate(self.user_basic)
+        self.client.get(reverse('v1:dayofweek-list'))
+        forbidden = self.client.get(reverse('metrics_view'))
+
+        self.authenticate(self.user_admin)
+        response = self.client.get(reverse('metrics_view'))
+
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'route="v1:dayofweek-list",method="GET",status="200"', response.content)
+
+    def test_unhandled_exception(self):
+        """
+        Requests failing with an unhandled exception are counted as server errors
+        """
+        with self.assertRaises(RuntimeError):
+            BrokenView.as_view()(APIRequestFactory().get('/broken/'))
+
+        self.assertIn('gymmate_requests_total{route="unresolved",method="GET",status="500"}', registry.render())
+
+    def test_background_flush(self):
+        """
+        Worker files are written by a background thread, not by the requests
+        """
+        with override_settings(API_METRICS={'DIRECTORY': self.directory, 'FLUSH_INTERVAL': 0.05}):
+            registry = Registry()
+            registry.observe('v1:progress-list', 'GET', 200, 0.02)
+            filename = join(self.directory, '%d-%d.json' % (registry.pid, registry.started))
+            written = exists(filename)
+
+            deadline = time.time() + 5
+            while not exists(filename) and time.time() < deadline:
+                time.sleep(0.01)
+
+        self.assertFalse(written)
+        self.assertTrue(registry.flusher.daemon)
+        self.assertTrue(exists(filename))
+
+
+class ProfilingTest(BaseTestCase):
+    """
+    On demand profiling of requests
+    """
+    def setUp(self):
+        super(ProfilingTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_staff_profile(self):
+        """
+        Staff users can profile a request with the profile header
+        """
+        self.authenticate(self.user_admin)
+        with override_settings(API_LOGGING={'PROFILE_DIR': self.directory}):
+            response = self.client.get(reverse('v1:dayofweek-list'), HTTP_X_PROFILE='1')
+
+        self.assertTrue(exists(join(self.directory, response['X-Profile'])))
+        self.assertTrue(exists(join(self.directory, response['X-Profile'].replace('.prof', '.txt'))))
+
+    def test_non_staff_profile(self):
+        """
+        The profile header is ignored for non-staff users
+        """
+        self.authenticate(self.user_basic)
+        with override_settings(API_LOGGING={'PROFILE_DIR': self.directory}):
+            response = self.client.get(reverse('v1:dayofweek-list'), HTTP_X_PROFILE='1')
+
+        self.assertFalse(response.has_header('X-Profile'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_retained_profiles(self):
+        """
+        Only the newest profiles are kept
+        """
+        self.authenticate(self.user_admin)
+        with override_settings(API_LOGGING={'PROFILE_DIR': self.directory, 'PROFILE_MAX_FILES': 2}):
+            for i in range(3):
+                self.client.get(reverse('v1:dayofweek-list'), HTTP_X_PROFILE='1')
+
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+    def test_unhandled_exception(self):
+        """
+        Profiling stops when the view raises
+        """
+        request = APIRequestFactory().get('/broken/', HTTP_X_PROFILE='1')
+        force_authenticate(request, AccountUser.objects.get(username=self.user_admin))
+
+        with self.assertRaises(RuntimeError):
+            BrokenView.as_view()(request)
+
+        self.assertIsNone(sys.getprofile())
+
+
+class CountCacheTest(BaseTestCase):
+    """
+    Invalidation of cached list counts
+    """
+    def test_counted_models(self):
+        """
+        Only writes to models with cached counts bump their count version
+        """
+        group = MetricTypeGroup.objects.create(name='body')
+        metric_type = MetricType.objects.create(name='weight', unit='kg', group=group)
+        user = AccountUser.objects.get(username=self.user_basic)
+        Metric.objects.create(user=user, metric_type=metric_type, value=80)
+
+        self.assertIsNone(cache.get(count_version_key(MetricType, user.pk)))
+        self.assertIsNotNone(cache.get(count_version_key(Metric, user.pk)))
+
+    def test_evicted_version(self):
+        """
+        A version lost to eviction is replaced by one no earlier version matches
+        """
+        key = count_version_key(Metric, 1)
+        versions = [get_version(key)]
+        bump_version(key)
+        versions.append(get_version(key))
+        cache.delete(key)
+
+        self.assertEqual(get_version(key), get_version(key))
+        self.assertNotIn(get_version(key), versions)
+        self.assertNotEqual(versions[0], versions[1])
+
+    def test_shared_cache(self):
+        """
+        A cache local to each process is reported
+        """
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+                              'LOCATION': '127.0.0.1:11211'}}
+
+        with override_settings(CACHES=locmem):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['core.E001'])
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
@@ -0,0 +1,32 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .monitoring import registry
+from .renderers import PlainTextRenderer
+
+
+class ExpandMixin(object):
+    """
+    Mixin for viewsets to embed related objects inline when asked for with
+    the expand query parameter, e.g. ?expand=sets,exercises
+    """
+    expand_param = 'expand'
+
+    def expanded(self, name):
+        """
+        Whether the related objects of name were asked to be embedded
+        """
+        return name in self.request.query_params.get(self.expand_param, '').split(',')
+
+
+class MetricsView(APIView):
+    """
+    Request counters and duration histograms of all workers in the
+    Prometheus text exposition format, staff only
+    """
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PlainTextRenderer]
+
+    def get(self, request, *args, **kwargs):
+        return Response(registry.render(), content_type='text/plain; version=0.0.4')
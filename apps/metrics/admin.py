@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Metric, MetricType, MetricTypeGroup
+from .models import Metric, MetricType, MetricTypeGroup, MetricRollup
 
 
 class MetricAdmin(admin.ModelAdmin):
@@ -8,3 +8,4 @@ class MetricAdmin(admin.ModelAdmin):
 admin.site.register(MetricTypeGroup, MetricAdmin)
 admin.site.register(MetricType, MetricAdmin)
 admin.site.register(Metric, MetricAdmin)
+admin.site.register(MetricRollup, MetricAdmin)
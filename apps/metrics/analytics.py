@@ -0,0 +1,132 @@
+import datetime
+from calendar import timegm
+from operator import itemgetter
+
+import numpy
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.six.moves import map
+
+from .models import MetricRollup
+from .rollups import aggregate_rows, fold, bucket_start, next_bucket, day_start, ROLLUP_FIELDS
+
+BUCKETS = ('day', 'week', 'month')
+
+MODES = ('buckets', 'lttb')
+
+
+def series_rows(rows):
+    """
+    Chart rows of bucket aggregates
+    """
+    return [{
+        'bucket': row['start'],
+        'min': row['min'],
+        'max': row['max'],
+        'avg': round(row['sum'] / row['count'], 3),
+        'last': row['last'],
+        'count': row['count'],
+    } for row in rows]
+
+
+def bucket_rows(queryset, bucket='day'):
+    """
+    Minimum, maximum, average, last value and count of the metrics of a
+    queryset per local day, week (monday) or month. Days and months are
+    grouped in SQL, weeks are folded from days
+    """
+    return series_rows(fold(aggregate_rows(queryset, 'month' if bucket == 'month' else 'day'), bucket))
+
+
+def rollup_bucket_rows(queryset, user_id, metric_type_id, bucket='day', min_date=None, max_date=None, today=None):
+    """
+    Same as bucket_rows for the metrics of a user and metric type, read from
+    the day or week rollups for closed buckets within the date range and
+    aggregated from the metrics only for the open bucket, the buckets the
+    range cuts and closed buckets newer than the rollups. Months are folded
+    from days
+    """
+    period = 'week' if bucket == 'week' else 'day'
+    today = today or timezone.localtime(timezone.now()).date()
+
+    first = None
+    if min_date is not None:
+        first = bucket_start(timezone.localtime(min_date).date(), period)
+        if day_start(first) != min_date:
+            first = next_bucket(first, period)
+    end = bucket_start(today, period)
+    if max_date is not None:
+        end = min(end, bucket_start(timezone.localtime(max_date).date(), period))
+    if first is not None and first >= end:
+        return bucket_rows(queryset, bucket)
+
+    rollups = MetricRollup.objects.filter(user_id=user_id, metric_type_id=metric_type_id, period=period,
+                                          start__lt=end)
+    if first is not None:
+        rollups = rollups.filter(start__gte=first)
+    rollups = list(rollups)
+
+    # closed buckets past the newest rollup, before the rollups are built or while
+    # the update tasks are behind, are aggregated from their metrics too
+    behind = next_bucket(rollups[-1].start, period) if rollups else first
+    latest = queryset.filter(date__lt=day_start(end)).order_by('-date').values_list('date', flat=True).first()
+    if latest is not None and (behind is None or timezone.localtime(latest).date() >= behind):
+        if behind is None:
+            return bucket_rows(queryset, bucket)
+        end = behind
+
+    metrics = Q(date__gte=day_start(end))
+    if first is not None:
+        metrics |= Q(date__lt=day_start(first))
+
+    rows = aggregate_rows(queryset.filter(metrics))
+    rows.extend(dict(((field, getattr(rollup, field)) for field in ROLLUP_FIELDS), start=rollup.start)
+                for rollup in rollups)
+    return series_rows(fold(rows, bucket))
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of at most threshold points of a series that keep its visual shape
+    by largest triangle three buckets: the first and last points and, per bucket
+    of the points between, the one forming the largest triangle with the point
+    picked before it and the average of the next bucket. Bucket averages and
+    triangle areas are computed with array operations, only the pick of each
+    bucket depends on the one before
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return numpy.arange(count)
+
+    # threshold - 2 buckets of the points between the first and last
+    edges = numpy.linspace(1, count - 1, threshold - 1).astype(numpy.int64)
+    sizes = numpy.diff(edges)
+    mean_x = numpy.add.reduceat(x[:count - 1], edges[:-1]) / sizes
+    mean_y = numpy.add.reduceat(y[:count - 1], edges[:-1]) / sizes
+    # the third point of each bucket's triangles, the last point for the last bucket
+    next_x = numpy.append(mean_x[1:], x[-1])
+    next_y = numpy.append(mean_y[1:], y[-1])
+
+    picked = numpy.empty(threshold, numpy.int64)
+    picked[0], picked[-1] = 0, count - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = numpy.abs((x[a] - next_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y[i] - y[a]))
+        a = start + int(areas.argmax())
+        picked[i + 1] = a
+    return picked
+
+
+def lttb_points(queryset, threshold):
+    """
+    At most threshold metrics of a queryset picked by lttb as date and value points
+    """
+    rows = list(queryset.order_by('date', 'id').values_list('date', 'value'))
+    count = len(rows)
+    x = numpy.fromiter(map(timegm, map(datetime.datetime.utctimetuple, map(itemgetter(0), rows))),
+                       numpy.float64, count)
+    y = numpy.fromiter(map(itemgetter(1), rows), numpy.float64, count)
+
+    return [{'date': rows[index][0], 'value': rows[index][1]} for index in lttb(x, y, threshold).tolist()]
@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild metric rollups that are off from the metrics, e.g. to fill them in the first time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only check the rollups of the last days')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days']:
+            since = timezone.localtime(timezone.now()).date() - datetime.timedelta(days=options['days'])
+        self.stdout.write('Fixed %d rollups' % reconcile_rollups(since))
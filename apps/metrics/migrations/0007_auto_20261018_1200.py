@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_auto_20160311_1525'),
+        ('metrics', '0006_auto_20160118_2054'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='metric',
+            index_together=set([('user', 'date'), ('user', 'metric_type', 'date')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_auto_20160311_1525'),
+        ('metrics', '0007_auto_20261018_1200'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metric',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterIndexTogether(
+            name='metric',
+            index_together=set([('user', 'date'), ('user', 'metric_type', 'date'), ('user', 'date_updated')]),
+        ),
+    ]
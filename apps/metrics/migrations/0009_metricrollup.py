@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.4 on 2026-10-18 15:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_auto_20160311_1525'),
+        ('metrics', '0008_auto_20261018_1300'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[(b'day', b'Day'), (b'week', b'Week')], max_length=4)),
+                ('start', models.DateField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('sum', models.FloatField()),
+                ('count', models.IntegerField()),
+                ('last', models.FloatField()),
+                ('last_date', models.DateTimeField()),
+                ('metric_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='metrics.MetricType')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.AccountUser')),
+            ],
+            options={
+                'ordering': ('start',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='metricrollup',
+            unique_together=set([('user', 'metric_type', 'period', 'start')]),
+        ),
+    ]
@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 from ..accounts.models import AccountUser
+from ..core.models import cache_counts, Tombstone
 
 
 class MetricTypeGroup(models.Model):
@@ -39,9 +43,91 @@ class Metric(models.Model):
     user = models.ForeignKey(AccountUser)
     value = models.FloatField()
     metric_type = models.ForeignKey(MetricType)
+    date_updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ('date',)
+        index_together = (('user', 'date'), ('user', 'metric_type', 'date'), ('user', 'date_updated'))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the loaded user, type and date to update the rollups the metric moved from
+        """
+        instance = super(Metric, cls).from_db(db, field_names, values)
+        instance.loaded_bucket = instance.rollup_bucket()
+        return instance
 
     def __str__(self):
         return ('%s - %s%s' % (self.date.strftime('%m/%d/%Y'), str(self.value), self.metric_type))
+
+    def rollup_bucket(self):
+        """
+        User, metric type and local day of the rollups the metric is counted in
+        """
+        return (self.user_id, self.metric_type_id, timezone.localtime(self.date).date())
+
+
+cache_counts(Metric)
+
+
+ROLLUP_PERIODS = (
+    ('day', 'Day'),
+    ('week', 'Week'),
+)
+
+
+class MetricRollup(models.Model):
+    """
+    Aggregates of a user's metrics of a type per local day or week (starting
+    monday), kept up to date in the background as metrics are written
+    """
+    user = models.ForeignKey(AccountUser)
+    metric_type = models.ForeignKey(MetricType)
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIODS)
+    start = models.DateField()
+    min = models.FloatField()
+    max = models.FloatField()
+    sum = models.FloatField()
+    count = models.IntegerField()
+    last = models.FloatField()
+    last_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('start',)
+        unique_together = ('user', 'metric_type', 'period', 'start')
+
+    def __str__(self):
+        return ('%s %s - %s%s' % (self.get_period_display(), self.start.strftime('%m/%d/%Y'),
+                                  round(self.sum / self.count, 2), self.metric_type))
+
+
+@receiver(post_delete, sender=Metric)
+def metric_post_delete(sender, **kwargs):
+    """
+    Post delete hook to leave a tombstone for syncing clients
+    """
+    instance = kwargs['instance']
+    Tombstone.objects.record(instance, instance.user_id)
+
+
+@receiver(post_save, sender=Metric)
+@receiver(post_delete, sender=Metric)
+def metric_rollups_changed(sender, **kwargs):
+    """
+    Post save/delete hook to update the rollups of the metric's day and week,
+    and of the ones it moved from, once the write is committed
+    """
+    from .tasks import update_rollups
+
+    instance = kwargs['instance']
+    buckets = set([instance.rollup_bucket()])
+    loaded_bucket = getattr(instance, 'loaded_bucket', None)
+    if loaded_bucket:
+        buckets.add(loaded_bucket)
+    instance.loaded_bucket = instance.rollup_bucket()
+
+    for user_id, metric_type_id, day in buckets:
+        transaction.on_commit(
+            lambda user_id=user_id, metric_type_id=metric_type_id, day=day.isoformat():
+                update_rollups.delay(user_id, metric_type_id, day))
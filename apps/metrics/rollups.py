@@ -0,0 +1,169 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.expressions import DateTime
+from django.utils import timezone
+
+from ..accounts.models import AccountUser
+
+from .models import Metric, MetricRollup, ROLLUP_PERIODS
+
+ROLLUP_FIELDS = ('min', 'max', 'sum', 'count', 'last', 'last_date')
+
+
+def bucket_start(day, period):
+    """
+    First day of the day, week (monday) or month a day falls in
+    """
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, period):
+    """
+    First day of the bucket after the one starting at start
+    """
+    if period == 'week':
+        return start + datetime.timedelta(days=7)
+    if period == 'month':
+        return (start + datetime.timedelta(days=31)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def day_start(day):
+    """
+    Start of a local day as an aware datetime
+    """
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def aggregate_rows(queryset, kind='day'):
+    """
+    Aggregates of the metrics of a queryset per local day (or month), grouped in SQL
+    """
+    rows = queryset.order_by().annotate(
+        bucket=DateTime('date', kind, timezone.get_current_timezone())
+    ).values('bucket').annotate(
+        min=Min('value'),
+        max=Max('value'),
+        sum=Sum('value'),
+        count=Count('id'),
+        last_date=Max('date'),
+    )
+    rows = list(rows)
+
+    # values of the last metric per bucket, the newest id wins a tie
+    last = {}
+    for date, value in queryset.filter(date__in=[row['last_date'] for row in rows]).order_by(
+            'date', 'id').values_list('date', 'value'):
+        last[date] = value
+
+    return [{
+        'start': row['bucket'].date(),
+        'min': row['min'],
+        'max': row['max'],
+        'sum': row['sum'],
+        'count': row['count'],
+        'last': last[row['last_date']],
+        'last_date': row['last_date'],
+    } for row in rows]
+
+
+def fold(rows, period):
+    """
+    Combine aggregates of consecutive buckets into days, weeks or months by their start
+    """
+    folded = []
+    for row in sorted(rows, key=lambda item: item['start']):
+        start = bucket_start(row['start'], period)
+        if folded and folded[-1]['start'] == start:
+            bucket = folded[-1]
+            bucket['min'] = min(bucket['min'], row['min'])
+            bucket['max'] = max(bucket['max'], row['max'])
+            bucket['sum'] += row['sum']
+            bucket['count'] += row['count']
+            if row['last_date'] >= bucket['last_date']:
+                bucket['last'], bucket['last_date'] = row['last'], row['last_date']
+            continue
+        folded.append(dict((field, row[field]) for field in ROLLUP_FIELDS + ('start', )))
+        folded[-1]['start'] = start
+    return folded
+
+
+def lock_rollups(user_id):
+    """
+    Lock a user's row until the end of the transaction, so the user's rollups
+    are rebuilt one at a time, each from the metrics committed before it
+    """
+    list(AccountUser.objects.select_for_update().filter(pk=user_id).values_list('pk'))
+
+
+def rebuild_rollups(user_id, metric_type_id, day):
+    """
+    Recompute a user's day and week rollups of a metric type that a local day falls in
+    """
+    metrics = Metric.objects.filter(user_id=user_id, metric_type_id=metric_type_id)
+    with transaction.atomic():
+        lock_rollups(user_id)
+        for period, _ in ROLLUP_PERIODS:
+            start, end = bucket_start(day, period), next_bucket(bucket_start(day, period), period)
+            rows = aggregate_rows(metrics.filter(date__gte=day_start(start), date__lt=day_start(end)))
+            store_rollups(user_id, metric_type_id, period, start, end, fold(rows, period))
+
+
+def store_rollups(user_id, metric_type_id, period, first, end, rows):
+    """
+    Make the rollups of a period starting from first up to end the given
+    aggregates, returns the number of rollups written or deleted
+    """
+    kept = dict((rollup.start, rollup) for rollup in MetricRollup.objects.filter(
+        user_id=user_id, metric_type_id=metric_type_id, period=period, start__gte=first, start__lt=end))
+
+    changed = 0
+    for row in rows:
+        fields = dict((field, row[field]) for field in ROLLUP_FIELDS)
+        rollup = kept.pop(row['start'], None)
+        if rollup is None:
+            MetricRollup.objects.create(user_id=user_id, metric_type_id=metric_type_id, period=period,
+                                        start=row['start'], **fields)
+        elif any(getattr(rollup, field) != value for field, value in fields.items()):
+            MetricRollup.objects.filter(pk=rollup.pk).update(**fields)
+        else:
+            continue
+        changed += 1
+
+    if kept:
+        MetricRollup.objects.filter(pk__in=[stale.pk for stale in kept.values()]).delete()
+    return changed + len(kept)
+
+
+def reconcile_rollups(since=None):
+    """
+    Rebuild the rollups of every user and metric type from the metrics, from
+    the week of a local day on or all of them. Returns the number of rollups
+    that were off
+    """
+    pairs = set(Metric.objects.order_by().values_list('user', 'metric_type').distinct())
+    rollups = MetricRollup.objects.all()
+    if since is not None:
+        since = bucket_start(since, 'week')
+        rollups = rollups.filter(start__gte=since)
+    pairs.update(rollups.order_by().values_list('user', 'metric_type').distinct())
+
+    first = since or datetime.date.min
+    end = datetime.date.max
+    changed = 0
+    for user_id, metric_type_id in sorted(pairs):
+        metrics = Metric.objects.filter(user_id=user_id, metric_type_id=metric_type_id)
+        if since is not None:
+            metrics = metrics.filter(date__gte=day_start(since))
+        with transaction.atomic():
+            lock_rollups(user_id)
+            days = aggregate_rows(metrics)
+            for period, _ in ROLLUP_PERIODS:
+                changed += store_rollups(user_id, metric_type_id, period, first, end, fold(days, period))
+    return changed
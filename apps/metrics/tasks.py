@@ -0,0 +1,30 @@
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from celery import task
+from celery.schedules import crontab
+from celery.task import periodic_task
+
+from .rollups import rebuild_rollups, reconcile_rollups
+
+# days of rollups checked against the metrics by the nightly reconciliation
+RECONCILE_DAYS = 35
+
+
+@task()
+def update_rollups(user_id, metric_type_id, day):
+    """
+    Async task to recompute the day and week rollups of a metric written on a local day
+    """
+    rebuild_rollups(user_id, metric_type_id, parse_date(day))
+
+
+@periodic_task(run_every=crontab(hour=3, minute=30))
+def reconcile_recent_rollups():
+    """
+    Nightly task to fix rollups of the last weeks missed by update tasks that were lost
+    """
+    since = timezone.localtime(timezone.now()).date() - datetime.timedelta(days=RECONCILE_DAYS)
+    return reconcile_rollups(since)
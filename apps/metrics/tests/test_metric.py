@@ -1,11 +1,19 @@
-from datetime import datetime
+import math
+from datetime import date, datetime, timedelta
+
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
 
 from rest_framework import status
 from rest_framework.reverse import reverse
 
 from ...core.tests import MetricsTestCase
 
-from ..models import Metric, MetricType, MetricTypeGroup
+from ..models import Metric, MetricType, MetricTypeGroup, MetricRollup
+from ..analytics import bucket_rows
+from ..rollups import reconcile_rollups
+from ..tasks import update_rollups
 
 
 class MetricTest(MetricsTestCase):
@@ -33,6 +41,16 @@ class MetricTest(MetricsTestCase):
         self.assertEqual(metric_list.status_code, status.HTTP_200_OK)
         self.assertEqual(detail.status_code, status.HTTP_200_OK)
 
+    def test_list_query_plan(self):
+        """
+        Ensure listing metrics by date, type and date range is served by an index
+        """
+        self.populate()
+
+        self.assertIndexed(reverse('v1:metric-list'), 'metrics_metric')
+        self.assertIndexed(reverse('v1:metric-list'), 'metrics_metric', {'metric_type': self.type.id})
+        self.assertIndexed(reverse('v1:metric-list'), 'metrics_metric', {'min_date': '2016-01-01', 'cursor': ''})
+
     def test_add_metric(self):
         """
         Add new metric
@@ -95,3 +113,206 @@ class MetricTest(MetricsTestCase):
         self.assertEqual(delete.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(put.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(patch.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_keyset_pagination(self):
+        """
+        Ensure a cursor page continues after the last metric of the previous page
+        """
+        self.populate()
+        for value in range(12):
+            Metric.objects.create(user=self.user, metric_type=self.type, value=value)
+
+        first = self.client.get(reverse('v1:metric-list') + '?cursor=')
+        next_url = first['Link'].split('>')[0][1:]
+        second = self.client.get(next_url)
+        ids = [metric['id'] for metric in first.data + second.data]
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids, list(Metric.objects.order_by('date', 'id').values_list('id', flat=True)))
+
+    def test_export(self):
+        """
+        Ensure all of a user's metrics are streamed
+        """
+        self.populate()
+        for value in range(5):
+            Metric.objects.create(user=self.user, metric_type=self.type, value=value)
+
+        response = self.client.get(reverse('v1:metric-export') + '?type=csv')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(rows[0], 'id,date,metric_type,value')
+        self.assertEqual(len(rows), 7)
+
+    def log(self, values, start=datetime(2016, 2, 27, 9), step=timedelta(hours=12)):
+        """
+        Metrics of the populated type at local times from start a step apart
+        """
+        start = timezone.make_aware(start)
+        for i, value in enumerate(values):
+            metric = Metric.objects.create(user=self.user, metric_type=self.type, value=value)
+            Metric.objects.filter(pk=metric.pk).update(date=start + step * i)
+
+    def test_series_buckets(self):
+        """
+        Ensure the series of a metric type is aggregated per day, week and month
+        """
+        self.populate()
+        self.metric.delete()
+        # saturday 2016-02-27 to tuesday 2016-03-01, twice a day
+        self.log([180, 181, 179, 182, 178, 180, 183, 177])
+        reconcile_rollups()
+        url = reverse('v1:metric-series')
+
+        days = self.client.get(url, {'metric_type': self.type.id})
+        weeks = self.client.get(url, {'metric_type': self.type.id, 'bucket': 'week'})
+        months = self.client.get(url, {'metric_type': self.type.id, 'bucket': 'month'})
+
+        self.assertEqual(days.status_code, status.HTTP_200_OK)
+        self.assertEqual([(str(row['bucket']), row['min'], row['max'], row['avg'], row['last'], row['count'])
+                          for row in days.data], [
+            ('2016-02-27', 180, 181, 180.5, 181, 2),
+            ('2016-02-28', 179, 182, 180.5, 182, 2),
+            ('2016-02-29', 178, 180, 179, 180, 2),
+            ('2016-03-01', 177, 183, 180, 177, 2),
+        ])
+        self.assertEqual([(str(row['bucket']), row['min'], row['max'], row['avg'], row['last'])
+                          for row in weeks.data], [
+            ('2016-02-22', 179, 182, 180.5, 182),
+            ('2016-02-29', 177, 183, 179.5, 177),
+        ])
+        self.assertEqual([(str(row['bucket']), row['count'], row['last']) for row in months.data],
+                         [('2016-02-01', 6, 180), ('2016-03-01', 2, 177)])
+
+    def test_series_lttb(self):
+        """
+        Ensure the lttb series keeps at most the asked points including the ends and a spike
+        """
+        self.populate()
+        self.metric.delete()
+        values = [180 + math.sin(i / 10.0) for i in range(1000)]
+        values[500] = 200
+        self.log(values, step=timedelta(days=1))
+
+        response = self.client.get(reverse('v1:metric-series'),
+                                   {'metric_type': self.type.id, 'mode': 'lttb', 'points': 50})
+        points = [point['value'] for point in response.data]
+
+        self.assertEqual(len(points), 50)
+        self.assertEqual((points[0], points[-1]), (values[0], values[-1]))
+        self.assertIn(200, points)
+        dates = [point['date'] for point in response.data]
+        self.assertEqual(dates, sorted(dates))
+
+    def test_series_invalid(self):
+        """
+        Ensure a series needs a metric type and a valid bucket, mode and point count
+        """
+        self.populate()
+        url = reverse('v1:metric-series')
+
+        for params in ({}, {'metric_type': self.type.id, 'bucket': 'year'},
+                       {'metric_type': self.type.id, 'mode': 'lttb', 'points': 2}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_series_query_plan(self):
+        """
+        Ensure series of a metric type are read with an index
+        """
+        self.populate()
+        self.assertIndexed(reverse('v1:metric-series'), 'metrics_metric', {'metric_type': self.type.id})
+        self.assertIndexed(reverse('v1:metric-series'), 'metrics_metric',
+                           {'metric_type': self.type.id, 'mode': 'lttb'})
+
+    def rollups(self, period):
+        return [(str(rollup.start), rollup.min, rollup.max, rollup.count, rollup.last)
+                for rollup in MetricRollup.objects.filter(user=self.user, metric_type=self.type, period=period)]
+
+    def test_update_rollups(self):
+        """
+        Ensure the rollups of a day and its week follow the metrics written on the day
+        """
+        self.populate()
+        self.metric.delete()
+        self.log([180, 181, 179, 182])
+        for day in ('2016-02-27', '2016-02-28'):
+            update_rollups(self.user.id, self.type.id, day)
+
+        self.assertEqual(self.rollups('day'), [('2016-02-27', 180, 181, 2, 181), ('2016-02-28', 179, 182, 2, 182)])
+        self.assertEqual(self.rollups('week'), [('2016-02-22', 179, 182, 4, 182)])
+
+        Metric.objects.filter(value=182).delete()
+        Metric.objects.filter(value=179).update(metric_type=MetricType.objects.create(
+            name='other', unit='kg', group=self.group))
+        update_rollups(self.user.id, self.type.id, '2016-02-28')
+
+        self.assertEqual(self.rollups('day'), [('2016-02-27', 180, 181, 2, 181)])
+        self.assertEqual(self.rollups('week'), [('2016-02-22', 180, 181, 2, 181)])
+
+    def test_series_reads_rollups(self):
+        """
+        Ensure series read closed buckets from the rollups and the open bucket and cut buckets from the metrics
+        """
+        self.populate()
+        self.log([180, 181, 179, 182, 178, 180, 183, 177])
+        reconcile_rollups()
+        url = reverse('v1:metric-series')
+
+        # the rollups agree with the metrics
+        for bucket in ('day', 'week', 'month'):
+            rows = self.client.get(url, {'metric_type': self.type.id, 'bucket': bucket}).data
+            self.assertEqual(rows, bucket_rows(Metric.objects.filter(user=self.user, metric_type=self.type), bucket))
+
+        MetricRollup.objects.filter(period='day', start=date(2016, 2, 28)).update(max=999)
+        days = self.client.get(url, {'metric_type': self.type.id}).data
+        cut = self.client.get(url, {'metric_type': self.type.id, 'min_date': '2016-02-28 12:00'}).data
+
+        self.assertEqual([row['max'] for row in days[1:3]], [999, 180])
+        # the metric of today has no rollup yet
+        self.assertEqual((days[-1]['bucket'], days[-1]['count']), (timezone.localtime(self.metric.date).date(), 1))
+        self.assertEqual((cut[0]['bucket'], cut[0]['max'], cut[0]['count']), (date(2016, 2, 28), 182, 1))
+
+    def test_series_without_rollups(self):
+        """
+        Ensure series aggregate the metrics of closed buckets the rollups don't have yet
+        """
+        self.populate()
+        self.log([180, 181, 179, 182, 178, 180, 183, 177])
+        url = reverse('v1:metric-series')
+        metrics = Metric.objects.filter(user=self.user, metric_type=self.type)
+
+        # before the rollups are built
+        for bucket in ('day', 'week', 'month'):
+            rows = self.client.get(url, {'metric_type': self.type.id, 'bucket': bucket}).data
+            self.assertEqual(rows, bucket_rows(metrics, bucket))
+        cut = self.client.get(url, {'metric_type': self.type.id, 'min_date': '2016-02-28 12:00'}).data
+        self.assertEqual(cut, bucket_rows(metrics.filter(date__gte=timezone.make_aware(datetime(2016, 2, 28, 12)))))
+
+        # metrics logged while the rollup updates are behind
+        reconcile_rollups()
+        self.log([175, 176], start=datetime(2016, 3, 8, 9))
+        for bucket in ('day', 'week', 'month'):
+            rows = self.client.get(url, {'metric_type': self.type.id, 'bucket': bucket}).data
+            self.assertEqual(rows, bucket_rows(metrics, bucket))
+
+    def test_reconcile_rollups(self):
+        """
+        Ensure reconciling fixes rollups that are off, missing or left over
+        """
+        self.populate()
+        self.metric.delete()
+        self.log([180, 181, 179, 182])
+        reconcile_rollups()
+        expected = self.rollups('day'), self.rollups('week')
+
+        MetricRollup.objects.filter(period='day').update(count=1)
+        MetricRollup.objects.filter(period='week').delete()
+        MetricRollup.objects.create(user=self.user, metric_type=self.type, period='day', start=date(2016, 1, 1),
+                                    min=1, max=1, sum=1, count=1, last=1, last_date=timezone.now())
+        out = StringIO()
+        call_command('reconcile_rollups', stdout=out)
+
+        self.assertEqual((self.rollups('day'), self.rollups('week')), expected)
+        self.assertIn('Fixed 4 rollups', out.getvalue())
+        self.assertEqual(reconcile_rollups(date(2016, 2, 1)), 0)
@@ -1,15 +1,20 @@
 from oauth2_provider.ext.rest_framework import TokenHasReadWriteScope
 
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import list_route
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from ..core.permissions import IsAdminOrReadOnly
 from ..core.loggers import LoggingMixin
+from ..core.pagination import KeysetPaginationMixin
+from ..core.streaming import chunked, ndjson_response, csv_response
 from ..accounts.models import AccountUser
 
 from .models import Metric, MetricType, MetricTypeGroup
 from .filters import MetricFilter, MetricTypeFilter, MetricTypeGroupFilter
 from .serializers import MetricSerializer, MetricTypeSerializer, MetricTypeGroupSerializer
+from .analytics import rollup_bucket_rows, lttb_points, BUCKETS, MODES
 
 
 class MetricTypeGroupViewSet(LoggingMixin, viewsets.ModelViewSet):
@@ -34,7 +39,7 @@ class MetricTypeViewSet(LoggingMixin, viewsets.ModelViewSet):
     filter_class = MetricTypeFilter
 
 
-class MetricViewSet(LoggingMixin, viewsets.ModelViewSet):
+class MetricViewSet(KeysetPaginationMixin, LoggingMixin, viewsets.ModelViewSet):
     """
     User body measurment viewset
     """
@@ -43,6 +48,8 @@ class MetricViewSet(LoggingMixin, viewsets.ModelViewSet):
     queryset = Metric.objects.all().order_by('date')
     serializer_class = MetricSerializer
     filter_class = MetricFilter
+    keyset_ordering = ('date', 'id')
+    series_max_points = 5000
 
     def get_queryset(self):
         """
@@ -50,6 +57,53 @@ class MetricViewSet(LoggingMixin, viewsets.ModelViewSet):
         """
         return Metric.objects.filter(user=self.request.user)
 
+    @list_route(methods=['get'])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream all of the user's metrics as newline delimited json, or csv
+        with ?type=csv. Metric filters are honored
+        """
+        fields = ('id', 'date', 'metric_type', 'value')
+        queryset = self.filter_queryset(self.get_queryset()).values(*fields)
+        rows = (row for chunk in chunked(queryset) for row in chunk)
+
+        if request.query_params.get('type') == 'csv':
+            return csv_response(rows, fields, 'metrics')
+        return ndjson_response(rows, 'metrics')
+
+    @list_route(methods=['get'])
+    def series(self, request, *args, **kwargs):
+        """
+        Chart series of a ?metric_type: the minimum, maximum, average and last value per
+        ?bucket=day (default), week or month read from the rollups, or with ?mode=lttb at
+        most ?points (default 500) metrics that keep the shape of the series. Metric date
+        filters are honored
+        """
+        bucket = request.query_params.get('bucket', 'day')
+        mode = request.query_params.get('mode', 'buckets')
+        try:
+            points = int(request.query_params.get('points', 500))
+        except ValueError:
+            points = 0
+
+        if (not request.query_params.get('metric_type') or bucket not in BUCKETS or mode not in MODES or
+                not 3 <= points <= self.series_max_points):
+            message = {"detail": "A metric type, a bucket of %s, a mode of %s and 3 to %d points are required" %
+                                 (', '.join(BUCKETS), ', '.join(MODES), self.series_max_points)}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        filterset = self.filter_class(request.query_params, queryset=self.get_queryset())
+        queryset = filterset.qs
+        if mode == 'lttb':
+            return Response(lttb_points(queryset, points))
+
+        # invalid filters match no metrics, the rollups must not be read either
+        filters = filterset.form.cleaned_data
+        if not filterset.form.is_valid() or filters.get('metric_type') is None:
+            return Response([])
+        return Response(rollup_bucket_rows(queryset, request.user.id, filters['metric_type'].id, bucket,
+                                           filters.get('min_date'), filters.get('max_date')))
+
     def perform_create(self, serializer):
         """
         Automatically assign requesting user to models user field
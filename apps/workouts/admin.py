@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DayOfWeek, Routine, Progress, Set
+from .models import DayOfWeek, Routine, Progress, Set, PersonalRecord, ProgressImport, TrainingStreak
 
 
 class WorkoutAdmin(admin.ModelAdmin):
@@ -9,3 +9,6 @@ admin.site.register(DayOfWeek, WorkoutAdmin)
 admin.site.register(Routine, WorkoutAdmin)
 admin.site.register(Progress, WorkoutAdmin)
 admin.site.register(Set, WorkoutAdmin)
+admin.site.register(PersonalRecord, WorkoutAdmin)
+admin.site.register(ProgressImport, WorkoutAdmin)
+admin.site.register(TrainingStreak, WorkoutAdmin)
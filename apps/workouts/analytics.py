@@ -0,0 +1,181 @@
+import datetime
+from operator import itemgetter
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.utils.six.moves import map
+
+PERIODS = ('day', 'week', 'month')
+
+FORMULAS = ('epley', 'brzycki')
+
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def period_start(date, period):
+    """
+    First day of the day, week (monday) or month a date falls in
+    """
+    if period == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if period == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def volume(queryset, period='week'):
+    """
+    Training volume (reps x weight), total reps, set count and max weight per
+    exercise and period of a progress queryset. The summaries of the entries
+    are grouped by day and exercise in a single query, days are then folded
+    into weeks or months
+    """
+    rows = queryset.filter(set_count__gt=0).order_by().values('date', 'exercise').annotate(
+        volume=Sum('total_volume'),
+        reps=Sum('total_reps'),
+        sets=Sum('set_count'),
+        max_weight=Max('top_weight'),
+    )
+
+    buckets = {}
+    for row in rows:
+        key = (period_start(row['date'], period), row['exercise'])
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = {
+                'period': key[0],
+                'exercise': key[1],
+                'volume': row['volume'] or 0,
+                'reps': row['reps'] or 0,
+                'sets': row['sets'],
+                'max_weight': row['max_weight'],
+            }
+            continue
+
+        bucket['volume'] += row['volume'] or 0
+        bucket['reps'] += row['reps'] or 0
+        bucket['sets'] += row['sets']
+        if bucket['max_weight'] is None or row['max_weight'] > bucket['max_weight']:
+            bucket['max_weight'] = row['max_weight']
+
+    return [buckets[bucket_key] for bucket_key in sorted(buckets)]
+
+
+def estimated_1rm(reps, weights, formula='epley'):
+    """
+    Estimated one rep max of each set, single rep sets are their own max.
+    Brzycki is undefined from 37 reps on, those sets are nan
+    """
+    if formula == 'brzycki':
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            estimates = weights * 36.0 / (37.0 - reps)
+        estimates[reps >= 37] = numpy.nan
+    else:
+        estimates = weights * (1.0 + reps / 30.0)
+    return numpy.where(reps == 1, weights, estimates)
+
+
+def rolling_max(values, window):
+    """
+    Maximum of each value and the window - 1 values before it
+    """
+    padded = numpy.concatenate((numpy.full(window - 1, -numpy.inf), values))
+    stride = padded.strides[0]
+    return as_strided(padded, shape=(len(values), window), strides=(stride, stride)).max(axis=1)
+
+
+def rolling_slope(x, y, window):
+    """
+    Least squares slope of y over x for each point and the window - 1 points
+    before it, computed from running sums. nan until there are two points
+    """
+    def trailing(values):
+        sums = numpy.concatenate(([0.0], numpy.cumsum(values)))
+        start = numpy.maximum(numpy.arange(1, len(values) + 1) - window, 0)
+        return sums[1:] - sums[start]
+
+    count = numpy.minimum(numpy.arange(1, len(x) + 1), window)
+    sum_x, sum_y = trailing(x), trailing(y)
+    denominator = count * trailing(x * x) - sum_x * sum_x
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where(denominator > 0, (count * trailing(x * y) - sum_x * sum_y) / denominator, numpy.nan)
+
+
+def strength_series(rows, formula='epley', window=5):
+    """
+    Strength trend of (date, reps, weight) rows in date order: the best estimated
+    one rep max of each session, the best so far, the rolling max and the slope
+    in weight per day over the last window sessions
+    """
+    count = len(rows)
+    days = numpy.fromiter(map(datetime.date.toordinal, map(itemgetter(0), rows)), numpy.int64, count)
+    reps = numpy.fromiter(map(itemgetter(1), rows), numpy.float64, count)
+    weights = numpy.fromiter(map(itemgetter(2), rows), numpy.float64, count)
+
+    estimates = estimated_1rm(reps, weights, formula)
+    valid = ~numpy.isnan(estimates)
+    days, estimates = days[valid], estimates[valid]
+    if not len(days):
+        return []
+
+    # rows are in date order, a session starts wherever the day changes
+    starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(days)) + 1))
+    days = days[starts]
+    sessions = numpy.maximum.reduceat(estimates, starts)
+
+    best = numpy.maximum.accumulate(sessions)
+    recent = rolling_max(sessions, window)
+    slope = rolling_slope((days - days[0]).astype(numpy.float64), sessions, window)
+
+    return [
+        {
+            'date': datetime.date.fromordinal(day),
+            'e1rm': round(session, 2),
+            'best': round(best_so_far, 2),
+            'rolling_max': round(recent_max, 2),
+            'slope': None if numpy.isnan(trend) else round(trend, 3),
+        }
+        for day, session, best_so_far, recent_max, trend in zip(
+            days.tolist(), sessions.tolist(), best.tolist(), recent.tolist(), slope.tolist())
+    ]
+
+
+def strength(queryset, formula='epley', window=5):
+    """
+    Strength trend of the sets of a progress queryset, see strength_series
+    """
+    rows = queryset.filter(set__reps__gt=0, set__weight__gt=0).order_by('date').values_list(
+        'date', 'set__reps', 'set__weight')
+    return strength_series(list(rows), formula, window)
+
+
+def calendar_cache_key(user_id, date):
+    """
+    Cache key of a user's training calendar of the month a date falls in
+    """
+    return 'calendar:%s:%s' % (user_id, date.strftime('%Y-%m'))
+
+
+def invalidate_calendar(user_id, date):
+    """
+    Drop a user's cached training calendar of the month a date falls in
+    """
+    cache.delete(calendar_cache_key(user_id, date))
+
+
+def calendar(queryset, month):
+    """
+    Training days of the month starting at a date in a progress queryset with
+    their exercise count, set count and volume, grouped from the summaries of
+    the entries in a single query
+    """
+    next_month = (month + datetime.timedelta(days=31)).replace(day=1)
+    rows = queryset.filter(date__gte=month, date__lt=next_month).order_by('date').values('date').annotate(
+        exercises=Count('exercise', distinct=True),
+        sets=Sum('set_count'),
+        volume=Sum('total_volume'),
+    )
+    return [dict(row, volume=row['volume'] or 0) for row in rows]
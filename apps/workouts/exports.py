@@ -0,0 +1,37 @@
+from ..core.streaming import chunked
+
+from .models import Set
+
+PROGRESS_CSV_FIELDS = ('id', 'date', 'exercise', 'exercise_name', 'set', 'reps', 'weight', 'duration')
+
+
+def progress_rows(queryset):
+    """
+    Progress entries of a queryset with their sets, the sets of each chunk
+    of progress entries are read with one query
+    """
+    queryset = queryset.values('id', 'date', 'exercise', 'exercise__name')
+
+    for chunk in chunked(queryset):
+        sets = {}
+        for row in Set.objects.filter(progress__in=[progress['id'] for progress in chunk]).order_by('id').values(
+                'id', 'progress', 'reps', 'weight', 'duration'):
+            sets.setdefault(row.pop('progress'), []).append(row)
+
+        for progress in chunk:
+            progress['exercise_name'] = progress.pop('exercise__name')
+            progress['sets'] = sets.get(progress['id'], [])
+            yield progress
+
+
+def progress_csv_rows(rows):
+    """
+    Flatten progress entries to a row per set, entries without sets get a single row
+    """
+    empty = {'id': None, 'reps': None, 'weight': None, 'duration': None}
+
+    for progress in rows:
+        for row in progress.pop('sets') or [empty]:
+            row = dict(row, set=row['id'])
+            row.update(progress)
+            yield row
@@ -1,8 +1,10 @@
-from django_filters import FilterSet, CharFilter, BooleanFilter, ModelChoiceFilter, DateFilter
+from django_filters import (
+    FilterSet, CharFilter, BooleanFilter, ModelChoiceFilter, DateFilter, ChoiceFilter, NumberFilter
+)
 
 from ..exercises.models import Exercise
 
-from .models import DayOfWeek, Routine, Progress
+from .models import DayOfWeek, Routine, Progress, PersonalRecord, RECORD_KINDS
 
 
 class DayOfWeekFilter(FilterSet):
@@ -37,7 +39,33 @@ class ProgressFilter(FilterSet):
     exercise = ModelChoiceFilter(queryset=Exercise.objects.all())
     max_date = DateFilter(name='date', lookup_type='lte')
     min_date = DateFilter(name='date', lookup_type='gte')
+    min_sets = NumberFilter(name='set_count', lookup_type='gte')
+    min_volume = NumberFilter(name='total_volume', lookup_type='gte')
+    min_weight = NumberFilter(name='top_weight', lookup_type='gte')
 
     class Meta:
         model = Progress
-        fields = ['exercise', 'max_date', 'min_date']
+        fields = ['exercise', 'max_date', 'min_date', 'min_sets', 'min_volume', 'min_weight']
+        # date and the summary fields with an index per user, date comes first as the default
+        order_by = ['date', '-date', 'set_count', '-set_count', 'total_volume', '-total_volume',
+                    'top_weight', '-top_weight']
+
+    def get_order_by(self, order_choice):
+        """
+        Entries of the same date stay in the default order by exercise
+        """
+        if order_choice == 'date':
+            return Progress._meta.ordering
+        return super(ProgressFilter, self).get_order_by(order_choice)
+
+
+class PersonalRecordFilter(FilterSet):
+    """
+    Filter set for user personal records
+    """
+    exercise = ModelChoiceFilter(queryset=Exercise.objects.all())
+    kind = ChoiceFilter(choices=RECORD_KINDS)
+
+    class Meta:
+        model = PersonalRecord
+        fields = ['exercise', 'kind']
@@ -0,0 +1,165 @@
+import codecs
+import csv
+import datetime
+
+from django.utils import six
+from django.utils.encoding import force_text
+
+from ..exercises.models import Exercise
+
+from .models import Progress, ProgressImport, TrainingStreak
+
+# accepted headers of each column, the first one found is used
+IMPORT_COLUMNS = (
+    ('date', ('date', 'day', 'workout date')),
+    ('exercise', ('exercise_name', 'exercise name', 'exercise')),
+    ('reps', ('reps', 'repetitions')),
+    ('weight', ('weight', )),
+    ('duration', ('duration', 'seconds')),
+)
+
+# row errors and unknown exercise names kept for the report
+MAX_REPORTED = 100
+
+
+def chunk_lines(chunks):
+    """
+    Lines of a file read in chunks of bytes, with their line endings
+    """
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).splitlines(True)
+        # the last line continues in the next chunk, so may a \r\n split after the \r
+        rest = lines.pop() if lines and not lines[-1].endswith(b'\n') else b''
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+def csv_rows(f):
+    """
+    Rows of a csv file as dicts of text keyed by column, read line by line
+    """
+    lines = iter(f)
+    if six.PY3:
+        lines = codecs.iterdecode(lines, 'utf-8')
+    reader = csv.reader(lines)
+
+    header = [force_text(name).lstrip(u'\ufeff').strip().lower() for name in next(reader, [])]
+    columns = {}
+    for column, names in IMPORT_COLUMNS:
+        for name in names:
+            if name in header:
+                columns[column] = header.index(name)
+                break
+
+    if 'date' not in columns or 'exercise' not in columns:
+        raise ValueError('The csv file needs a date and an exercise column')
+
+    for row in reader:
+        yield dict((column, force_text(row[index]).strip() if index < len(row) else u'')
+                   for column, index in columns.items())
+
+
+def parse_number(row, column):
+    """
+    Whole number of a column, None when empty
+    """
+    value = row.get(column)
+    if not value:
+        return None
+    try:
+        return int(round(float(value)))
+    except (ValueError, OverflowError):
+        raise ValueError('%s is not a number: %s' % (column, value))
+
+
+def parse_row(row, exercises, today):
+    """
+    Date, exercise id and set fields of a row, exercises are ids by lowercased name
+    """
+    try:
+        date = datetime.datetime.strptime(row['date'][:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('invalid date: %s' % row['date'])
+    if date > today:
+        raise ValueError('date is in the future: %s' % row['date'])
+
+    exercise = exercises.get(row['exercise'].lower())
+    if exercise is None:
+        raise LookupError(row['exercise'])
+
+    fields = {}
+    for column in ('reps', 'weight', 'duration'):
+        value = parse_number(row, column)
+        if value is not None:
+            fields[column] = value
+
+    return date, exercise, fields
+
+
+def import_progress_csv(progress_import, chunk_size=1000):
+    """
+    Stream the rows of an import's csv file, read a stored chunk at a time,
+    into progress entries and sets. Consecutive rows of the same day and
+    exercise are sets of one entry, the entries are written in chunks of about
+    chunk_size rows and the import's counters updated after each chunk. The
+    training days of the written chunks are counted once at the end, a
+    back-dated chunk would otherwise recompute the streak from the whole
+    history. A dry run only counts
+    """
+    exercises = dict((name.lower(), exercise_id) for exercise_id, name in Exercise.objects.values_list('id', 'name'))
+    today = datetime.date.today()
+    report = {'rows': 0, 'progress_created': 0, 'sets_created': 0, 'skipped': 0}
+    errors = []
+    unknown = set()
+    days = set()
+
+    def flush(entries):
+        if not progress_import.dry_run:
+            Progress.objects.create_with_sets(progress_import.user, entries, count_days=False)
+            days.update(entry['date'] for entry in entries)
+        report['progress_created'] += len(entries)
+        report['sets_created'] += sum(len(entry['sets']) for entry in entries)
+        ProgressImport.objects.filter(pk=progress_import.pk).update(**report)
+
+    entries = []
+    pending = 0
+    try:
+        for line, row in enumerate(csv_rows(chunk_lines(progress_import.read_chunks())), 2):
+            report['rows'] += 1
+            try:
+                date, exercise, fields = parse_row(row, exercises, today)
+            except LookupError as e:
+                report['skipped'] += 1
+                if len(unknown) < MAX_REPORTED:
+                    unknown.add(force_text(e.args[0]))
+                continue
+            except ValueError as e:
+                report['skipped'] += 1
+                if len(errors) < MAX_REPORTED:
+                    errors.append(u'line %d: %s' % (line, force_text(e)))
+                continue
+
+            if not entries or (entries[-1]['date'], entries[-1]['exercise_id']) != (date, exercise):
+                # chunks end between entries so an entry's sets are written together
+                if pending >= chunk_size:
+                    flush(entries)
+                    entries = []
+                    pending = 0
+                entries.append({'date': date, 'exercise_id': exercise, 'sets': []})
+            if fields:
+                entries[-1]['sets'].append(fields)
+            pending += 1
+
+        if entries:
+            flush(entries)
+    finally:
+        TrainingStreak.objects.add_days(progress_import.user_id, days)
+
+    for field, value in report.items():
+        setattr(progress_import, field, value)
+    progress_import.errors = '\n'.join(errors)
+    progress_import.unknown_exercises = '\n'.join(sorted(unknown))
+    return progress_import
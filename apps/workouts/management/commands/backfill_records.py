@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import PersonalRecord, Progress, Set, RECORD_KINDS, record_value
+from ....core.streaming import chunked
+
+
+class Command(BaseCommand):
+    help = 'Rebuild personal records from the full history of sets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the records of this user id')
+        parser.add_argument('--chunk-size', type=int, default=5000, dest='chunk_size',
+                            help='Number of sets read per query')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            users = [options['user']]
+        else:
+            users = set(Progress.objects.order_by().values_list('user', flat=True).distinct())
+            users.update(PersonalRecord.objects.order_by().values_list('user', flat=True).distinct())
+
+        # one short transaction per user, so records raised by sets logged
+        # meanwhile are only held up for the rebuild of their own user
+        total = count = 0
+        for user_id in sorted(users):
+            with transaction.atomic():
+                rebuilt, read = self.rebuild(user_id, options['chunk_size'])
+            total += rebuilt
+            count += read
+
+        self.stdout.write('Rebuilt %d personal records from %d sets' % (total, count))
+
+    def rebuild(self, user_id, chunk_size):
+        """
+        Make a user's records the best of their sets, returns the number of
+        records and of sets read
+        """
+        # locked so sets saved meanwhile raise the records after the rebuild
+        records = dict(((r.exercise_id, r.kind), r)
+                       for r in PersonalRecord.objects.select_for_update().filter(user=user_id))
+
+        # best set per exercise and kind as (-value, date, id), the earliest
+        # set wins a tie like it does when records are kept up to date
+        best = {}
+        count = 0
+        sets = Set.objects.filter(user=user_id).values(
+            'id', 'reps', 'weight', 'progress__exercise', 'progress__date')
+        for chunk in chunked(sets, chunk_size):
+            count += len(chunk)
+            for row in chunk:
+                for kind, _ in RECORD_KINDS:
+                    value = record_value(kind, row['reps'], row['weight'])
+                    if value is None:
+                        continue
+                    key = (row['progress__exercise'], kind)
+                    candidate = (-value, row['progress__date'], row['id'])
+                    if key not in best or candidate < best[key]:
+                        best[key] = candidate
+
+        created = []
+        for (exercise_id, kind), (value, date, set_id) in best.items():
+            record = records.pop((exercise_id, kind), None)
+            if record is None:
+                created.append(PersonalRecord(user_id=user_id, exercise_id=exercise_id, kind=kind, value=-value,
+                                              date=date, set_id=set_id))
+            elif (record.value, record.date, record.set_id) != (-value, date, set_id):
+                PersonalRecord.objects.filter(pk=record.pk).update(value=-value, date=date, set=set_id)
+        PersonalRecord.objects.bulk_create(created, batch_size=500)
+
+        # records of exercises without sets left
+        if records:
+            PersonalRecord.objects.filter(pk__in=[stale.pk for stale in records.values()]).delete()
+
+        return len(best), count
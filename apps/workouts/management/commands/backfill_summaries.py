@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import Progress, Set, summarize_sets, PROGRESS_SUMMARY_FIELDS
+from ....core.streaming import chunked
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the set summaries of progress entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the summaries of this user id')
+        parser.add_argument('--chunk-size', type=int, default=1000, dest='chunk_size',
+                            help='Number of progress entries read per query')
+
+    def handle(self, *args, **options):
+        progress = Progress.objects.values('id', *PROGRESS_SUMMARY_FIELDS)
+        if options['user']:
+            progress = progress.filter(user=options['user'])
+
+        count = updated = 0
+        for chunk in chunked(progress, options['chunk_size']):
+            count += len(chunk)
+            sets = {}
+            rows = Set.objects.filter(progress__in=[row['id'] for row in chunk]).values_list(
+                'progress', 'reps', 'weight', 'duration')
+            for progress_id, reps, weight, duration in rows:
+                sets.setdefault(progress_id, []).append((reps, weight, duration))
+
+            # only entries whose summary is off are written, so syncing clients refetch just those
+            now = timezone.now()
+            with transaction.atomic():
+                for row in chunk:
+                    summary = summarize_sets(sets.get(row['id'], []))
+                    if any(row[field] != summary[field] for field in PROGRESS_SUMMARY_FIELDS):
+                        Progress.objects.filter(pk=row['id']).update(date_updated=now, **summary)
+                        updated += 1
+
+        self.stdout.write('Updated %d of %d progress summaries' % (updated, count))
@@ -0,0 +1,46 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...analytics import strength_series, FORMULAS
+
+
+class Command(BaseCommand):
+    help = 'Time the strength trend series on generated set histories of increasing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma separated numbers of sets to time')
+        parser.add_argument('--formula', default='epley', choices=FORMULAS)
+        parser.add_argument('--window', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('Sizes must be comma separated numbers')
+
+        line = '{sets:>9} {sessions:>9} {seconds:>9} {rate:>13}'
+        self.stdout.write(line.format(sets='SETS', sessions='SESSIONS', seconds='SECONDS', rate='SETS/SECOND'))
+
+        line = '{sets:>9} {sessions:>9} {seconds:>9.3f} {rate:>13.0f}'
+        for size in sizes:
+            rows = self.history(size)
+            start = time.time()
+            series = strength_series(rows, options['formula'], options['window'])
+            seconds = max(time.time() - start, 1e-6)
+            self.stdout.write(line.format(sets=size, sessions=len(series), seconds=seconds, rate=size / seconds))
+
+    def history(self, size, sets_per_session=8):
+        """
+        (date, reps, weight) rows in date order of a session every other day
+        """
+        random.seed(size)
+        first = datetime.date(2000, 1, 1)
+        return [
+            (first + datetime.timedelta(days=i // sets_per_session * 2), random.randint(1, 15),
+             random.randint(20, 250))
+            for i in range(size)
+        ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_auto_20160311_1525'),
+        ('exercises', '0019_equipment_is_machine'),
+        ('workouts', '0017_auto_20160318_1619'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('weight', 'Heaviest weight'), ('reps', 'Most reps'), ('volume', 'Most volume in a set')], max_length=10)),
+                ('value', models.IntegerField()),
+                ('date', models.DateField()),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='exercises.Exercise')),
+                ('set', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='workouts.Set')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.AccountUser')),
+            ],
+            options={
+                'ordering': ['exercise', 'kind'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='personalrecord',
+            unique_together=set([('user', 'exercise', 'kind')]),
+        ),
+    ]
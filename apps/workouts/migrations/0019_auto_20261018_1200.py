@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0019_equipment_is_machine'),
+        ('accounts', '0011_auto_20160311_1525'),
+        ('workouts', '0018_personalrecord'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='progress',
+            options={'ordering': ['date', 'exercise_id']},
+        ),
+        migrations.AlterIndexTogether(
+            name='progress',
+            index_together=set([('user', 'date', 'exercise')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='routine',
+            index_together=set([('user', 'name'), ('is_public', 'name')]),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_auto_20160311_1525'),
+        ('workouts', '0019_auto_20261018_1200'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressImport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('dry_run', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('rows', models.IntegerField(default=0)),
+                ('progress_created', models.IntegerField(default=0)),
+                ('sets_created', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('errors', models.TextField(blank=True)),
+                ('unknown_exercises', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.AccountUser')),
+            ],
+            options={
+                'ordering': ['-date_created'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProgressImportChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('progress_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='workouts.ProgressImport')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='progressimportchunk',
+            unique_together=set([('progress_import', 'index')]),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0019_equipment_is_machine'),
+        ('accounts', '0011_auto_20160311_1525'),
+        ('workouts', '0020_progressimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='progress',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='routine',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='set',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterIndexTogether(
+            name='progress',
+            index_together=set([('user', 'date', 'exercise'), ('user', 'date_updated')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='routine',
+            index_together=set([('user', 'name'), ('is_public', 'name'), ('user', 'date_updated')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='set',
+            index_together=set([('progress', 'date_updated')]),
+        ),
+    ]
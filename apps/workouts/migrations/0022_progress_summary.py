@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.4 on 2026-10-18 15:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Sum
+
+
+def fill_summaries(apps, schema_editor):
+    """
+    Summarize the sets of the existing progress entries, entries without sets
+    keep the empty summary. Empty values are left out of the totals like
+    summarize_sets does
+    """
+    Progress = apps.get_model('workouts', 'Progress')
+    Set = apps.get_model('workouts', 'Set')
+    rows = Set.objects.order_by().values('progress').annotate(
+        count=Count('id'),
+        reps=Sum('reps'),
+        volume=Sum(F('reps') * F('weight')),
+        weight=Max('weight'),
+        duration=Sum('duration'),
+    )
+    for row in rows.iterator():
+        Progress.objects.filter(pk=row['progress']).update(
+            set_count=row['count'],
+            total_reps=row['reps'] or 0,
+            total_volume=row['volume'] or 0,
+            top_weight=row['weight'],
+            total_duration=row['duration'] or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0021_auto_20261018_1300'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='progress',
+            name='set_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='progress',
+            name='top_weight',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='progress',
+            name='total_duration',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='progress',
+            name='total_reps',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='progress',
+            name='total_volume',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='progress',
+            index_together=set([('user', 'top_weight'), ('user', 'date', 'exercise'), ('user', 'total_volume'), ('user', 'set_count'), ('user', 'date_updated')]),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.4 on 2026-10-18 15:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_auto_20160311_1525'),
+        ('workouts', '0022_progress_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingStreak',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='accounts.AccountUser')),
+                ('first_date', models.DateField(null=True)),
+                ('last_date', models.DateField(null=True)),
+                ('training_days', models.IntegerField(default=0)),
+                ('current_start', models.DateField(null=True)),
+                ('longest', models.IntegerField(default=0)),
+                ('longest_end', models.DateField(null=True)),
+                ('weeks_trained', models.IntegerField(default=0)),
+                ('current_week_start', models.DateField(null=True)),
+                ('longest_weeks', models.IntegerField(default=0)),
+                ('longest_weeks_end', models.DateField(null=True)),
+            ],
+        ),
+    ]
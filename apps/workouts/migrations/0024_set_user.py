@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_set_users(apps, schema_editor):
+    """
+    Give the sets the user of their progress entry
+    """
+    Progress = apps.get_model('workouts', 'Progress')
+    Set = apps.get_model('workouts', 'Set')
+    for user_id in Progress.objects.order_by().values_list('user', flat=True).distinct():
+        Set.objects.filter(progress__user=user_id).update(user=user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_auto_20160311_1525'),
+        ('workouts', '0023_trainingstreak'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='set',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.AccountUser'),
+        ),
+        migrations.RunPython(fill_set_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    # the filled in column is altered in a transaction of its own, postgres won't
+    # alter a table with pending foreign key checks of rows updated before
+    dependencies = [
+        ('workouts', '0024_set_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='set',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.AccountUser'),
+        ),
+        migrations.AlterIndexTogether(
+            name='set',
+            index_together=set([('user', 'date_updated', 'id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.4 on 2026-10-18 16:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0025_set_user_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='set',
+            name='progress',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='workouts.Progress'),
+        ),
+        migrations.AlterField(
+            model_name='set',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='accounts.AccountUser'),
+        ),
+    ]
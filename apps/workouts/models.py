@@ -1,8 +1,19 @@
-from django.db import models
+import datetime
 
-from ..exercises.models import Exercise
+from django.db import models, transaction
+from django.db.models import F, Max, Q
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ..core.caching import bump_cache_version
+from ..core.models import bump_count_version, cache_counts, Tombstone
+
+from ..exercises.models import Exercise, ExerciseCategory
 from ..accounts.models import AccountUser
 
+from .analytics import invalidate_calendar
+
 
 class DayOfWeek(models.Model):
     """
@@ -36,16 +47,136 @@ class Routine(models.Model):
     exercises = models.ManyToManyField(Exercise)
     days = models.ManyToManyField(DayOfWeek, blank=True)
     is_public = models.BooleanField(default=False)
+    date_updated = models.DateTimeField(auto_now=True)
 
     objects = RoutineManager()
 
     class Meta:
         ordering = ['name', ]
+        index_together = [('user', 'name'), ('is_public', 'name'), ('user', 'date_updated')]
 
     def __str__(self):
         return self.name
 
 
+# cache name of the public routine list responses
+PUBLIC_ROUTINES_CACHE = 'public-routines'
+
+
+@receiver(post_save, sender=Routine)
+@receiver(post_delete, sender=Routine)
+@receiver(m2m_changed, sender=Routine.exercises.through)
+@receiver(m2m_changed, sender=Routine.days.through)
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+@receiver(post_save, sender=ExerciseCategory)
+@receiver(post_delete, sender=ExerciseCategory)
+def routine_changed(sender, **kwargs):
+    """
+    Post save/delete and exercises/days change hook to invalidate the cached public routine lists,
+    exercises and their categories are embedded in expanded lists
+    """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_cache_version(PUBLIC_ROUTINES_CACHE)
+
+
+@receiver(post_delete, sender=Routine)
+def routine_post_delete(sender, **kwargs):
+    """
+    Post delete hook to leave a tombstone for syncing clients
+    """
+    instance = kwargs['instance']
+    Tombstone.objects.record(instance, instance.user_id)
+
+
+# fields of a progress entry summarizing its sets
+PROGRESS_SUMMARY_FIELDS = ('set_count', 'total_reps', 'total_volume', 'top_weight', 'total_duration')
+
+
+def summarize_sets(sets):
+    """
+    Summary fields of a progress entry from the (reps, weight, duration) of its sets,
+    empty values are left out of the totals like SQL aggregates do
+    """
+    summary = {'set_count': 0, 'total_reps': 0, 'total_volume': 0, 'top_weight': None, 'total_duration': 0}
+    for reps, weight, duration in sets:
+        summary['set_count'] += 1
+        summary['total_reps'] += reps or 0
+        summary['total_volume'] += (reps or 0) * (weight or 0)
+        summary['total_duration'] += duration or 0
+        if weight is not None and (summary['top_weight'] is None or weight > summary['top_weight']):
+            summary['top_weight'] = weight
+    return summary
+
+
+def lock_user(user_id):
+    """
+    Lock a user's row until the end of the transaction, serializing changes
+    to the user's progress entries and streak state
+    """
+    list(AccountUser.objects.select_for_update().filter(pk=user_id).values_list('pk'))
+
+
+class ProgressManager(models.Manager):
+    """
+    Custom Progress manager
+    """
+    def create_with_sets(self, user, entries, count_days=True):
+        """
+        Create progress entries with their sets in one transaction. Entries are dicts of
+        progress fields with a list of set field dicts under 'sets', the created sets are
+        kept on each progress entry's sets attribute. Entries and sets are inserted in
+        bulk and the streak, records and calendars are updated once for the batch. Callers
+        writing many batches can leave counting the days to TrainingStreak.add_days
+        """
+        with transaction.atomic():
+            progress_list = []
+            for entry in entries:
+                fields = dict(entry)
+                sets = fields.pop('sets', None) or []
+                fields.update(summarize_sets(
+                    (set_fields.get('reps'), set_fields.get('weight'), set_fields.get('duration'))
+                    for set_fields in sets))
+                progress_list.append(Progress(user_id=user.pk, **fields))
+
+            # bulk inserts don't return ids on this Django version, every insert of an entry
+            # locks its user (see Progress.save) so no other entry of theirs can commit
+            # meanwhile, and their entries past the last id are the new ones
+            lock_user(user.pk)
+            last = self.aggregate(last=Max('id'))['last'] or 0
+            self.bulk_create(progress_list)
+            progress_list = list(self.filter(user_id=user.pk, id__gt=last).order_by('id'))
+            if len(progress_list) != len(entries):
+                raise RuntimeError('Expected %d new progress entries, found %d' % (len(entries), len(progress_list)))
+            bump_count_version(Progress, user.pk)
+
+            Set.objects.bulk_create([
+                Set(progress=progress, user_id=user.pk, **set_fields)
+                for progress, entry in zip(progress_list, entries)
+                for set_fields in entry.get('sets', [])
+            ])
+            bump_count_version(Set, user.pk)
+
+            # read the sets back for their ids
+            sets = {}
+            for instance in Set.objects.filter(progress__in=progress_list).order_by('id'):
+                sets.setdefault(instance.progress_id, []).append(instance)
+            for progress in progress_list:
+                progress.sets = sets.get(progress.id, [])
+                for instance in progress.sets:
+                    instance.progress = progress
+
+            # bulk inserted rows send no signals
+            PersonalRecord.objects.update_for_sets(
+                instance for progress in progress_list for instance in progress.sets)
+            if count_days:
+                TrainingStreak.objects.add_days(user.pk, [progress.date for progress in progress_list])
+            for date in set(progress.date.replace(day=1) for progress in progress_list):
+                invalidate_calendar(user.pk, date)
+
+        return progress_list
+
+
 class Progress(models.Model):
     """
     Track user progress for exercises completed
@@ -53,19 +184,627 @@ class Progress(models.Model):
     exercise = models.ForeignKey(Exercise)
     user = models.ForeignKey(AccountUser)
     date = models.DateField(auto_now_add=False)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    # summary of the entry's sets, kept up to date as its sets change
+    set_count = models.IntegerField(default=0)
+    total_reps = models.IntegerField(default=0)
+    total_volume = models.IntegerField(default=0)
+    top_weight = models.IntegerField(null=True)
+    total_duration = models.IntegerField(default=0)
+
+    objects = ProgressManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the loaded user and date to invalidate the calendar of the old month after a change
+        """
+        instance = super(Progress, cls).from_db(db, field_names, values)
+        instance.loaded_day = (instance.user_id, instance.date)
+        return instance
 
     class Meta:
-        ordering = ['date', 'exercise']
+        # ordering by the exercise id instead of its name keeps the
+        # exercises out of list queries so the index covers the sort
+        ordering = ['date', 'exercise_id']
+        index_together = [
+            ('user', 'date', 'exercise'),
+            ('user', 'date_updated'),
+            ('user', 'set_count'),
+            ('user', 'total_volume'),
+            ('user', 'top_weight'),
+        ]
 
     def __str__(self):
         return ('%s - %s' % (self.exercise, self.date.strftime('%m/%d/%Y')))
 
+    def save(self, *args, **kwargs):
+        """
+        Insert with the user locked like create_with_sets does, so a bulk insert
+        reading its rows back by id never sees this one. Leave the summary out of
+        updates, it's only written by update_summary so the copy loaded with the
+        entry doesn't undo sets changed meanwhile
+        """
+        if self._state.adding:
+            with transaction.atomic():
+                lock_user(self.user_id)
+                super(Progress, self).save(*args, **kwargs)
+            return
+
+        if not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in PROGRESS_SUMMARY_FIELDS]
+        super(Progress, self).save(*args, **kwargs)
+
+    def add_sets(self, entries, replace=False):
+        """
+        Add sets from dicts of set fields with one insert, replacing all of the
+        entry's sets with one delete if asked. Returns all sets of the entry
+        """
+        with transaction.atomic():
+            held = replace and self.delete_sets()
+
+            Set.objects.bulk_create([Set(progress=self, user_id=self.user_id, **fields) for fields in entries])
+            bump_count_version(Set, self.user_id)
+
+            sets = list(self.set_set.order_by('id'))
+            # bulk inserted sets send no signals
+            self.update_summary([(instance.reps, instance.weight, instance.duration) for instance in sets])
+            if held:
+                PersonalRecord.objects.recompute(self.user_id, self.exercise_id)
+            else:
+                PersonalRecord.objects.update_for_sets(sets)
+            invalidate_calendar(self.user_id, self.date)
+
+        return sets
+
+    def delete_sets(self):
+        """
+        Delete all of the entry's sets with one statement and leave their
+        tombstones, returns whether any of them held a personal record
+        """
+        deleted = list(self.set_set.values_list('id', flat=True))
+        if not deleted:
+            return False
+
+        # QuerySet.delete() would load the sets and send the delete signals of each one,
+        # _raw_delete (private API, check it on Django upgrades) sends none. The work of
+        # set_pre_delete and set_post_delete is done here once for all sets or by add_sets
+        # and progress_pre_delete:
+        #   records held by the sets: unlinked here, recomputed by the caller
+        #   tombstones and cached set counts: recorded and invalidated here
+        #   summary and calendar: updated by the caller
+        held = PersonalRecord.objects.filter(set__in=deleted).update(set=None)
+        Set.objects.filter(pk__in=deleted)._raw_delete(Set.objects.db)
+        Tombstone.objects.record_many(Set, deleted, self.user_id)
+        bump_count_version(Set, self.user_id)
+        return held > 0
+
+    def update_summary(self, sets=None):
+        """
+        Store the summary of the entry's sets, given as (reps, weight, duration)
+        or read with the entry's row locked against concurrent set changes
+        """
+        with transaction.atomic():
+            if sets is None:
+                list(Progress.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+                sets = self.set_set.values_list('reps', 'weight', 'duration')
+
+            summary = summarize_sets(sets)
+            for field, value in summary.items():
+                setattr(self, field, value)
+            self.date_updated = timezone.now()
+            # an update sends no signals, the summary changes nothing else but the counts filtered by it
+            Progress.objects.filter(pk=self.pk).update(date_updated=self.date_updated, **summary)
+            bump_count_version(Progress, self.user_id)
+
 
 class Set(models.Model):
     """
-    Dynamic sets for each progress
+    Dynamic sets for each progress, with the user of their progress entry
+    so a user's sets are found without going through their entries
     """
-    progress = models.ForeignKey(Progress)
+    # deleted with their progress entry in bulk, see progress_pre_delete
+    progress = models.ForeignKey(Progress, on_delete=models.DO_NOTHING)
+    user = models.ForeignKey(AccountUser, on_delete=models.DO_NOTHING)
     duration = models.IntegerField(null=True)
     reps = models.IntegerField(null=True)
     weight = models.IntegerField(null=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = [('user', 'date_updated', 'id')]
+
+    def save(self, *args, **kwargs):
+        """
+        Take the user of the progress entry, bulk inserts are given it by their callers
+        """
+        if self.user_id is None:
+            self.user_id = self.progress.user_id
+        super(Set, self).save(*args, **kwargs)
+
+
+cache_counts(Progress, Set)
+
+
+class ProgressImport(models.Model):
+    """
+    Csv file of workout history imported in the background, with the counters
+    of the rows read so far for polling and a report of skipped rows. The file
+    is kept in the database in chunks, the worker reading it runs on another
+    machine than the web process it was uploaded to, and dropped once imported
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(AccountUser)
+    file_name = models.CharField(max_length=255, blank=True)
+    dry_run = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    rows = models.IntegerField(default=0)
+    progress_created = models.IntegerField(default=0)
+    sets_created = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    errors = models.TextField(blank=True)
+    unknown_exercises = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-date_created']
+
+    def __str__(self):
+        return ('%s - %s' % (self.file_name, self.status))
+
+    def read_chunks(self):
+        """
+        Chunks of the file in order, read one query at a time so only one is held in memory
+        """
+        for pk in self.chunks.order_by('index').values_list('pk', flat=True):
+            yield bytes(ProgressImportChunk.objects.values_list('data', flat=True).get(pk=pk))
+
+
+class ProgressImportChunk(models.Model):
+    """
+    Consecutive part of the csv file of a progress import
+    """
+    progress_import = models.ForeignKey(ProgressImport, related_name='chunks')
+    index = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ('progress_import', 'index')
+
+
+RECORD_KINDS = (
+    ('weight', 'Heaviest weight'),
+    ('reps', 'Most reps'),
+    ('volume', 'Most volume in a set'),
+)
+
+
+def record_value(kind, reps, weight):
+    """
+    Value of a set for a kind of personal record, None if the set doesn't count
+    """
+    if kind == 'weight':
+        return weight
+    if kind == 'reps':
+        return reps
+    if reps is None or weight is None:
+        return None
+    return reps * weight
+
+
+class PersonalRecordManager(models.Manager):
+    """
+    Custom PersonalRecord manager
+    """
+    def update_for_sets(self, sets):
+        """
+        Raise the records of the users and exercises of saved sets, sets are
+        expected to have their progress entry loaded. Records held by a set
+        that no longer qualifies are recomputed from history. The users are
+        locked so concurrent saves don't both insert a user's first record
+        """
+        sets = list(sets)
+        if not sets:
+            return
+
+        with transaction.atomic():
+            self.raise_records(sets)
+
+    def raise_records(self, sets):
+        """
+        Raise the records of saved sets, called in a transaction
+        """
+        pairs = set((s.progress.user_id, s.progress.exercise_id) for s in sets)
+        for user_id in sorted(set(user_id for user_id, _ in pairs)):
+            lock_user(user_id)
+
+        condition = Q()
+        for user_id, exercise_id in pairs:
+            condition |= Q(user_id=user_id, exercise_id=exercise_id)
+        records = dict(((r.user_id, r.exercise_id, r.kind), r) for r in self.filter(condition))
+
+        changed = {}
+        recompute = set()
+        for instance in sets:
+            progress = instance.progress
+            for kind, _ in RECORD_KINDS:
+                key = (progress.user_id, progress.exercise_id, kind)
+                value = record_value(kind, instance.reps, instance.weight)
+                record = records.get(key)
+
+                if record is not None and record.set_id == instance.id and (value is None or value < record.value):
+                    recompute.add(key[:2])
+                elif value is not None and (record is None or value > record.value):
+                    if record is None:
+                        record = records[key] = PersonalRecord(
+                            user_id=progress.user_id, exercise_id=progress.exercise_id, kind=kind)
+                    record.value = value
+                    record.set = instance
+                    record.date = progress.date
+                    changed[key] = record
+
+        for key, record in changed.items():
+            if key[:2] not in recompute:
+                record.save()
+        for user_id, exercise_id in recompute:
+            self.rebuild(user_id, exercise_id)
+
+    def recompute(self, user_id, exercise_id):
+        """
+        Rebuild the records of a user's exercise from all of its sets, with the
+        user locked against concurrent rebuilds inserting the same records
+        """
+        with transaction.atomic():
+            lock_user(user_id)
+            self.rebuild(user_id, exercise_id)
+
+    def rebuild(self, user_id, exercise_id):
+        """
+        Rebuild the records of a user's exercise, called with the user locked
+        """
+        sets = Set.objects.filter(user=user_id, progress__exercise=exercise_id).select_related('progress')
+
+        for kind, _ in RECORD_KINDS:
+            if kind == 'volume':
+                best = sets.filter(reps__isnull=False, weight__isnull=False).annotate(volume=F('reps') * F('weight'))
+            else:
+                best = sets.filter(**{'%s__isnull' % kind: False})
+            best = best.order_by('-%s' % kind, 'progress__date', 'id').first()
+
+            if best is None:
+                self.filter(user=user_id, exercise=exercise_id, kind=kind).delete()
+                continue
+
+            self.update_or_create(user_id=user_id, exercise_id=exercise_id, kind=kind, defaults={
+                'value': record_value(kind, best.reps, best.weight),
+                'set': best,
+                'date': best.progress.date,
+            })
+
+
+class PersonalRecord(models.Model):
+    """
+    A user's best set of an exercise for each kind of record, kept up to date
+    as sets are saved and deleted
+    """
+    user = models.ForeignKey(AccountUser)
+    exercise = models.ForeignKey(Exercise)
+    kind = models.CharField(max_length=10, choices=RECORD_KINDS)
+    value = models.IntegerField()
+    set = models.ForeignKey(Set, null=True, on_delete=models.SET_NULL)
+    date = models.DateField()
+
+    objects = PersonalRecordManager()
+
+    class Meta:
+        ordering = ['exercise', 'kind']
+        unique_together = ('user', 'exercise', 'kind')
+
+    def __str__(self):
+        return ('%s - %s %s' % (self.exercise, self.get_kind_display(), self.value))
+
+
+def week_start(date):
+    """
+    Monday of the week a date falls in
+    """
+    return date - datetime.timedelta(days=date.weekday())
+
+
+class TrainingStreakManager(models.Manager):
+    """
+    Custom TrainingStreak manager
+    """
+    def for_user(self, user_id):
+        """
+        Streak state of a user, computed from the history the first time
+        """
+        try:
+            return self.get(user_id=user_id)
+        except TrainingStreak.DoesNotExist:
+            return self.recompute(user_id)
+
+    def recompute(self, user_id):
+        """
+        Rebuild a user's streak state from all of their training days, users
+        without any are left without a stored state. The user is locked so
+        concurrent rebuilds don't both insert the state
+        """
+        with transaction.atomic():
+            lock_user(user_id)
+            self.filter(user_id=user_id).delete()
+            streak = TrainingStreak(user_id=user_id)
+            days = Progress.objects.filter(user_id=user_id).order_by('date').values_list('date', flat=True)
+            for date in days.distinct():
+                streak.add(date)
+            if streak.last_date is not None:
+                streak.save()
+        return streak
+
+    def add_days(self, user_id, dates):
+        """
+        Count training days of new progress entries, in constant time per day
+        when they extend the history and with a recompute for older days
+        """
+        dates = sorted(set(dates))
+        if not dates:
+            return
+        with transaction.atomic():
+            lock_user(user_id)
+            streak = self.filter(user_id=user_id).first()
+            if streak is None or (streak.last_date is not None and dates[0] < streak.last_date):
+                self.recompute(user_id)
+                return
+            for date in dates:
+                if date != streak.last_date:
+                    streak.add(date)
+            streak.save()
+
+    def remove_day(self, user_id, date):
+        """
+        Uncount the training day of a deleted progress entry when it was the
+        last entry of the day, in constant time at the end of a streak and
+        with a recompute otherwise
+        """
+        with transaction.atomic():
+            lock_user(user_id)
+            streak = self.filter(user_id=user_id).first()
+            if streak is None or Progress.objects.filter(user_id=user_id, date=date).exists():
+                return
+            if streak.pop(date):
+                streak.save()
+            else:
+                self.recompute(user_id)
+
+
+class TrainingStreak(models.Model):
+    """
+    Training streak state of a user kept up to date as progress entries are
+    logged, the days of the current streak run from current_start to
+    last_date and the weeks of the current weekly streak from
+    current_week_start to the week of last_date
+    """
+    user = models.OneToOneField(AccountUser, primary_key=True)
+    first_date = models.DateField(null=True)
+    last_date = models.DateField(null=True)
+    training_days = models.IntegerField(default=0)
+    current_start = models.DateField(null=True)
+    longest = models.IntegerField(default=0)
+    longest_end = models.DateField(null=True)
+    weeks_trained = models.IntegerField(default=0)
+    current_week_start = models.DateField(null=True)
+    longest_weeks = models.IntegerField(default=0)
+    longest_weeks_end = models.DateField(null=True)
+
+    objects = TrainingStreakManager()
+
+    def __str__(self):
+        return ('%s - %s days' % (self.user, self.longest))
+
+    @property
+    def current(self):
+        """
+        Days of the streak ending at the last training day
+        """
+        return (self.last_date - self.current_start).days + 1 if self.last_date else 0
+
+    @property
+    def current_weeks(self):
+        """
+        Weeks of the weekly streak ending at the week of the last training day
+        """
+        return (week_start(self.last_date) - self.current_week_start).days // 7 + 1 if self.last_date else 0
+
+    def add(self, date):
+        """
+        Count a training day after the last one
+        """
+        if self.last_date is None:
+            self.first_date = self.current_start = date
+            self.current_week_start = week_start(date)
+            self.weeks_trained = 1
+        else:
+            if date != self.last_date + datetime.timedelta(days=1):
+                self.current_start = date
+            week, last_week = week_start(date), week_start(self.last_date)
+            if week != last_week:
+                self.weeks_trained += 1
+                if week != last_week + datetime.timedelta(days=7):
+                    self.current_week_start = week
+        self.last_date = date
+        self.training_days += 1
+
+        # ties keep the earlier streak
+        if self.current > self.longest:
+            self.longest, self.longest_end = self.current, date
+        if self.current_weeks > self.longest_weeks:
+            self.longest_weeks, self.longest_weeks_end = self.current_weeks, week_start(date)
+
+    def pop(self, date):
+        """
+        Uncount the last training day when the day before was trained too and
+        neither longest streak ends with it, False when a recompute is needed
+        """
+        if date != self.last_date or self.current < 2 or self.longest_end == date:
+            return False
+
+        previous = date - datetime.timedelta(days=1)
+        if week_start(previous) != week_start(date):
+            if self.longest_weeks_end == week_start(date):
+                return False
+            self.weeks_trained -= 1
+        self.last_date = previous
+        self.training_days -= 1
+        return True
+
+    def stats(self, today):
+        """
+        Streaks and weekly consistency as of a day, streaks that ended before
+        yesterday or the last week are no longer current
+        """
+        current = current_weeks = 0
+        weeks = 0
+        if self.last_date is not None:
+            if self.last_date >= today - datetime.timedelta(days=1):
+                current = self.current
+            if week_start(self.last_date) >= week_start(today) - datetime.timedelta(days=7):
+                current_weeks = self.current_weeks
+            weeks = (week_start(today) - week_start(self.first_date)).days // 7 + 1
+
+        return {
+            'current_streak': current,
+            'longest_streak': self.longest,
+            'training_days': self.training_days,
+            'last_date': self.last_date,
+            'current_weekly_streak': current_weeks,
+            'longest_weekly_streak': self.longest_weeks,
+            'weeks_trained': self.weeks_trained,
+            'consistency': round(float(self.weeks_trained) / weeks, 2) if weeks > 0 else 0.0,
+        }
+
+
+@receiver(post_save, sender=Set)
+def set_post_save(sender, **kwargs):
+    """
+    Post save hook to update the summary of the set's progress entry, raise the
+    personal records of its exercise and invalidate the calendar of its month
+    """
+    instance = kwargs['instance']
+    instance.progress.update_summary()
+    PersonalRecord.objects.update_for_sets([instance])
+    invalidate_calendar(instance.progress.user_id, instance.progress.date)
+
+
+@receiver(pre_delete, sender=Set)
+def set_pre_delete(sender, **kwargs):
+    """
+    Pre delete hook to remember the records held by the set, before they are
+    unlinked, and the day of its progress entry
+    """
+    instance = kwargs['instance']
+    instance.record_pairs = set(PersonalRecord.objects.filter(set=instance).values_list('user', 'exercise'))
+    instance.day = (instance.progress.user_id, instance.progress.date)
+
+
+@receiver(post_delete, sender=Set)
+def set_post_delete(sender, **kwargs):
+    """
+    Post delete hook to update the summary of the set's progress entry, recompute the
+    records that were held by the set, invalidate the calendar of its month and
+    leave a tombstone for syncing clients
+    """
+    instance = kwargs['instance']
+    instance.progress.update_summary()
+    for user_id, exercise_id in getattr(instance, 'record_pairs', ()):
+        PersonalRecord.objects.recompute(user_id, exercise_id)
+    if hasattr(instance, 'day'):
+        invalidate_calendar(*instance.day)
+        Tombstone.objects.record(instance, instance.day[0])
+
+
+@receiver(post_save, sender=Progress)
+def progress_post_save(sender, **kwargs):
+    """
+    Post save hook to move the sets of a progress entry to its user and their
+    records when its user, exercise or date changes
+    """
+    if kwargs['created']:
+        return
+
+    instance = kwargs['instance']
+    loaded_day = getattr(instance, 'loaded_day', None)
+    if loaded_day and loaded_day[0] != instance.user_id:
+        instance.set_set.update(user=instance.user_id, date_updated=timezone.now())
+
+    pairs = set(PersonalRecord.objects.filter(set__progress=instance).values_list('user', 'exercise'))
+    for user_id, exercise_id in pairs:
+        PersonalRecord.objects.recompute(user_id, exercise_id)
+    if (instance.user_id, instance.exercise_id) not in pairs:
+        PersonalRecord.objects.update_for_sets(instance.set_set.all())
+
+
+@receiver(post_save, sender=Progress)
+def progress_streak_saved(sender, **kwargs):
+    """
+    Post save hook to count the training day of a new progress entry, or move
+    it when the entry changed its user or date
+    """
+    instance = kwargs['instance']
+    loaded_day = getattr(instance, 'loaded_day', None)
+    if kwargs['created'] or loaded_day != (instance.user_id, instance.date):
+        if not kwargs['created'] and loaded_day:
+            TrainingStreak.objects.remove_day(*loaded_day)
+        TrainingStreak.objects.add_days(instance.user_id, [instance.date])
+
+
+@receiver(pre_delete, sender=Progress)
+def progress_pre_delete(sender, **kwargs):
+    """
+    Pre delete hook to delete the sets of a progress entry in bulk and recompute
+    the records they held once, instead of the delete hooks of each set. The
+    summary of an entry that is going away isn't updated
+    """
+    instance = kwargs['instance']
+    if instance.delete_sets():
+        PersonalRecord.objects.recompute(instance.user_id, instance.exercise_id)
+
+
+@receiver(post_delete, sender=Progress)
+def progress_streak_deleted(sender, **kwargs):
+    """
+    Post delete hook to uncount the training day of a progress entry
+    """
+    instance = kwargs['instance']
+    TrainingStreak.objects.remove_day(instance.user_id, instance.date)
+
+
+@receiver(post_save, sender=Progress)
+@receiver(post_delete, sender=Progress)
+def progress_calendar_changed(sender, **kwargs):
+    """
+    Post save/delete hook to invalidate the calendars of the progress entry's month and the month it moved from
+    """
+    instance = kwargs['instance']
+    invalidate_calendar(instance.user_id, instance.date)
+    loaded_day = getattr(instance, 'loaded_day', None)
+    if loaded_day and loaded_day != (instance.user_id, instance.date):
+        invalidate_calendar(*loaded_day)
+    instance.loaded_day = (instance.user_id, instance.date)
+
+
+@receiver(post_delete, sender=Progress)
+def progress_post_delete(sender, **kwargs):
+    """
+    Post delete hook to leave a tombstone for syncing clients
+    """
+    instance = kwargs['instance']
+    Tombstone.objects.record(instance, instance.user_id)
@@ -1,8 +1,14 @@
+from django.db import transaction
+
 from rest_framework import serializers
 
+from ..core.fields import PrefetchedPrimaryKeyRelatedField
 from ..core.validators import FutureDateValidator
+from ..exercises.models import Exercise
 
-from .models import DayOfWeek, Routine, Progress, Set
+from .models import (
+    DayOfWeek, Routine, Progress, Set, PersonalRecord, ProgressImport, ProgressImportChunk, PROGRESS_SUMMARY_FIELDS
+)
 
 
 class DayOfWeekSerializer(serializers.ModelSerializer):
@@ -31,21 +37,135 @@ class RoutineSerializer(serializers.ModelSerializer):
         exclude = ('user', )
 
 
+class RoutineExerciseSerializer(serializers.ModelSerializer):
+    """
+    Exercises embedded in a routine
+    """
+    category = serializers.StringRelatedField()
+
+    class Meta:
+        model = Exercise
+        fields = ('id', 'name', 'category')
+
+
+class ExpandedPublicRoutineSerializer(PublicRoutineSerializer):
+    """
+    Publically shared routine with its exercises embedded
+    """
+    exercises = RoutineExerciseSerializer(many=True, read_only=True)
+
+
+class ExpandedRoutineSerializer(RoutineSerializer):
+    """
+    User custom routine with its exercises embedded
+    """
+    exercises = RoutineExerciseSerializer(many=True, read_only=True)
+
+
 class SetSerializer(serializers.ModelSerializer):
     """
-    Sub serializer for sets that belong to progress
+    Sub serializer for sets that belong to progress, the progress entry is taken from the url
     """
     class Meta:
         model = Set
         fields = ('id', 'progress', 'reps', 'weight', 'duration')
+        read_only_fields = ('progress', )
 
 
 class ProgressSerializer(serializers.ModelSerializer):
     """
-    User progress serializer
+    User progress serializer, the summary of the entry's sets is read only
     """
     date = serializers.DateField(validators=[FutureDateValidator()])
 
     class Meta:
         model = Progress
-        fields = ('id', 'date', 'exercise')
+        fields = ('id', 'date', 'exercise') + PROGRESS_SUMMARY_FIELDS
+        read_only_fields = PROGRESS_SUMMARY_FIELDS
+
+
+class ProgressSetSerializer(serializers.ModelSerializer):
+    """
+    Sets nested in a progress entry
+    """
+    class Meta:
+        model = Set
+        fields = ('id', 'reps', 'weight', 'duration')
+
+
+class ExpandedProgressSerializer(ProgressSerializer):
+    """
+    Progress entry with its sets embedded, the sets are expected to be
+    prefetched on each entry's sets attribute
+    """
+    sets = ProgressSetSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Progress
+        fields = ('id', 'date', 'exercise') + PROGRESS_SUMMARY_FIELDS + ('sets', )
+        read_only_fields = PROGRESS_SUMMARY_FIELDS
+
+
+class BulkProgressSerializer(ProgressSerializer):
+    """
+    Progress entry with its sets for logging a whole workout at once, exercises
+    are looked up in the exercises prefetched into the context
+    """
+    exercise = PrefetchedPrimaryKeyRelatedField(queryset=Exercise.objects.all())
+    sets = ProgressSetSerializer(many=True, required=False)
+
+    class Meta:
+        model = Progress
+        fields = ('id', 'date', 'exercise') + PROGRESS_SUMMARY_FIELDS + ('sets', )
+        read_only_fields = PROGRESS_SUMMARY_FIELDS
+
+
+class PersonalRecordSerializer(serializers.ModelSerializer):
+    """
+    User personal records serializer
+    """
+    class Meta:
+        model = PersonalRecord
+        fields = ('id', 'exercise', 'kind', 'value', 'date', 'set')
+
+
+class ProgressImportSerializer(serializers.ModelSerializer):
+    """
+    Progress csv import serializer, everything but the file and dry run flag is reported back.
+    The uploaded file is stored with the import in chunks for the worker to read
+    """
+    file = serializers.FileField(write_only=True)
+    row_errors = serializers.SerializerMethodField()
+    unknown_exercises = serializers.SerializerMethodField()
+
+    # largest csv file accepted and size of its stored chunks in bytes
+    max_file_size = 200 * 1024 * 1024
+    chunk_size = 1024 * 1024
+
+    class Meta:
+        model = ProgressImport
+        fields = ('id', 'file', 'file_name', 'dry_run', 'status', 'rows', 'progress_created', 'sets_created',
+                  'skipped', 'row_errors', 'unknown_exercises', 'date_created', 'date_finished')
+        read_only_fields = ('file_name', 'status', 'rows', 'progress_created', 'sets_created', 'skipped',
+                            'date_finished')
+
+    def validate_file(self, value):
+        if value.size > self.max_file_size:
+            raise serializers.ValidationError('The file is larger than %d MB' % (self.max_file_size // 1024 // 1024))
+        return value
+
+    def create(self, validated_data):
+        # large uploads are spooled to disk and copied over a chunk at a time
+        upload = validated_data.pop('file')
+        validated_data['file_name'] = upload.name
+        with transaction.atomic():
+            progress_import = super(ProgressImportSerializer, self).create(validated_data)
+            for index, chunk in enumerate(upload.chunks(self.chunk_size)):
+                ProgressImportChunk.objects.create(progress_import=progress_import, index=index, data=chunk)
+        return progress_import
+
+    def get_row_errors(self, obj):
+        return obj.errors.splitlines()
+
+    def get_unknown_exercises(self, obj):
+        return obj.unknown_exercises.splitlines()
@@ -0,0 +1,37 @@
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from celery import task
+
+from .imports import import_progress_csv
+from .models import ProgressImport
+
+# counters of an import updated in the database after each chunk
+IMPORT_COUNTERS = ['rows', 'progress_created', 'sets_created', 'skipped']
+
+
+@task()
+def import_progress(import_id, chunk_size=1000):
+    """
+    Async task to import the csv file of a progress import
+    """
+    progress_import = ProgressImport.objects.get(pk=import_id)
+    ProgressImport.objects.filter(pk=import_id).update(status='running')
+
+    try:
+        import_progress_csv(progress_import, chunk_size)
+        progress_import.status = 'done'
+    except ValueError as e:
+        # unreadable files are reported on the import, with the counters of the chunks written before
+        progress_import.refresh_from_db(fields=IMPORT_COUNTERS)
+        progress_import.status = 'failed'
+        progress_import.errors = force_text(e)
+    except Exception:
+        progress_import.refresh_from_db(fields=IMPORT_COUNTERS)
+        progress_import.status = 'failed'
+        raise
+    finally:
+        progress_import.date_finished = timezone.now()
+        progress_import.save()
+        # the file can't be imported again
+        progress_import.chunks.all().delete()
@@ -0,0 +1,142 @@
+import datetime
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from ...core.tests import BaseTestCase
+from ...exercises.models import Exercise
+
+from ..models import Progress, Set, PersonalRecord, ProgressImport, ProgressImportChunk, TrainingStreak
+from ..tasks import import_progress
+
+HISTORY = b'''Date,Exercise Name,Weight,Reps,Notes
+2016-03-01 10:00:00,Squats,100,5,
+2016-03-01 10:00:00,Squats,110,5,
+2016-03-01 10:00:00,lunges,20,10,
+2016-03-03,Squats,120,3,
+2016-03-03,Bench Press,60,8,
+03/04/2016,Squats,100,5,
+2016-03-05,Squats,heavy,5,
+2016-03-06,Squats,,,
+'''
+
+
+class ProgressImportTest(BaseTestCase):
+    def setUp(self):
+        super(ProgressImportTest, self).setUp()
+        self.squats = Exercise.objects.create(name='squats', description='squat', )
+        self.lunges = Exercise.objects.create(name='Lunges', description='lunge', )
+        self.authenticate(self.user_basic)
+
+    def upload(self, content, dry_run=False):
+        response = self.client.post(reverse('v1:progress-import-list'), {
+            'file': SimpleUploadedFile('history.csv', content, content_type='text/csv'),
+            'dry_run': dry_run,
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'pending')
+        return response.data['id']
+
+    def test_import(self):
+        """
+        Ensure rows are imported in chunks as progress entries with their sets and skipped rows are reported
+        """
+        import_id = self.upload(HISTORY)
+        import_progress(import_id, chunk_size=2)
+        response = self.client.get(reverse('v1:progress-import-detail', args=(import_id,)))
+
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual((response.data['rows'], response.data['skipped']), (8, 3))
+        self.assertEqual((response.data['progress_created'], response.data['sets_created']), (4, 4))
+        self.assertEqual(response.data['unknown_exercises'], ['Bench Press'])
+        self.assertEqual(response.data['row_errors'], ['line 7: invalid date: 03/04/2016',
+                                                       'line 8: weight is not a number: heavy'])
+
+        progress = Progress.objects.filter(user=self.user)
+        self.assertEqual([(entry.date.day, entry.exercise_id, entry.set_set.count()) for entry in progress], [
+            (1, self.squats.id, 2),
+            (1, self.lunges.id, 1),
+            (3, self.squats.id, 1),
+            (6, self.squats.id, 0),
+        ])
+        self.assertEqual(PersonalRecord.objects.get(user=self.user, exercise=self.squats, kind='weight').value, 120)
+
+    def test_streak(self):
+        """
+        Ensure the training days of a back-dated history are counted once after the chunks are written
+        """
+        Progress.objects.create(user=self.user, exercise=self.squats, date=datetime.date(2016, 3, 10))
+        import_id = self.upload(HISTORY)
+
+        import_progress(import_id, chunk_size=1)
+        streak = TrainingStreak.objects.get(user=self.user)
+
+        self.assertEqual((streak.first_date, streak.last_date, streak.training_days),
+                         (datetime.date(2016, 3, 1), datetime.date(2016, 3, 10), 4))
+        self.assertFalse(ProgressImportChunk.objects.filter(progress_import=import_id).exists())
+
+    def test_chunked_file(self):
+        """
+        Ensure a file stored in chunks is read back row by row, with rows split across chunks
+        """
+        content = HISTORY.replace(b'\n', b'\r\n') + b'2016-03-07,Squats,inf,5,\r\n'
+        progress_import = ProgressImport.objects.create(user=self.user, file_name='history.csv')
+        for index, start in enumerate(range(0, len(content), 7)):
+            ProgressImportChunk.objects.create(progress_import=progress_import, index=index,
+                                               data=content[start:start + 7])
+
+        import_progress(progress_import.id, chunk_size=2)
+        progress_import = ProgressImport.objects.get(pk=progress_import.id)
+
+        self.assertEqual(progress_import.status, 'done')
+        self.assertEqual((progress_import.rows, progress_import.skipped), (9, 4))
+        self.assertEqual((progress_import.progress_created, progress_import.sets_created), (4, 4))
+        self.assertEqual(progress_import.errors.splitlines()[-1], 'line 10: weight is not a number: inf')
+
+    def test_undecodable_file(self):
+        """
+        Ensure an import failing part way reports the rows written before
+        """
+        import_id = self.upload(HISTORY[:HISTORY.index(b'2016-03-03,Bench')] + b'2016-03-04,Squats\xff,1,1,\n')
+        import_progress(import_id, chunk_size=1)
+        progress_import = ProgressImport.objects.get(pk=import_id)
+
+        self.assertEqual(progress_import.status, 'failed')
+        self.assertEqual((progress_import.progress_created, progress_import.sets_created), (2, 3))
+        self.assertEqual(Progress.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(TrainingStreak.objects.get(user=self.user).training_days, 1)
+
+    def test_dry_run(self):
+        """
+        Ensure a dry run reports what would be imported without writing
+        """
+        import_id = self.upload(HISTORY, dry_run=True)
+        import_progress(import_id)
+        progress_import = ProgressImport.objects.get(pk=import_id)
+
+        self.assertEqual((progress_import.progress_created, progress_import.sets_created), (4, 4))
+        self.assertEqual(Progress.objects.count(), 0)
+        self.assertEqual(Set.objects.count(), 0)
+
+    def test_invalid_file(self):
+        """
+        Ensure a file without the needed columns fails with a reason
+        """
+        import_id = self.upload(b'when,what\n2016-03-01,squats\n')
+        import_progress(import_id)
+        response = self.client.get(reverse('v1:progress-import-detail', args=(import_id,)))
+
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertEqual(response.data['row_errors'], ['The csv file needs a date and an exercise column'])
+
+    def test_other_users_imports(self):
+        """
+        Ensure imports are only visible to their user
+        """
+        import_id = self.upload(HISTORY)
+        self.authenticate(self.user_admin)
+        response = self.client.get(reverse('v1:progress-import-detail', args=(import_id,)))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
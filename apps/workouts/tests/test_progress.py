@@ -1,12 +1,22 @@
 import datetime
+import importlib
+import json
+import re
+
+from django.apps import apps
+from django.core.management import call_command
+from django.utils.six import StringIO
 
 from rest_framework import status
 from rest_framework.reverse import reverse
 
+from ...core.pagination import CountingPaginator
+from ...accounts.models import AccountUser
 from ...core.tests import BaseTestCase
 from ...exercises.models import Exercise
 
-from ..models import Progress
+from ...core.models import Tombstone
+from ..models import PersonalRecord, Progress, Set, TrainingStreak
 
 
 class ProgressTest(BaseTestCase):
@@ -131,3 +141,463 @@ class ProgressTest(BaseTestCase):
         self.assertNotEqual(patched_progress.date, '2015-01-01')
         self.assertEqual(progress.date, datetime.date.today())
         self.assertEqual(Progress.objects.count(), 1)
+
+    def test_keyset_pagination(self):
+        """
+        Ensure all progress entries can be walked in (date, id) order with cursor links
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        self.authenticate(self.user_basic)
+        today = datetime.date.today()
+        for i in range(25):
+            Progress.objects.create(user=self.user, exercise=exercise, date=today - datetime.timedelta(days=i % 7))
+        expected = list(Progress.objects.order_by('date', 'id').values_list('id', flat=True))
+
+        seen = []
+        url = reverse('v1:progress-list') + '?cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(response.has_header('X-Total-Count'))
+            seen.extend(entry['id'] for entry in response.data)
+            links = dict((rel, link) for link, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', response.get('Link', '')))
+            url = links.get('next')
+
+        previous = self.client.get(links['prev'])
+
+        self.assertEqual(seen, expected)
+        self.assertEqual([entry['id'] for entry in previous.data], expected[10:20])
+
+    def test_total_count(self):
+        """
+        Ensure the total count is cached until the user's progress entries change
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        self.authenticate(self.user_basic)
+        for i in range(3):
+            Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date.today())
+
+        with self.assertNumQueries(3):
+            first = self.client.get(reverse('v1:progress-list'))
+        with self.assertNumQueries(2):
+            cached = self.client.get(reverse('v1:progress-list'))
+
+        # other users' entries don't change the count
+        Progress.objects.create(user=AccountUser.objects.get(username=self.user_admin), exercise=exercise,
+                                date=datetime.date.today())
+        with self.assertNumQueries(2):
+            self.client.get(reverse('v1:progress-list'))
+
+        Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date.today())
+        changed = self.client.get(reverse('v1:progress-list'))
+
+        self.assertEqual(first['X-Total-Count'], '3')
+        self.assertEqual(first['X-Total-Count-Type'], 'exact')
+        self.assertEqual(cached['X-Total-Count'], '3')
+        self.assertEqual(changed['X-Total-Count'], '4')
+
+    def test_expand_sets(self):
+        """
+        Ensure sets are embedded with a single extra query for a whole page
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        self.authenticate(self.user_basic)
+        for i in range(10):
+            progress = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date.today())
+            Set.objects.create(progress=progress, reps=i, weight=100)
+            Set.objects.create(progress=progress, reps=i, weight=110)
+
+        # authentication, count, page and sets
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('v1:progress-list'), {'expand': 'sets', 'per_page': 10})
+        detail = self.client.get(reverse('v1:progress-detail', args=(progress.id,)), {'expand': 'sets'})
+        plain = self.client.get(reverse('v1:progress-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 10)
+        self.assertTrue(all(len(entry['sets']) == 2 for entry in response.data))
+        self.assertEqual([item['weight'] for item in detail.data['sets']], [100, 110])
+        self.assertNotIn('sets', plain.data[0])
+
+    def test_list_query_plan(self):
+        """
+        Ensure listing progress entries by date range and exercise is served by an index
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        self.authenticate(self.user_basic)
+        Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date.today())
+
+        self.assertIndexed(reverse('v1:progress-list'), 'workouts_progress')
+        self.assertIndexed(reverse('v1:progress-list'), 'workouts_progress', {'min_date': '2016-01-01'})
+        self.assertIndexed(reverse('v1:progress-list'), 'workouts_progress', {'cursor': ''})
+
+    def test_total_count_threshold(self):
+        """
+        Counts over the exact threshold are still correct without planner estimates
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        self.authenticate(self.user_basic)
+        for i in range(5):
+            Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date.today())
+
+        threshold = CountingPaginator.exact_threshold
+        CountingPaginator.exact_threshold = 2
+        try:
+            response = self.client.get(reverse('v1:progress-list'))
+        finally:
+            CountingPaginator.exact_threshold = threshold
+
+        self.assertEqual(response['X-Total-Count'], '5')
+        self.assertEqual(response['X-Total-Count-Type'], 'exact')
+
+    def test_export(self):
+        """
+        Ensure all filtered progress entries are streamed with their sets
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        self.authenticate(self.user_basic)
+        today = datetime.date.today()
+        progress = Progress.objects.create(user=self.user, exercise=exercise, date=today)
+        Set.objects.create(progress=progress, reps=5, weight=100)
+        Set.objects.create(progress=progress, reps=3, weight=110)
+        Progress.objects.create(user=self.user, exercise=exercise, date=today - datetime.timedelta(days=1))
+        Progress.objects.create(user=self.user, exercise=exercise, date=today - datetime.timedelta(days=10))
+
+        url = reverse('v1:progress-export') + '?min_date=%s' % (today - datetime.timedelta(days=5))
+        response = self.client.get(url)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        csv_response = self.client.get(url + '&type=csv')
+        rows = b''.join(csv_response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(lines), 2)
+        self.assertEqual([row['reps'] for row in lines[0]['sets']], [5, 3])
+        self.assertEqual(lines[1]['sets'], [])
+        self.assertEqual(rows[0], 'id,date,exercise,exercise_name,set,reps,weight,duration')
+        self.assertEqual(len(rows), 4)
+
+    def test_volume(self):
+        """
+        Ensure volume is aggregated per exercise and period within the date bounds
+        """
+        squats = Exercise.objects.create(name='squats', description='squat', )
+        lunges = Exercise.objects.create(name='lunges', description='lunge', )
+        monday = datetime.date(2016, 3, 7)
+
+        self.authenticate(self.user_basic)
+        for date, exercise, sets in [
+                (monday, squats, [(5, 100), (5, 120)]),
+                (monday + datetime.timedelta(days=2), squats, [(3, 130)]),
+                (monday + datetime.timedelta(days=2), lunges, [(10, 20)]),
+                (monday + datetime.timedelta(days=7), squats, [(5, 100)]),
+                (monday + datetime.timedelta(days=8), squats, [])]:
+            progress = Progress.objects.create(user=self.user, exercise=exercise, date=date)
+            for reps, weight in sets:
+                Set.objects.create(progress=progress, reps=reps, weight=weight)
+
+        with self.assertNumQueries(2):
+            weekly = self.client.get(reverse('v1:progress-volume'))
+        daily = self.client.get(reverse('v1:progress-volume'), {'period': 'day', 'exercise': squats.id})
+        bounded = self.client.get(reverse('v1:progress-volume'), {'period': 'month', 'max_date': str(monday)})
+        invalid = self.client.get(reverse('v1:progress-volume'), {'period': 'year'})
+
+        self.assertEqual(weekly.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['period'], row['exercise'], row['volume'], row['reps'], row['sets'], row['max_weight'])
+                          for row in weekly.data], [
+            (monday, squats.id, 1490, 13, 3, 130),
+            (monday, lunges.id, 200, 10, 1, 20),
+            (monday + datetime.timedelta(days=7), squats.id, 500, 5, 1, 100),
+        ])
+        self.assertEqual([row['volume'] for row in daily.data], [1100, 390, 500])
+        self.assertEqual([(row['period'], row['volume']) for row in bounded.data], [(datetime.date(2016, 3, 1), 1100)])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_strength(self):
+        """
+        Ensure the strength trend of an exercise is computed per session
+        """
+        squats = Exercise.objects.create(name='squats', description='squat', )
+        lunges = Exercise.objects.create(name='lunges', description='lunge', )
+        first = datetime.date(2016, 3, 1)
+
+        self.authenticate(self.user_basic)
+        for days, exercise, sets in [
+                (0, squats, [(5, 100), (1, 120)]),
+                (2, squats, [(10, 90)]),
+                (4, squats, [(3, 90)]),
+                (4, lunges, [(1, 500)])]:
+            date = first + datetime.timedelta(days)
+            progress = Progress.objects.create(user=self.user, exercise=exercise, date=date)
+            for reps, weight in sets:
+                Set.objects.create(progress=progress, reps=reps, weight=weight)
+
+        response = self.client.get(reverse('v1:progress-strength'), {'exercise': squats.id, 'window': 2})
+        invalid = self.client.get(reverse('v1:progress-strength'), {'exercise': squats.id, 'formula': 'lander'})
+        missing = self.client.get(reverse('v1:progress-strength'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['e1rm'], row['best'], row['rolling_max'], row['slope']) for row in response.data], [
+            (120.0, 120.0, 120.0, None),
+            (120.0, 120.0, 120.0, 0.0),
+            (99.0, 120.0, 120.0, -10.5),
+        ])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(missing.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_strength_benchmark(self):
+        """
+        Ensure the strength benchmark command runs
+        """
+        out = StringIO()
+        call_command('benchmark_strength', '--sizes', '100,1000', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+    def test_calendar(self):
+        """
+        Ensure a month's training days are summarized and cached until progress of the month changes
+        """
+        squats = Exercise.objects.create(name='squats', description='squat', )
+        lunges = Exercise.objects.create(name='lunges', description='lunge', )
+        first = datetime.date(2016, 3, 1)
+
+        self.authenticate(self.user_basic)
+        for date, exercise, sets in [
+                (first, squats, [(5, 100), (5, 110)]),
+                (first, lunges, [(10, 20)]),
+                (datetime.date(2016, 3, 31), squats, []),
+                (datetime.date(2016, 4, 1), squats, [(1, 150)])]:
+            progress = Progress.objects.create(user=self.user, exercise=exercise, date=date)
+            for reps, weight in sets:
+                Set.objects.create(progress=progress, reps=reps, weight=weight)
+
+        url = reverse('v1:progress-calendar')
+        with self.assertNumQueries(2):
+            march = self.client.get(url, {'month': '2016-03'})
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, {'month': '2016-03'})
+
+        progress.date = datetime.date(2016, 3, 2)
+        progress.save()
+        moved = self.client.get(url, {'month': '2016-03'})
+        Set.objects.filter(progress=progress).delete()
+        deleted = self.client.get(url, {'month': '2016-03'})
+        invalid = self.client.get(url, {'month': 'march'})
+
+        self.assertEqual([(day['date'], day['exercises'], day['sets'], day['volume']) for day in march.data], [
+            (first, 2, 3, 1250),
+            (datetime.date(2016, 3, 31), 1, 0, 0),
+        ])
+        self.assertEqual(cached.data, march.data)
+        self.assertEqual([(day['date'], day['volume']) for day in moved.data][1], (datetime.date(2016, 3, 2), 150))
+        self.assertEqual([(day['date'], day['sets']) for day in deleted.data][1], (datetime.date(2016, 3, 2), 0))
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create(self):
+        """
+        Ensure a workout of progress entries and sets is logged in one request
+        """
+        squats = Exercise.objects.create(name='squats', description='squat', )
+        lunges = Exercise.objects.create(name='lunges', description='lunge', )
+
+        self.authenticate(self.user_basic)
+        today = str(datetime.date.today())
+        entries = [
+            {'date': today, 'exercise': squats.id, 'sets': [{'reps': 5, 'weight': 100}, {'reps': 5, 'weight': 110}]},
+            {'date': today, 'exercise': lunges.id, 'sets': [{'reps': 10, 'weight': 20}]},
+            {'date': today, 'exercise': lunges.id},
+        ]
+        response = self.client.post(reverse('v1:progress-bulk'), entries, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Progress.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Set.objects.filter(progress__user=self.user).count(), 3)
+        self.assertEqual([len(entry['sets']) for entry in response.data], [2, 1, 0])
+        self.assertTrue(all(entry['sets'][0]['id'] for entry in response.data[:2]))
+        self.assertEqual([(entry['set_count'], entry['total_volume'], entry['top_weight']) for entry in response.data],
+                         [(2, 1050, 110), (1, 200, 20), (0, 0, None)])
+
+    def test_bulk_create_queries(self):
+        """
+        Ensure a batch is logged with the same number of queries whatever its size
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        for username, size in ((self.user_admin, 10), (self.user_basic, 50)):
+            user = AccountUser.objects.get(username=username)
+            entries = [{
+                'date': datetime.date(2016, 3, 1) - datetime.timedelta(days=i),
+                'exercise': exercise,
+                'sets': [{'reps': 5, 'weight': 100 + i}, {'reps': 8, 'weight': 80}],
+            } for i in range(size)]
+
+            with self.assertNumQueries(26):
+                progress_list = Progress.objects.create_with_sets(user, entries)
+
+            self.assertEqual([progress.date for progress in progress_list], [entry['date'] for entry in entries])
+            self.assertEqual(Set.objects.filter(progress__user=user).count(), size * 2)
+            self.assertEqual(TrainingStreak.objects.get(user=user).training_days, size)
+            self.assertEqual(PersonalRecord.objects.get(user=user, kind='weight').value, 100 + size - 1)
+
+    def test_bulk_create_errors(self):
+        """
+        Ensure nothing is logged when an entry is invalid and errors are reported per entry
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        self.authenticate(self.user_basic)
+        entries = [
+            {'date': str(datetime.date.today()), 'exercise': exercise.id, 'sets': [{'reps': 5}]},
+            {'date': str(datetime.date.today() + datetime.timedelta(days=1)), 'exercise': exercise.id},
+            {'date': str(datetime.date.today()), 'exercise': 0},
+        ]
+        response = self.client.post(reverse('v1:progress-bulk'), entries, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('date', response.data[1])
+        self.assertIn('exercise', response.data[2])
+        self.assertEqual(Progress.objects.count(), 0)
+
+    def summary(self, progress):
+        progress = Progress.objects.get(pk=progress.pk)
+        return (progress.set_count, progress.total_reps, progress.total_volume, progress.top_weight,
+                progress.total_duration)
+
+    def test_summary(self):
+        """
+        Ensure the summary of a progress entry follows its sets
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.authenticate(self.user_basic)
+        progress = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date(2016, 3, 1))
+        self.assertEqual(self.summary(progress), (0, 0, 0, None, 0))
+
+        first = Set.objects.create(progress=progress, reps=5, weight=100)
+        Set.objects.create(progress=progress, duration=60)
+        self.assertEqual(self.summary(progress), (2, 5, 500, 100, 60))
+
+        first.weight = 120
+        first.save()
+        self.assertEqual(self.summary(progress), (2, 5, 600, 120, 60))
+
+        first.delete()
+        self.assertEqual(self.summary(progress), (1, 0, 0, None, 60))
+
+        progress.add_sets([{'reps': 3, 'weight': 80}], replace=True)
+        self.assertEqual(self.summary(progress), (1, 3, 240, 80, 0))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('v1:progress-detail', args=(progress.id,)))
+        self.assertEqual((response.data['set_count'], response.data['top_weight']), (1, 80))
+
+    def test_summary_kept_on_save(self):
+        """
+        Ensure saving a progress entry loaded before its sets changed keeps their summary
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.authenticate(self.user_basic)
+        progress = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date(2016, 3, 1))
+        stale = Progress.objects.get(pk=progress.pk)
+
+        Set.objects.create(progress=progress, reps=5, weight=100)
+        stale.date = datetime.date(2016, 3, 2)
+        stale.save()
+
+        self.assertEqual(self.summary(progress), (1, 5, 500, 100, 0))
+        self.assertEqual(Progress.objects.get(pk=progress.pk).date, datetime.date(2016, 3, 2))
+
+    def test_summary_filters(self):
+        """
+        Ensure progress entries can be filtered and sorted by their summary with an index
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.authenticate(self.user_basic)
+        for weight in (100, 80, 120):
+            progress = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date(2016, 3, 1))
+            Set.objects.create(progress=progress, reps=5, weight=weight)
+
+        response = self.client.get(reverse('v1:progress-list'), {'o': '-top_weight', 'min_volume': 450})
+
+        self.assertEqual([entry['top_weight'] for entry in response.data], [120, 100])
+        for ordering in ('-top_weight', 'total_volume', '-set_count'):
+            self.assertIndexed(reverse('v1:progress-list'), 'workouts_progress', {'o': ordering})
+
+    def test_backfill_summaries(self):
+        """
+        Ensure the backfill command rebuilds the summaries that are off
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.authenticate(self.user_basic)
+        for reps in (5, 8, 3):
+            progress = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date(2016, 3, reps))
+            Set.objects.create(progress=progress, reps=reps, weight=100)
+        expected = [self.summary(entry) for entry in Progress.objects.all()]
+
+        Progress.objects.filter(date__day__gt=3).update(set_count=0, total_reps=0, total_volume=0, top_weight=None)
+        out = StringIO()
+        call_command('backfill_summaries', '--chunk-size', '2', stdout=out)
+
+        self.assertEqual([self.summary(entry) for entry in Progress.objects.all()], expected)
+        self.assertIn('Updated 2 of 3 progress summaries', out.getvalue())
+
+    def test_summary_migration(self):
+        """
+        Ensure the migration adding the summaries computes them for the existing entries
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.authenticate(self.user_basic)
+        progress = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date(2016, 3, 1))
+        Set.objects.create(progress=progress, reps=5, weight=100)
+        Set.objects.create(progress=progress, duration=60)
+        empty = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date(2016, 3, 2))
+        expected = [self.summary(progress), self.summary(empty)]
+
+        Progress.objects.update(set_count=0, total_reps=0, total_volume=0, top_weight=None, total_duration=0)
+        migration = importlib.import_module('apps.workouts.migrations.0022_progress_summary')
+        migration.fill_summaries(apps, None)
+
+        self.assertEqual([self.summary(progress), self.summary(empty)], expected)
+        self.assertEqual(expected[0], (2, 5, 500, 100, 60))
+
+    def test_summary_count_invalidated(self):
+        """
+        Ensure cached counts filtered by the summary change with the sets
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.authenticate(self.user_basic)
+        progress = Progress.objects.create(user=self.user, exercise=exercise, date=datetime.date(2016, 3, 1))
+
+        first = self.client.get(reverse('v1:progress-list'), {'min_volume': 450})
+        Set.objects.create(progress=progress, reps=5, weight=100)
+        changed = self.client.get(reverse('v1:progress-list'), {'min_volume': 450})
+
+        self.assertEqual(first['X-Total-Count'], '0')
+        self.assertEqual(changed['X-Total-Count'], '1')
+
+    def test_delete_queries(self):
+        """
+        Ensure deleting a progress entry removes its sets with the same number of queries whatever their number
+        """
+        exercise = Exercise.objects.create(name='squats', description='squat', )
+
+        for username, size in ((self.user_admin, 1), (self.user_basic, 10)):
+            user = AccountUser.objects.get(username=username)
+            progress = Progress.objects.create(user=user, exercise=exercise, date=datetime.date(2016, 3, 1))
+            progress.add_sets([{'reps': 5, 'weight': 100 + i} for i in range(size)])
+            Progress.objects.create(user=user, exercise=exercise, date=datetime.date(2016, 3, 2)).add_sets(
+                [{'reps': 5, 'weight': 90}])
+            sets = list(progress.set_set.values_list('id', flat=True))
+
+            with self.assertNumQueries(31):
+                Progress.objects.get(pk=progress.pk).delete()
+
+            self.assertFalse(Set.objects.filter(pk__in=sets).exists())
+            self.assertEqual(Tombstone.objects.filter(object_id__in=sets, model='workouts.set').count(), size)
+            self.assertEqual(PersonalRecord.objects.get(user=user, kind='weight').value, 90)
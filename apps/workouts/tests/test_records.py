@@ -0,0 +1,149 @@
+import datetime
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from ...accounts.models import AccountUser
+from ...core.tests import BaseTestCase
+from ...exercises.models import Exercise
+
+from ..models import Progress, Set, PersonalRecord
+
+
+class PersonalRecordTest(BaseTestCase):
+    def setUp(self):
+        super(PersonalRecordTest, self).setUp()
+        self.authenticate(self.user_basic)
+        self.exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.progress = Progress.objects.create(user=self.user, exercise=self.exercise, date=datetime.date(2016, 3, 1))
+
+    def records(self):
+        return dict((record.kind, (record.value, record.set_id))
+                    for record in PersonalRecord.objects.filter(user=self.user, exercise=self.exercise))
+
+    def test_records_raised(self):
+        """
+        Ensure records are raised as sets are saved
+        """
+        first = Set.objects.create(progress=self.progress, reps=5, weight=100)
+        second = Set.objects.create(progress=self.progress, reps=8, weight=90)
+        Set.objects.create(progress=self.progress, reps=5, weight=100)
+        Set.objects.create(progress=self.progress, duration=60)
+
+        self.assertEqual(self.records(), {
+            'weight': (100, first.id),
+            'reps': (8, second.id),
+            'volume': (720, second.id),
+        })
+
+    def test_first_record_locked(self):
+        """
+        Ensure the user is locked before their first records are looked up and inserted
+        """
+        with CaptureQueriesContext(connection) as context:
+            Set.objects.create(progress=self.progress, reps=5, weight=100)
+        statements = [query['sql'] for query in context.captured_queries]
+        user = connection.ops.quote_name(AccountUser._meta.db_table)
+        records = connection.ops.quote_name(PersonalRecord._meta.db_table)
+        lookup = min(i for i, sql in enumerate(statements) if 'FROM %s' % records in sql)
+
+        self.assertTrue(any('FROM %s' % user in sql for sql in statements[:lookup]))
+        self.assertEqual(len(self.records()), 3)
+
+    def test_records_recomputed(self):
+        """
+        Ensure records fall back to the next best set when the record set is lowered or deleted
+        """
+        first = Set.objects.create(progress=self.progress, reps=5, weight=100)
+        second = Set.objects.create(progress=self.progress, reps=3, weight=120)
+
+        second.weight = 90
+        second.save()
+        self.assertEqual(self.records()['weight'], (100, first.id))
+
+        first.delete()
+        self.assertEqual(self.records(), {
+            'weight': (90, second.id),
+            'reps': (3, second.id),
+            'volume': (270, second.id),
+        })
+
+        self.progress.delete()
+        self.assertEqual(self.records(), {})
+
+    def test_records_moved(self):
+        """
+        Ensure records follow a progress entry moved to another exercise
+        """
+        lunges = Exercise.objects.create(name='lunges', description='lunge', )
+        Set.objects.create(progress=self.progress, reps=5, weight=100)
+
+        self.progress.exercise = lunges
+        self.progress.save()
+
+        self.assertEqual(self.records(), {})
+        self.assertEqual(PersonalRecord.objects.filter(exercise=lunges).count(), 3)
+
+    def test_records_bulk(self):
+        """
+        Ensure records are kept for sets logged in bulk
+        """
+        entries = [
+            {'date': '2016-03-02', 'exercise': self.exercise.id, 'sets': [{'reps': 5, 'weight': 100}]},
+            {'date': '2016-03-03', 'exercise': self.exercise.id, 'sets': [{'reps': 5, 'weight': 110}]},
+        ]
+        self.client.post(reverse('v1:progress-bulk'), entries, format='json')
+
+        self.assertEqual(self.records()['weight'][0], 110)
+
+    def test_backfill(self):
+        """
+        Ensure the backfill command rebuilds the records kept by the signals
+        """
+        for reps, weight in [(5, 100), (8, 90), (5, 100), (2, 120)]:
+            Set.objects.create(progress=self.progress, reps=reps, weight=weight)
+        expected = self.records()
+
+        PersonalRecord.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_records', '--chunk-size', '2', stdout=out)
+
+        self.assertEqual(self.records(), expected)
+        self.assertIn('Rebuilt 3 personal records from 4 sets', out.getvalue())
+
+    def test_backfill_repair(self):
+        """
+        Ensure the backfill command corrects wrong records and removes records without sets
+        """
+        Set.objects.create(progress=self.progress, reps=5, weight=100)
+        expected = self.records()
+        lunges = Exercise.objects.create(name='lunges', description='lunge', )
+
+        PersonalRecord.objects.filter(kind='weight').update(value=50)
+        PersonalRecord.objects.create(user=self.user, exercise=lunges, kind='reps', value=10,
+                                      date=datetime.date(2016, 3, 1))
+        call_command('backfill_records', '--user', str(self.user.id), stdout=StringIO())
+
+        self.assertEqual(self.records(), expected)
+        self.assertFalse(PersonalRecord.objects.filter(exercise=lunges).exists())
+
+    def test_get_records(self):
+        """
+        Ensure a user can read only their records with a single query
+        """
+        Set.objects.create(progress=self.progress, reps=5, weight=100)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('v1:record-list'), {'kind': 'weight'})
+        self.authenticate(self.user_admin)
+        other = self.client.get(reverse('v1:record-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(record['exercise'], record['value']) for record in response.data],
+                         [(self.exercise.id, 100)])
+        self.assertEqual(other.data, [])
@@ -1,10 +1,14 @@
+from django.core.cache import cache
+from django.test import RequestFactory
+
 from rest_framework import status
 from rest_framework.reverse import reverse
 
+from ...core.caching import list_cache_key
 from ...core.tests import BaseTestCase
-from ...exercises.models import Exercise
+from ...exercises.models import Exercise, ExerciseCategory
 
-from ..models import Routine
+from ..models import DayOfWeek, Routine, PUBLIC_ROUTINES_CACHE
 
 
 class RoutineTest(BaseTestCase):
@@ -29,6 +33,46 @@ class RoutineTest(BaseTestCase):
         self.assertEqual(routine_list.status_code, status.HTTP_200_OK)
         self.assertEqual(detail.status_code, status.HTTP_200_OK)
 
+    def test_list_query_plan(self):
+        """
+        Ensure listing routines is served by an index
+        """
+        self.authenticate(self.user_basic)
+        Routine.objects.create(user=self.user, name='mondays', )
+
+        self.assertIndexed(reverse('v1:routine-list'), 'workouts_routine')
+
+    def test_list_queries(self):
+        """
+        Ensure listing routines costs the same number of queries at any page size
+        """
+        self.authenticate(self.user_basic)
+        category = ExerciseCategory.objects.create(name='legs')
+        squats = Exercise.objects.create(name='squats', description='squat', category=category)
+        lunges = Exercise.objects.create(name='lunges', description='lunge', )
+        monday = DayOfWeek.objects.create(day='monday')
+        for i in range(5):
+            routine = Routine.objects.create(user=self.user, name='routine %d' % i, )
+            routine.exercises.add(squats, lunges)
+            routine.days.add(monday)
+
+        # authentication, count, page, exercises and days
+        for page_size in (2, 5):
+            cache.clear()
+            with self.assertNumQueries(5):
+                response = self.client.get(reverse('v1:routine-list'), {'per_page': page_size})
+            self.assertEqual(len(response.data), page_size)
+            self.assertEqual(sorted(response.data[0]['exercises']), [squats.id, lunges.id])
+            self.assertEqual(response.data[0]['days'], [monday.id])
+
+        cache.clear()
+        with self.assertNumQueries(5):
+            expanded = self.client.get(reverse('v1:routine-list'), {'expand': 'exercises'})
+        self.assertEqual([dict(exercise) for exercise in expanded.data[0]['exercises']], [
+            {'id': lunges.id, 'name': 'lunges', 'category': None},
+            {'id': squats.id, 'name': 'squats', 'category': 'legs'},
+        ])
+
     def test_add_routine_non_admin(self):
         """
         Ensure non-admin users can add exercise routines
@@ -117,6 +161,104 @@ class PublicRoutineTest(BaseTestCase):
         self.assertEqual(Routine.objects.count(), 3)
         self.assertEqual(Routine.objects.filter(is_public=True).count(), 1)
 
+    def test_list_query_plan(self):
+        """
+        Ensure listing public routines is served by an index
+        """
+        self.authenticate(self.user_basic)
+        Routine.objects.create(user=self.user, name='mondays', is_public=True)
+
+        self.assertIndexed(reverse('v1:public-routine-list'), 'workouts_routine')
+
+    def test_list_queries(self):
+        """
+        Ensure listing public routines with exercises embedded costs a fixed number of queries
+        """
+        self.authenticate(self.user_admin)
+        squats = Exercise.objects.create(name='squats', description='squat', )
+        for i in range(5):
+            routine = Routine.objects.create(user=self.user, name='routine %d' % i, is_public=True)
+            routine.exercises.add(squats)
+
+        self.authenticate(self.user_basic)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('v1:public-routine-list'), {'expand': 'exercises'})
+
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[0]['exercises'][0]['name'], 'squats')
+
+    def test_list_cache(self):
+        """
+        Ensure public routine lists are cached per normalized query until routines change
+        """
+        self.authenticate(self.user_admin)
+        squats = Exercise.objects.create(name='squats', description='squat', )
+        routine = Routine.objects.create(user=self.user, name='mondays', is_public=True)
+
+        self.authenticate(self.user_basic)
+        url = reverse('v1:public-routine-list')
+        first = self.client.get(url + '?name=mon&is_public=True')
+        with self.assertNumQueries(1):
+            cached = self.client.get(url + '?is_public=True&name=mon')
+
+        routine.exercises.add(squats)
+        changed = self.client.get(url + '?name=mon&is_public=True')
+        Routine.objects.create(user=self.user, name='mondays again', is_public=True)
+        created = self.client.get(url + '?is_public=True&name=mon')
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.data, first.data)
+        self.assertEqual(cached['X-Total-Count'], '1')
+        self.assertEqual((changed['X-Cache'], changed.data[0]['exercises']), ('MISS', [squats.id]))
+        self.assertEqual((created['X-Cache'], created['X-Total-Count']), ('MISS', '2'))
+
+    def test_list_cache_stampede(self):
+        """
+        Ensure only the request holding the rebuild lock queries while others are served the stale list
+        """
+        self.authenticate(self.user_admin)
+        Routine.objects.create(user=self.user, name='mondays', is_public=True)
+
+        self.authenticate(self.user_basic)
+        url = reverse('v1:public-routine-list')
+        self.client.get(url)
+        Routine.objects.create(user=self.user, name='tuesdays', is_public=True)
+
+        lock = list_cache_key(PUBLIC_ROUTINES_CACHE, RequestFactory().get(url)) + ':lock'
+        cache.add(lock, 1)
+        with self.assertNumQueries(1):
+            stale = self.client.get(url)
+        cache.delete(lock)
+        rebuilt = self.client.get(url)
+
+        self.assertEqual((stale['X-Cache'], len(stale.data)), ('STALE', 1))
+        self.assertEqual((rebuilt['X-Cache'], len(rebuilt.data)), ('MISS', 2))
+
+    def test_list_cache_exercises(self):
+        """
+        Ensure cached public routine lists with embedded exercises are invalidated when the exercises change
+        """
+        self.authenticate(self.user_admin)
+        category = ExerciseCategory.objects.create(name='legs')
+        squats = Exercise.objects.create(name='squats', description='squat', category=category)
+        routine = Routine.objects.create(user=self.user, name='mondays', is_public=True)
+        routine.exercises.add(squats)
+
+        self.authenticate(self.user_basic)
+        url = reverse('v1:public-routine-list')
+        self.client.get(url, {'expand': 'exercises'})
+        squats.name = 'front squats'
+        squats.save()
+        renamed = self.client.get(url, {'expand': 'exercises'})
+        category.name = 'lower body'
+        category.save()
+        recategorized = self.client.get(url, {'expand': 'exercises'})
+
+        self.assertEqual((renamed['X-Cache'], renamed.data[0]['exercises'][0]['name']), ('MISS', 'front squats'))
+        self.assertEqual((recategorized['X-Cache'], recategorized.data[0]['exercises'][0]['category']),
+                         ('MISS', 'lower body'))
+
     def test_get_public_routine_detail(self):
         """
         Details of a publicly shared routine is available
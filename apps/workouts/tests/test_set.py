@@ -0,0 +1,95 @@
+import datetime
+
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from ...core.models import Tombstone
+from ...core.tests import BaseTestCase
+from ...exercises.models import Exercise
+
+from ..models import Progress, Set, PersonalRecord
+
+
+class SetTest(BaseTestCase):
+    def setUp(self):
+        super(SetTest, self).setUp()
+        self.exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.owner = self.authenticate(self.user_admin)
+        self.progress = Progress.objects.create(user=self.owner, exercise=self.exercise, date=datetime.date.today())
+        self.set = Set.objects.create(progress=self.progress, reps=5, weight=100)
+
+    def test_get_sets(self):
+        """
+        Ensure a user can list the sets of their progress entry with one query
+        """
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('v1:progress-sets-list', args=(self.progress.id,)))
+        detail = self.client.get(reverse('v1:progress-sets-detail', args=(self.progress.id, self.set.id)))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [self.set.id])
+        self.assertEqual(detail.status_code, status.HTTP_200_OK)
+
+    def test_other_users_sets(self):
+        """
+        Ensure the sets of another user's progress entry can't be read or added to
+        """
+        self.authenticate(self.user_basic)
+        sets = self.client.get(reverse('v1:progress-sets-list', args=(self.progress.id,)))
+        detail = self.client.get(reverse('v1:progress-sets-detail', args=(self.progress.id, self.set.id)))
+        create = self.client.post(reverse('v1:progress-sets-list', args=(self.progress.id,)), {'reps': 1})
+        bulk = self.client.put(reverse('v1:progress-sets-bulk', args=(self.progress.id,)), [], format='json')
+
+        self.assertEqual(sets.data, [])
+        self.assertEqual(detail.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(create.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(bulk.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Set.objects.count(), 1)
+
+    def test_add_set(self):
+        """
+        Ensure a set is added to the progress entry of the url
+        """
+        other = Progress.objects.create(user=self.owner, exercise=self.exercise, date=datetime.date.today())
+        response = self.client.post(reverse('v1:progress-sets-list', args=(self.progress.id,)),
+                                    {'progress': other.id, 'reps': 3, 'weight': 120})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['progress'], self.progress.id)
+        self.assertEqual(self.progress.set_set.count(), 2)
+
+    def test_bulk_sets(self):
+        """
+        Ensure sets can be added and replaced in one request
+        """
+        url = reverse('v1:progress-sets-bulk', args=(self.progress.id,))
+        added = self.client.post(url, [{'reps': 3, 'weight': 120}, {'reps': 2, 'weight': 130}], format='json')
+        replaced = self.client.put(url, [{'reps': 8, 'weight': 80}], format='json')
+        invalid = self.client.put(url, [{'reps': 'many'}], format='json')
+
+        self.assertEqual(added.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['reps'] for item in added.data], [5, 3, 2])
+        self.assertEqual(replaced.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['reps'] for item in replaced.data], [8])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(self.progress.set_set.values_list('reps', flat=True)), [8])
+        self.assertEqual(PersonalRecord.objects.get(user=self.owner, kind='weight').value, 80)
+
+    def test_replace_sets(self):
+        """
+        Ensure replacing the sets of an entry takes the same queries however many sets it had
+        """
+        for count in (1, 10):
+            exercise = Exercise.objects.create(name='lunges %d' % count, description='lunge', )
+            progress = Progress.objects.create(user=self.owner, exercise=exercise, date=datetime.date.today())
+            Set.objects.bulk_create([Set(progress=progress, user=self.owner, reps=5, weight=100 + i)
+                                     for i in range(count)])
+            replaced = list(progress.set_set.values_list('id', flat=True))
+            PersonalRecord.objects.recompute(self.owner.id, exercise.id)
+
+            with self.assertNumQueries(23):
+                progress.add_sets([{'reps': 3, 'weight': 50}], replace=True)
+
+            self.assertEqual(progress.set_count, 1)
+            self.assertEqual(PersonalRecord.objects.get(exercise=exercise, kind='weight').value, 50)
+            self.assertEqual(Tombstone.objects.filter(model='workouts.set', object_id__in=replaced).count(), count)
@@ -0,0 +1,116 @@
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from ...core.tests import BaseTestCase
+from ...exercises.models import Exercise
+
+from ..models import Progress, TrainingStreak
+
+STATE_FIELDS = ('first_date', 'last_date', 'training_days', 'current_start', 'longest', 'longest_end',
+                'weeks_trained', 'current_week_start', 'longest_weeks', 'longest_weeks_end')
+
+# a monday
+START = datetime.date(2016, 2, 29)
+
+
+class TrainingStreakTest(BaseTestCase):
+    def setUp(self):
+        super(TrainingStreakTest, self).setUp()
+        self.authenticate(self.user_basic)
+        self.exercise = Exercise.objects.create(name='squats', description='squat', )
+
+    def log(self, *days):
+        return [Progress.objects.create(user=self.user, exercise=self.exercise,
+                                        date=START + datetime.timedelta(days=day)) for day in days]
+
+    def state(self):
+        streak = TrainingStreak.objects.get(user=self.user)
+        return dict((field, getattr(streak, field)) for field in STATE_FIELDS)
+
+    def assertRecomputed(self):
+        """
+        Assert the kept state is the one rebuilt from the history
+        """
+        kept = self.state()
+        TrainingStreak.objects.recompute(self.user.pk)
+        self.assertEqual(kept, self.state())
+
+    def test_streaks(self):
+        """
+        Ensure streaks and weeks are counted as days are logged and deleted in and out of order
+        """
+        entries = self.log(0, 1, 2, 2, 6, 7, 8)
+        streak = TrainingStreak.objects.get(user=self.user)
+        self.assertEqual((streak.current, streak.longest, streak.training_days), (3, 3, 6))
+        self.assertEqual((streak.current_weeks, streak.longest_weeks, streak.weeks_trained), (2, 2, 2))
+        self.assertRecomputed()
+
+        # out of order entries and deletes
+        self.log(4, 3, 21)
+        self.assertRecomputed()
+        entries[1].delete()
+        self.assertRecomputed()
+        entries[2].delete()
+        self.assertRecomputed()
+        entries[-1].date = START + datetime.timedelta(days=30)
+        entries[-1].save()
+        self.assertRecomputed()
+
+        streak = TrainingStreak.objects.get(user=self.user)
+        self.assertEqual((streak.current, streak.longest, streak.training_days), (1, 3, 8))
+
+    def test_constant_time(self):
+        """
+        Ensure days logged and deleted at the end of the history take the same queries however long it is
+        """
+        def queries(history):
+            Progress.objects.all().delete()
+            TrainingStreak.objects.all().delete()
+            # a longer streak first, so the last one isn't the longest
+            self.log(0, 1, 2, 3, 4)
+            self.log(*range(10, history * 2, 2))
+            self.log(history * 2, history * 2 + 1)
+            last = START + datetime.timedelta(days=history * 2 + 2)
+
+            with CaptureQueriesContext(connection) as added:
+                TrainingStreak.objects.add_days(self.user.pk, [last])
+            with CaptureQueriesContext(connection) as removed:
+                TrainingStreak.objects.remove_day(self.user.pk, last)
+            # neither rebuilt from the history
+            self.assertFalse([query for query in added.captured_queries + removed.captured_queries
+                              if 'DISTINCT' in query['sql']])
+            return len(added), len(removed)
+
+        self.assertEqual(queries(5), queries(50))
+
+    def test_stats(self):
+        """
+        Ensure the stats endpoint reports current streaks only when they reach today
+        """
+        today = datetime.date.today()
+        for days in (3, 1, 0):
+            Progress.objects.create(user=self.user, exercise=self.exercise, date=today - datetime.timedelta(days=days))
+
+        response = self.client.get(reverse('v1:progress-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['current_streak'], response.data['longest_streak']), (2, 2))
+        self.assertEqual(response.data['training_days'], 3)
+
+        Progress.objects.filter(date__gte=today - datetime.timedelta(days=1)).delete()
+        response = self.client.get(reverse('v1:progress-stats'))
+        self.assertEqual((response.data['current_streak'], response.data['longest_streak']), (0, 1))
+
+    def test_stats_without_history(self):
+        """
+        Ensure a user without progress gets empty stats
+        """
+        response = self.client.get(reverse('v1:progress-stats'))
+
+        self.assertEqual(response.data['current_streak'], 0)
+        self.assertEqual(response.data['consistency'], 0.0)
+        self.assertFalse(TrainingStreak.objects.exists())
@@ -0,0 +1,147 @@
+import datetime
+
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from ...accounts.models import AccountUser
+from ...core.models import Tombstone
+from ...core.tests import BaseTestCase
+from ...exercises.models import Exercise
+from ...metrics.models import Metric, MetricType, MetricTypeGroup
+
+from ..models import Routine, Progress, Set
+from ..views import SyncViewSet
+
+
+class SyncTest(BaseTestCase):
+    def setUp(self):
+        super(SyncTest, self).setUp()
+        self.authenticate(self.user_basic)
+        self.exercise = Exercise.objects.create(name='squats', description='squat', )
+        self.routine = Routine.objects.create(user=self.user, name='legs')
+        self.progress = Progress.objects.create(user=self.user, exercise=self.exercise, date=datetime.date(2016, 3, 1))
+        self.set = Set.objects.create(progress=self.progress, reps=5, weight=100)
+        group = MetricTypeGroup.objects.create(name='weight')
+        metric_type = MetricType.objects.create(group=group, name='pound', unit='lb')
+        self.metric = Metric.objects.create(user=self.user, metric_type=metric_type, value=180)
+
+    def synced(self):
+        """
+        Pretend all rows were last changed an hour ago, token of a sync right after
+        """
+        past = timezone.now() - datetime.timedelta(hours=1)
+        for model in (Routine, Progress, Set, Metric):
+            model.objects.update(date_updated=past)
+        return SyncViewSet().encode_token(past + datetime.timedelta(minutes=1))
+
+    def test_full_sync(self):
+        """
+        Ensure a sync without a token returns all of the user's rows
+        """
+        Routine.objects.create(user=AccountUser.objects.get(username=self.user_admin), name='other')
+        response = self.client.get(reverse('v1:sync-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['full'])
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual([routine['name'] for routine in response.data['routines']], ['legs'])
+        self.assertEqual([entry['id'] for entry in response.data['progress']], [self.progress.id])
+        self.assertEqual([entry['id'] for entry in response.data['sets']], [self.set.id])
+        self.assertEqual([entry['id'] for entry in response.data['metrics']], [self.metric.id])
+        self.assertTrue(response.data['token'])
+
+    def test_incremental_sync(self):
+        """
+        Ensure a sync with a token returns only the rows changed and deleted since
+        """
+        token = self.synced()
+        routine_id, metric_id = self.routine.id, self.metric.id
+        self.set.weight = 110
+        self.set.save()
+        self.routine.delete()
+        self.metric.delete()
+
+        response = self.client.get(reverse('v1:sync-list'), {'token': token})
+
+        self.assertFalse(response.data['full'])
+        self.assertEqual(response.data['routines'], [])
+        # the summary of the set's progress entry changed with it
+        self.assertEqual([entry['set_count'] for entry in response.data['progress']], [1])
+        self.assertEqual([(entry['id'], entry['weight']) for entry in response.data['sets']], [(self.set.id, 110)])
+        self.assertEqual(response.data['deleted'], {
+            'routines': [routine_id],
+            'progress': [],
+            'sets': [],
+            'metrics': [metric_id],
+        })
+
+    def test_paged_sync(self):
+        """
+        Ensure a sync is returned in pages of at most per_page rows in the order they were changed
+        """
+        more = [Progress.objects.create(user=self.user, exercise=self.exercise, date=datetime.date(2016, 3, day))
+                for day in (2, 3)]
+        token = self.synced()
+        for entry in reversed(more):
+            entry.save()
+
+        pages = []
+        params = {'token': token, 'per_page': 1}
+        while True:
+            response = self.client.get(reverse('v1:sync-list'), params)
+            pages.append([entry['id'] for entry in response.data['progress']])
+            if not response.data['has_more']:
+                break
+            params['token'] = response.data['token']
+        last = self.client.get(reverse('v1:sync-list'), {'token': response.data['token']})
+
+        self.assertFalse(response.data['full'])
+        self.assertEqual([ids for ids in pages if ids], [[more[1].id], [more[0].id]])
+        self.assertTrue(all(len(ids) <= 1 for ids in pages))
+        # the next sync starts from the first page, rows changed since are seen again
+        self.assertEqual([entry['id'] for entry in last.data['progress']], [more[1].id, more[0].id])
+
+    def test_sets_query_plan(self):
+        """
+        Ensure the changed sets of a user are read from an index in the order they were changed
+        """
+        token = self.synced()
+        self.set.save()
+
+        self.assertIndexed(reverse('v1:sync-list'), 'workouts_set', {'token': token})
+
+    def test_deleted_progress(self):
+        """
+        Ensure deleting a progress entry reports its sets as deleted too
+        """
+        token = self.synced()
+        progress_id, set_id = self.progress.id, self.set.id
+        self.progress.delete()
+
+        response = self.client.get(reverse('v1:sync-list'), {'token': token})
+
+        self.assertEqual(response.data['deleted']['progress'], [progress_id])
+        self.assertEqual(response.data['deleted']['sets'], [set_id])
+
+    def test_expired_token(self):
+        """
+        Ensure a token older than the kept deletions asks for a full sync
+        """
+        self.routine.delete()
+        Tombstone.objects.update(date_deleted=timezone.now() - datetime.timedelta(days=100))
+        token = SyncViewSet().encode_token(timezone.now() - datetime.timedelta(days=91))
+
+        response = self.client.get(reverse('v1:sync-list'), {'token': token})
+
+        self.assertTrue(response.data['full'])
+        self.assertEqual(Tombstone.objects.purge(), 1)
+
+    def test_invalid_token(self):
+        """
+        Ensure an invalid token is rejected
+        """
+        response = self.client.get(reverse('v1:sync-list'), {'token': 'nonsense'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
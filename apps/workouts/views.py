@@ -1,21 +1,64 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+
 from oauth2_provider.ext.rest_framework import TokenHasReadWriteScope
 
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework import status, viewsets
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import ParseError
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAuthenticated, AllowAny, SAFE_METHODS
+from rest_framework.response import Response
 
 from ..core.permissions import IsAdminOrReadOnly
 from ..core.loggers import LoggingMixin
+from ..core.pagination import KeysetPaginationMixin
+from ..core.streaming import ndjson_response, csv_response
+from ..core.views import ExpandMixin
+from ..core.caching import CachedListMixin
+from ..core.models import Tombstone, TOMBSTONE_RETENTION
 from ..accounts.models import AccountUser
+from ..exercises.models import Exercise
+from ..metrics.models import Metric
+from ..metrics.serializers import MetricSerializer
 
 from .serializers import (
     DayOfWeekSerializer,
     PublicRoutineSerializer,
     RoutineSerializer,
+    ExpandedPublicRoutineSerializer,
+    ExpandedRoutineSerializer,
     ProgressSerializer,
-    SetSerializer
+    SetSerializer,
+    ProgressSetSerializer,
+    ExpandedProgressSerializer,
+    BulkProgressSerializer,
+    PersonalRecordSerializer,
+    ProgressImportSerializer
+)
+from .filters import DayOfWeekFilter, RoutineFilter, ProgressFilter, PersonalRecordFilter
+from .models import (
+    DayOfWeek, Routine, Progress, Set, PersonalRecord, ProgressImport, TrainingStreak, PUBLIC_ROUTINES_CACHE
+)
+from .tasks import import_progress
+from .exports import progress_rows, progress_csv_rows, PROGRESS_CSV_FIELDS
+from .analytics import (
+    volume,
+    strength,
+    calendar,
+    calendar_cache_key,
+    PERIODS,
+    FORMULAS,
+    CALENDAR_CACHE_TIMEOUT
 )
-from .filters import DayOfWeekFilter, RoutineFilter, ProgressFilter
-from .models import DayOfWeek, Routine, Progress, Set
 
 
 class WorkoutMixin(LoggingMixin, viewsets.ModelViewSet):
@@ -51,56 +94,417 @@ class DayOfWeekViewSet(LoggingMixin, viewsets.ModelViewSet):
     filter_class = DayOfWeekFilter
 
 
-class PublicRoutineViewSet(LoggingMixin, viewsets.ModelViewSet):
+class RoutineMixin(ExpandMixin):
+    """
+    Prefetch the exercises and days of routines, ?expand=exercises embeds the exercises
+    """
+    expanded_serializer_class = None
+
+    def prefetch(self, queryset):
+        """
+        Exercises and days of all routines fetched with one query each
+        """
+        exercises = Exercise.objects.all()
+        if self.expanded('exercises'):
+            exercises = exercises.select_related('category')
+        return queryset.prefetch_related(Prefetch('exercises', queryset=exercises), 'days')
+
+    def get_serializer_class(self):
+        """
+        Embed exercises on reads when asked for
+        """
+        if self.request.method in SAFE_METHODS and self.expanded('exercises'):
+            return self.expanded_serializer_class
+        return super(RoutineMixin, self).get_serializer_class()
+
+
+class PublicRoutineViewSet(CachedListMixin, RoutineMixin, LoggingMixin, viewsets.ModelViewSet):
     """
-    List/Details of publically shared routines
+    List/Details of publically shared routines, lists are the same for every caller and cached
     """
     permission_classes = [AllowAny, TokenHasReadWriteScope]
     required_scopes = ['workouts']
     queryset = Routine.objects.public()
     serializer_class = PublicRoutineSerializer
+    expanded_serializer_class = ExpandedPublicRoutineSerializer
     filter_class = RoutineFilter
     http_method_names = ['get', 'head', 'options']
+    list_cache_name = PUBLIC_ROUTINES_CACHE
+
+    def get_queryset(self):
+        """
+        Publically shared routines with their exercises and days
+        """
+        return self.prefetch(Routine.objects.public())
 
 
-class RoutineViewSet(WorkoutMixin):
+class RoutineViewSet(RoutineMixin, WorkoutMixin):
     """
     List/Detail of a user's routine(s)
     """
     serializer_class = RoutineSerializer
+    expanded_serializer_class = ExpandedRoutineSerializer
     filter_class = RoutineFilter
 
     def get_queryset(self):
         """
-        Filter only current user's progress logs
+        Filter only current user's routines
         """
-        return Routine.objects.filter(user=self.request.user)
+        return self.prefetch(Routine.objects.filter(user=self.request.user))
 
 
-class ProrgressViewSet(WorkoutMixin):
+class ProrgressViewSet(ExpandMixin, KeysetPaginationMixin, WorkoutMixin):
     """
-    List/Detail of a user's workout progression
+    List/Detail of a user's workout progression, ?expand=sets embeds each entry's sets
     """
     queryset = Progress.objects.all()
     serializer_class = ProgressSerializer
     filter_class = ProgressFilter
+    keyset_ordering = ('date', 'id')
+    bulk_limit = 500
 
     def get_queryset(self):
         """
-        Filter only current user's progress logs
+        Filter only current user's progress logs, with the sets of all entries
+        fetched in one query when they are embedded
+        """
+        queryset = Progress.objects.filter(user=self.request.user)
+        if self.expanded('sets'):
+            queryset = queryset.prefetch_related(
+                Prefetch('set_set', queryset=Set.objects.order_by('id'), to_attr='sets'))
+        return queryset
+
+    def get_serializer_class(self):
+        """
+        Embed sets on reads when asked for
+        """
+        if self.request.method in SAFE_METHODS and self.expanded('sets'):
+            return ExpandedProgressSerializer
+        return super(ProrgressViewSet, self).get_serializer_class()
+
+    @list_route(methods=['get'])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream all of the user's progress entries with their sets as newline
+        delimited json, or csv with ?type=csv. Progress filters are honored
+        """
+        rows = progress_rows(self.filter_queryset(self.get_queryset()))
+
+        if request.query_params.get('type') == 'csv':
+            return csv_response(progress_csv_rows(rows), PROGRESS_CSV_FIELDS, 'progress')
+        return ndjson_response(rows, 'progress')
+
+    @list_route(methods=['get'])
+    def volume(self, request, *args, **kwargs):
+        """
+        Volume, total reps, set count and max weight per exercise bucketed by
+        ?period=day, week (default) or month. Progress filters are honored
         """
-        return Progress.objects.filter(user=self.request.user)
+        period = request.query_params.get('period', 'week')
+        if period not in PERIODS:
+            message = {"detail": "Period must be one of %s" % ', '.join(PERIODS)}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(volume(self.filter_queryset(self.get_queryset()), period))
+
+    @list_route(methods=['get'])
+    def strength(self, request, *args, **kwargs):
+        """
+        Best estimated one rep max per session of an ?exercise with the best so far, rolling
+        max and slope over the last ?window sessions (default 5), by ?formula=epley (default)
+        or brzycki. Progress date filters are honored
+        """
+        formula = request.query_params.get('formula', 'epley')
+        try:
+            window = int(request.query_params.get('window', 5))
+        except ValueError:
+            window = 0
+
+        if not request.query_params.get('exercise') or formula not in FORMULAS or not 2 <= window <= 100:
+            message = {"detail": "An exercise, a formula of %s and a window of 2 to 100 are required" %
+                                 ', '.join(FORMULAS)}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(strength(self.filter_queryset(self.get_queryset()), formula, window))
+
+    @list_route(methods=['get'])
+    def calendar(self, request, *args, **kwargs):
+        """
+        Training days of a ?month=YYYY-MM (default this month) with their exercise count,
+        set count and volume. Cached per user and month until progress of the month changes
+        """
+        try:
+            month = datetime.datetime.strptime(request.query_params['month'], '%Y-%m').date()
+        except KeyError:
+            month = datetime.date.today().replace(day=1)
+        except ValueError:
+            return Response({"detail": "Month must be formatted YYYY-MM"}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = calendar_cache_key(request.user.id, month)
+        days = cache.get(key)
+        if days is None:
+            days = calendar(self.get_queryset(), month)
+            cache.set(key, days, CALENDAR_CACHE_TIMEOUT)
+        return Response(days)
+
+    @list_route(methods=['get'])
+    def stats(self, request, *args, **kwargs):
+        """
+        Current and longest training streaks in days and weeks and the share of
+        weeks trained, read from the user's streak state kept as progress is logged
+        """
+        streak = TrainingStreak.objects.for_user(request.user.id)
+        return Response(streak.stats(datetime.date.today()))
+
+    @list_route(methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Log a list of progress entries with their nested sets in one transaction,
+        nothing is saved if any entry is invalid and the errors are returned per entry
+        """
+        if not isinstance(request.data, list) or len(request.data) > self.bulk_limit:
+            message = {"detail": "Expected a list of at most %d progress entries" % self.bulk_limit}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        # exercises of all entries are looked up with a single query
+        exercise_ids = []
+        for entry in request.data:
+            try:
+                exercise_ids.append(int(entry.get('exercise')))
+            except (AttributeError, TypeError, ValueError):
+                pass
+
+        context = self.get_serializer_context()
+        context['exercise'] = Exercise.objects.in_bulk(exercise_ids)
+        serializer = BulkProgressSerializer(data=request.data, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+
+        progress = Progress.objects.create_with_sets(self.request.user, serializer.validated_data)
+        return Response(BulkProgressSerializer(progress, many=True).data, status=status.HTTP_201_CREATED)
 
 
 class SetViewSet(LoggingMixin, viewsets.ModelViewSet):
     """
     List/Detail of sets that belong to a particular progress
     """
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    required_scopes = ['workouts']
     serializer_class = SetSerializer
+    bulk_limit = 100
 
     def get_queryset(self, **kwargs):
         """
-        Filter only current user's progress sets
+        Filter only current user's progress sets, ownership is checked in the same query
+        """
+        return Set.objects.filter(progress=self.kwargs['progress_pk'], user=self.request.user)
+
+    def get_progress(self):
+        """
+        Current user's progress entry of the url
+        """
+        return get_object_or_404(Progress, pk=self.kwargs['progress_pk'], user=self.request.user)
+
+    def perform_create(self, serializer):
         """
-        progress_pk = self.kwargs.pop('progress_pk')
-        return Set.objects.filter(progress=progress_pk)
+        Automatically assign the progress entry of the url
+        """
+        serializer.save(progress=self.get_progress())
+
+    @list_route(methods=['post', 'put'])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Add a list of sets to the progress entry with POST, or replace all of its
+        sets with PUT, in one transaction. Returns all sets of the entry
+        """
+        progress = self.get_progress()
+
+        if not isinstance(request.data, list) or len(request.data) > self.bulk_limit:
+            message = {"detail": "Expected a list of at most %d sets" % self.bulk_limit}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = ProgressSetSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        sets = progress.add_sets(serializer.validated_data, replace=request.method == 'PUT')
+        response_status = status.HTTP_200_OK if request.method == 'PUT' else status.HTTP_201_CREATED
+        return Response(ProgressSetSerializer(sets, many=True).data, status=response_status)
+
+
+class PersonalRecordViewSet(LoggingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    List/Detail of a user's personal records per exercise
+    """
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    required_scopes = ['workouts']
+    serializer_class = PersonalRecordSerializer
+    filter_class = PersonalRecordFilter
+
+    def get_queryset(self):
+        """
+        Filter only current user's personal records
+        """
+        return PersonalRecord.objects.filter(user=self.request.user)
+
+
+class ProgressImportViewSet(WorkoutMixin):
+    """
+    Upload a csv file of workout history to import in the background and poll its progress
+    """
+    serializer_class = ProgressImportSerializer
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def get_queryset(self):
+        """
+        Filter only current user's imports
+        """
+        return ProgressImport.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        """
+        Queue the import once the upload is committed
+        """
+        super(ProgressImportViewSet, self).perform_create(serializer)
+        import_id = serializer.instance.id
+        transaction.on_commit(lambda: import_progress.delay(import_id))
+
+
+class SyncViewSet(LoggingMixin, viewsets.ViewSet):
+    """
+    Rows of a user's routines, progress, sets and metrics changed or deleted
+    since the sync token of the previous sync, for offline clients. A sync
+    returns at most page_size rows, when more are left has_more is set and
+    the token continues the same sync where the page ended
+    """
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    required_scopes = ['workouts', 'metrics']
+    token_param = 'token'
+    page_size = 1000
+    page_size_query_param = 'per_page'
+
+    # the next token starts a little before now so rows saved by transactions
+    # still running aren't missed, clients see those rows twice instead
+    overlap = datetime.timedelta(seconds=30)
+
+    # kinds of rows in the order they're synced, parents before their children
+    kinds = ('routines', 'progress', 'sets', 'metrics', 'deleted')
+
+    # deleted rows by their model label
+    deleted_names = (
+        ('workouts.routine', 'routines'),
+        ('workouts.progress', 'progress'),
+        ('workouts.set', 'sets'),
+        ('metrics.metric', 'metrics'),
+    )
+
+    def encode_token(self, since, resume=None):
+        """
+        Sync token of a point in time, or of a sync from a point in time (None for
+        a full sync) to be continued, resume is the start of the sync's last token,
+        the index of a kind of rows and the change time and id of its last row seen
+        """
+        token = {'t': since.isoformat() if since else None}
+        if resume is not None:
+            start, kind, cursor = resume
+            token.update({'s': start.isoformat(), 'k': kind, 'c': cursor and [cursor[0].isoformat(), cursor[1]]})
+        return force_text(urlsafe_b64encode(force_bytes(json.dumps(token))))
+
+    def decode_token(self, encoded):
+        """
+        Point in time of a sync token and where to continue its sync
+        """
+        def parse(value):
+            value = parse_datetime(value)
+            if value is None or timezone.is_naive(value):
+                raise ValueError
+            return value
+
+        try:
+            token = json.loads(force_text(urlsafe_b64decode(force_bytes(encoded))))
+            since = parse(token['t']) if token['t'] is not None else None
+            resume = None
+            if 's' in token:
+                kind, cursor = int(token['k']), token['c']
+                if not 0 <= kind < len(self.kinds):
+                    raise ValueError
+                resume = (parse(token['s']), kind, cursor and (parse(cursor[0]), int(cursor[1])))
+        except Exception:
+            raise ParseError('Invalid sync token')
+        return since, resume
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def changed(self, queryset, field, since, cursor, size):
+        """
+        Up to size rows changed since the previous sync after the cursor in the
+        order they were changed, and whether more are left
+        """
+        if since is not None:
+            queryset = queryset.filter(**{field + '__gt': since})
+        if cursor is not None:
+            date, pk = cursor
+            queryset = queryset.filter(Q(**{field + '__gt': date}) | Q(**{field: date, 'id__gt': pk}))
+        rows = list(queryset.order_by(field, 'id')[:size + 1])
+        return rows[:size], len(rows) > size
+
+    def list(self, request, *args, **kwargs):
+        now = timezone.now()
+        encoded = request.query_params.get(self.token_param)
+        since, resume = self.decode_token(encoded) if encoded else (None, None)
+
+        # deletions are only remembered for a while, older clients start over
+        full = since is None or since < now - TOMBSTONE_RETENTION
+        if full and since is not None:
+            since, resume = None, None
+
+        # the token of the last page starts from the first page of the sync
+        start, kind, cursor = resume or (now - self.overlap, 0, None)
+        size = self.get_page_size(request)
+
+        user = request.user
+        querysets = {
+            'routines': Routine.objects.filter(user=user).prefetch_related('exercises', 'days'),
+            'progress': Progress.objects.filter(user=user),
+            'sets': Set.objects.filter(user=user),
+            'metrics': Metric.objects.filter(user=user),
+            'deleted': Tombstone.objects.filter(user_id=user.pk, model__in=dict(self.deleted_names)),
+        }
+        rows = dict((name, []) for name in self.kinds)
+        has_more = False
+        while kind < len(self.kinds):
+            name = self.kinds[kind]
+            # a full sync has nothing deleted to report
+            if name != 'deleted' or not full:
+                field = 'date_deleted' if name == 'deleted' else 'date_updated'
+                rows[name], more = self.changed(querysets[name], field, since, cursor, size)
+                size -= len(rows[name])
+                if more:
+                    cursor = (getattr(rows[name][-1], field), rows[name][-1].id)
+                    has_more = True
+                    break
+            kind, cursor = kind + 1, None
+            if not size and kind < len(self.kinds):
+                has_more = True
+                break
+
+        names = dict(self.deleted_names)
+        deleted = dict((name, []) for _, name in self.deleted_names)
+        for tombstone in rows['deleted']:
+            deleted[names[tombstone.model]].append(tombstone.object_id)
+
+        return Response({
+            'token': self.encode_token(since, (start, kind, cursor)) if has_more else self.encode_token(start),
+            'full': full,
+            'has_more': has_more,
+            'routines': RoutineSerializer(rows['routines'], many=True).data,
+            'progress': ProgressSerializer(rows['progress'], many=True).data,
+            'sets': SetSerializer(rows['sets'], many=True).data,
+            'metrics': MetricSerializer(rows['metrics'], many=True).data,
+            'deleted': deleted,
+        })
@@ -17,7 +17,7 @@ env.password = "fuckdying1"
 
 
 def deploy(project_name=None):
-    sudo("apt-get install -y libmysqlclient-dev")
+    sudo("apt-get install -y libmysqlclient-dev memcached")
     with cd(code_path):
         run("rm -rf {0}_env".format(project_name))
         run("rm -rf {0}".format(project_name))
@@ -98,6 +98,7 @@ INSTALLED_APPS = [
     'sparkpost',
     'djcelery',
     'easy_thumbnails',
+    'apps.core',
     'apps.accounts',
     'apps.metrics',
     'apps.exercises',
@@ -154,6 +155,18 @@ DATABASES = {
 }
 
 
+# Cache shared by all web and worker processes, cached counts, lists and calendars
+# are invalidated by writes in any of them. Memcached at MEMCACHED_LOCATION
+# https://docs.djangoproject.com/en/1.9/topics/cache/#memcached
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': environ.get('MEMCACHED_LOCATION', '127.0.0.1:11211'),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -265,12 +278,15 @@ OAUTH2_PROVIDER = {
 # system and app logging formats
 # https://docs.python.org/2/library/logging.html#formatter-objects
 
-gymmate_log = '[%(stamp)s] %(user)s %(ip)s %(method)s %(path)s %(params)s %(status_code)d %(response_time)dms %(data)s'
+gymmate_log = ('[%(stamp)s] %(user)s %(ip)s %(method)s %(path)s %(params)s %(status_code)d %(response_time)dms '
+               '%(queries)dq %(db_time)dms %(data)s')
 django_log = '%(levelname)s %(asctime)s %(module)s %(process)d %(thread)d %(message)s'
 
 
 # logging setup for the codebase for errors and apps for requests
 # https://gist.github.com/JasonGiedymin/887364
+# request logs are queued and written by a background thread, when the queue
+# is full records are dropped and counted ('drop') or the request waits ('block')
 
 LOGGING = {
     'version': 1,
@@ -286,11 +302,14 @@ LOGGING = {
     'handlers': {
         'request': {
             'level': 'DEBUG',
-            'class': 'logging.handlers.TimedRotatingFileHandler',
+            'class': 'apps.core.handlers.QueuedTimedRotatingFileHandler',
             'filename': 'logs/gymmate.log',
             'when': 'midnight',
             'formatter': 'api',
             'backupCount': '7',
+            'queue_size': 10000,
+            'policy': 'drop',
+            'batch_size': 100,
         },
         'code': {
             'level': 'ERROR',
@@ -315,6 +334,29 @@ LOGGING = {
     },
 }
 
+# request log response body capture, bodies are only logged for a sample of
+# requests and for errors and slow requests, truncated to a maximum length.
+# Requests are profiled for staff sending the X-Profile header or by sampling
+
+API_LOGGING = {
+    'RESPONSE_SAMPLE_RATE': 0.01,
+    'RESPONSE_MAX_LENGTH': 2048,
+    'SLOW_REQUEST_MS': 1000,
+    'PROFILE_SAMPLE_RATE': 0,
+    'PROFILE_HEADER': 'HTTP_X_PROFILE',
+    'PROFILE_DIR': root('logs/profiles'),
+    'PROFILE_MAX_FILES': 50,
+    'PROFILE_TOP': 30,
+}
+
+# request counters and duration histograms, each worker writes its numbers to
+# the directory so the scrape endpoint can add them up
+
+API_METRICS = {
+    'DIRECTORY': root('logs/metrics'),
+    'FLUSH_INTERVAL': 5,
+}
+
 # default thumbdnail sizes for avatar and image negeration
 # https://github.com/SmileyChris/easy-thumbnails#using-a-predefined-alias
 
@@ -11,3 +11,13 @@ DATABASES = {
         'PORT': '',
     }
 }
+
+# The test runner is a single process, a local memory cache is seen by every request
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# The shared cache check doesn't apply to a single process
+SILENCED_SYSTEM_CHECKS = ['core.E001']
@@ -4,6 +4,9 @@ from .base import *
 # Disable all logging for testing
 LOGGING = {}
 
+# Keep request metrics in memory for testing
+API_METRICS = {}
+
 # Installed apps particualr to testing
 INSTALLED_APPS += (
     "kombu.transport.django",
@@ -11,4 +14,14 @@ INSTALLED_APPS += (
 
 # Broker settings for celery
 # https://django-celery.readthedocs.org/en/2.4/getting-started/first-steps-with-django.html
-BROKER_URL = "django://"
\ No newline at end of file
+BROKER_URL = "django://"
+
+# The test runner is a single process, a local memory cache is seen by every request
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# The shared cache check doesn't apply to a single process
+SILENCED_SYSTEM_CHECKS = ['core.E001']
@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.conf import settings
 
 from apps.core.routers import CustomRouter
+from apps.core.views import MetricsView
 from rest_framework_swagger import urls as documentaton
 from rest_framework_nested.routers import NestedSimpleRouter
 from oauth2_provider import urls as authentication
@@ -10,7 +11,10 @@ from oauth2_provider import urls as authentication
 from apps.accounts.views import UserViewSet, SignUpViewSet, ForgotPasswordViewSet, ActivateView, ResetView
 from apps.metrics.views import MetricViewSet, MetricTypeViewSet, MetricTypeGroupViewSet
 from apps.exercises.views import MuscleViewSet, ExerciseCategoryViewSet, EquipmentViewSet, ExerciseViewSet
-from apps.workouts.views import DayOfWeekViewSet, PublicRoutineViewSet, RoutineViewSet, ProrgressViewSet, SetViewSet
+from apps.workouts.views import (
+    DayOfWeekViewSet, PublicRoutineViewSet, RoutineViewSet, ProrgressViewSet, SetViewSet, PersonalRecordViewSet,
+    ProgressImportViewSet, SyncViewSet
+)
 
 
 router = CustomRouter()
@@ -23,9 +27,12 @@ router.register(r'metric-types', MetricTypeViewSet, 'metric-type')
 router.register(r'metric-type-groups', MetricTypeGroupViewSet, 'metric-group')
 router.register(r'muscles', MuscleViewSet, 'muscle')
 router.register(r'public-routines', PublicRoutineViewSet, 'public-routine')
+router.register(r'records', PersonalRecordViewSet, 'record')
 router.register(r'routines', RoutineViewSet, 'routine')
+router.register(r'sync', SyncViewSet, 'sync')
 router.register(r'users', UserViewSet, 'user')
 router.register(r'progress', ProrgressViewSet, 'progress')
+router.register(r'progress-imports', ProgressImportViewSet, 'progress-import')
 
 # nested router setup
 nested_router = NestedSimpleRouter(router, r'progress', lookup='progress')
@@ -37,9 +44,9 @@ router.register(r'forgot-password', ForgotPasswordViewSet, 'forgot-password')
 
 
 # Wire up our API using automatic URL routing.
+# nested routes share the namespace, a second include of it would be unreachable by name
 urlpatterns = [
-    url(r'^v1/', include(router.urls, namespace='v1')),
-    url(r'^v1/', include(nested_router.urls, namespace='v1')),
+    url(r'^v1/', include(router.urls + nested_router.urls, namespace='v1')),
 ]
 
 # Documentaton views for API
@@ -57,6 +64,11 @@ urlpatterns += [
     url(r'^o/', include(authentication, namespace='oauth2_provider')),
 ]
 
+# Monitoring scrape endpoint
+urlpatterns += [
+    url(r'^metrics/$', MetricsView.as_view(), name='metrics_view'),
+]
+
 # activate and reset password urls
 urlpatterns += [
     url(r'^a/(?P<uuid>[^/]+)/$', ActivateView, name='activate_view'),